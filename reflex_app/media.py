@@ -0,0 +1,137 @@
+"""
+Backend route that serves the converted media (MP4s, HLS packages, JPGs)
+with HTTP range support, so players can read the index first and seek
+without downloading whole files.
+"""
+
+import os
+from email.utils import formatdate
+from pathlib import Path
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+# Folder holding MP4_CONVERTED, HLS_PACKAGED, JPG_CONVERTED, ...
+MEDIA_ROOT = Path(os.environ.get("MEDIA_ROOT", "media")).resolve()
+
+# Written by video_conversion_tool/gallery_index.py
+GALLERY_INDEX = MEDIA_ROOT / ".gallery_index.sqlite"
+
+# Output folders of video_conversion_tool that are served; anything else
+# under MEDIA_ROOT (inputs, manifests, caches) is not
+SERVED_FOLDERS = {
+    "MP4_CONVERTED",
+    "HLS_PACKAGED",
+    "JPG_CONVERTED",
+    "THUMBNAILS",
+    "SPRITES",
+}
+
+CHUNK_SIZE = 1 << 16
+
+CONTENT_TYPES = {
+    ".mp4": "video/mp4",
+    ".m4s": "video/iso.segment",
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".jpg": "image/jpeg",
+    ".json": "application/json",
+}
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    (first, last) byte of a single "bytes=" range, or None to send the
+    whole file (multi-range and malformed headers may be ignored, RFC 9110).
+    Raises ValueError if the range lies outside the file.
+    """
+    unit, _, spec = header.partition("=")
+    first, _, last = spec.strip().partition("-")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    if not all(part.isdigit() for part in (first, last) if part) or not (first or last):
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        if int(last) == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("range starts past the end of the file")
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _read(file_path: Path, start: int, end: int):
+    with open(file_path, "rb") as fh:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = fh.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def is_served(relative: Path) -> bool:
+    """
+    Inside one of SERVED_FOLDERS, and no dot component: that covers the
+    databases and caches as well as packages still being built (.part)
+    """
+    parts = relative.parts
+    return (
+        len(parts) > 1
+        and parts[0] in SERVED_FOLDERS
+        and not any(part.startswith(".") for part in parts)
+    )
+
+
+def serve_media(path: str, request: Request) -> Response:
+    file_path = (MEDIA_ROOT / path).resolve()
+    # Checked before and after resolving, so neither ".." nor a symlink
+    # can reach outside the served folders
+    if (
+        not is_served(Path(path))
+        or not file_path.is_relative_to(MEDIA_ROOT)
+        or not is_served(file_path.relative_to(MEDIA_ROOT))
+        or not file_path.is_file()
+    ):
+        return Response(status_code=404)
+
+    stat = file_path.stat()
+    size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": "public, max-age=3600",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    status, start, end = 200, 0, size - 1
+    # A stale If-Range means the client's partial copy is outdated
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            status, (start, end) = 206, byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(end - start + 1)
+    media_type = CONTENT_TYPES.get(file_path.suffix.lower(), "application/octet-stream")
+    if request.method == "HEAD":
+        return Response(status_code=status, headers=headers, media_type=media_type)
+    return StreamingResponse(
+        _read(file_path, start, end),
+        status_code=status,
+        headers=headers,
+        media_type=media_type,
+    )
@@ -2,3 +2,5 @@ HOME_ROUTE = "/"
 ABOUT_US_ROUTE = "/about-us"
 CONTACT_US_ROUTE = "/contact-us"
 PRICING_ROUTE = "/pricing-new"
+MEDIA_ROUTE = "/media"
+GALLERY_ROUTE = "/gallery"
@@ -14,3 +14,6 @@ class NavState(rx.State):
 
     def to_pricing(self):
         return rx.redirect(routes.PRICING_ROUTE)
+
+    def to_gallery(self):
+        return rx.redirect(routes.GALLERY_ROUTE)
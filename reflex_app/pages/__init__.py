@@ -1,5 +1,12 @@
 from .about import about_page
 from .pricing import pricing_page
 from .contact import contact_us_page
+from .gallery import GalleryState, gallery_page
 
-__all__ = ["about_page", "pricing_page", "contact_us_page"]
+__all__ = [
+    "about_page",
+    "pricing_page",
+    "contact_us_page",
+    "gallery_page",
+    "GalleryState",
+]
@@ -0,0 +1,184 @@
+import sqlite3
+import urllib.parse
+from contextlib import closing
+
+import reflex as rx
+from rxconfig import config
+
+from .. import navigation
+from ..media import GALLERY_INDEX
+from ..ui.base import base_page
+
+PAGE_SIZE = 24
+KINDS = ["all", "image", "video"]
+
+
+class Asset(rx.Base):
+    """One gallery card; only what the card renders is sent to the browser"""
+
+    url: str
+    thumbnail: str
+    kind: str
+    label: str
+
+
+def media_url(path: str) -> str:
+    """URL of a file in the media route; names may hold spaces, # or ?"""
+    quoted = "/".join(urllib.parse.quote(part, safe="") for part in path.split("/"))
+    return f"{config.api_url}{navigation.routes.MEDIA_ROUTE}/{quoted}"
+
+
+def asset_label(width: int | None, height: int | None, duration: float | None):
+    parts = []
+    if width and height:
+        parts.append(f"{width}×{height}")
+    if duration:
+        minutes, seconds = divmod(int(duration), 60)
+        parts.append(f"{minutes}:{seconds:02d}")
+    return " · ".join(parts)
+
+
+class GalleryState(rx.State):
+    """
+    Holds one page of the index at a time; paging and filtering run as
+    LIMIT/OFFSET queries on the server, so state updates stay the size of
+    a page however many assets there are.
+    """
+
+    assets: list[Asset] = []
+    page: int = 0
+    total: int = 0
+    kind: str = "all"
+
+    @rx.var
+    def page_count(self) -> int:
+        return max(1, -(-self.total // PAGE_SIZE))
+
+    def _load(self):
+        where, params = (
+            ("", ()) if self.kind == "all" else ("WHERE kind = ?", (self.kind,))
+        )
+        try:
+            with closing(
+                sqlite3.connect(f"file:{GALLERY_INDEX}?mode=ro", uri=True)
+            ) as conn:
+                (self.total,) = conn.execute(
+                    f"SELECT COUNT(*) FROM assets {where}", params
+                ).fetchone()
+                rows = conn.execute(
+                    "SELECT path, kind, width, height, duration, thumbnail"
+                    f" FROM assets {where} ORDER BY mtime_ns DESC, path"
+                    " LIMIT ? OFFSET ?",
+                    (*params, PAGE_SIZE, self.page * PAGE_SIZE),
+                ).fetchall()
+        except sqlite3.Error:
+            self.total, rows = 0, []
+        self.assets = [
+            Asset(
+                url=media_url(path),
+                thumbnail=media_url(thumbnail),
+                kind=kind,
+                label=asset_label(width, height, duration),
+            )
+            for path, kind, width, height, duration, thumbnail in rows
+        ]
+
+    def on_load(self):
+        self.page = 0
+        self._load()
+
+    def set_kind(self, kind: str):
+        self.kind = kind
+        self.page = 0
+        self._load()
+
+    def next_page(self):
+        if self.page + 1 < self.page_count:
+            self.page += 1
+            self._load()
+
+    def prev_page(self):
+        if self.page > 0:
+            self.page -= 1
+            self._load()
+
+
+def asset_card(asset: Asset) -> rx.Component:
+    return rx.link(
+        rx.card(
+            rx.inset(
+                rx.image(
+                    src=asset.thumbnail,
+                    alt=asset.label,
+                    loading="lazy",
+                    decoding="async",
+                    width="100%",
+                    height="180px",
+                    object_fit="cover",
+                ),
+                side="top",
+                pb="current",
+            ),
+            rx.hstack(
+                rx.badge(asset.kind),
+                rx.text(asset.label, size="2"),
+                justify="between",
+                align_items="center",
+            ),
+        ),
+        href=asset.url,
+        is_external=True,
+    )
+
+
+def pagination() -> rx.Component:
+    return rx.hstack(
+        rx.button(
+            "Previous",
+            on_click=GalleryState.prev_page,
+            disabled=GalleryState.page == 0,
+        ),
+        rx.text("Page ", GalleryState.page + 1, " of ", GalleryState.page_count),
+        rx.button(
+            "Next",
+            on_click=GalleryState.next_page,
+            disabled=GalleryState.page + 1 >= GalleryState.page_count,
+        ),
+        spacing="4",
+        align_items="center",
+    )
+
+
+def gallery_page() -> rx.Component:
+    my_child = rx.vstack(
+        rx.hstack(
+            rx.heading("Gallery", size="9"),
+            rx.select(KINDS, value=GalleryState.kind, on_change=GalleryState.set_kind),
+            justify="between",
+            align_items="center",
+            width="100%",
+        ),
+        rx.cond(
+            GalleryState.total == 0,
+            rx.text(
+                "Nothing to show. Index the converted files with --gallery-index.",
+                size="5",
+            ),
+            rx.vstack(
+                rx.grid(
+                    rx.foreach(GalleryState.assets, asset_card),
+                    columns=rx.breakpoints(initial="2", sm="3", lg="4"),
+                    spacing="4",
+                    width="100%",
+                ),
+                pagination(),
+                align_items="center",
+                width="100%",
+            ),
+        ),
+        spacing="5",
+        min_height="85vh",
+        id="my-child",
+    )
+
+    return base_page(my_child)
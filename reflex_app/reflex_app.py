@@ -3,7 +3,7 @@
 import reflex as rx
 from rxconfig import config
 from .ui.base import base_page
-from . import pages, navigation
+from . import pages, navigation, media
 
 
 class State(rx.State):
@@ -49,3 +49,13 @@ app.add_page(index)
 app.add_page(pages.about_page, route=navigation.routes.ABOUT_US_ROUTE)
 app.add_page(pages.pricing_page, route=navigation.routes.PRICING_ROUTE)
 app.add_page(pages.contact_us_page, route=navigation.routes.CONTACT_US_ROUTE)
+app.add_page(
+    pages.gallery_page,
+    route=navigation.routes.GALLERY_ROUTE,
+    on_load=pages.GalleryState.on_load,
+)
+app.api.add_api_route(
+    f"{navigation.routes.MEDIA_ROUTE}/{{path:path}}",
+    media.serve_media,
+    methods=["GET", "HEAD"],
+)
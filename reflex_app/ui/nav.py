@@ -26,6 +26,7 @@ def navbar() -> rx.Component:
                 rx.hstack(
                     navbar_link("Home", navigation.routes.HOME_ROUTE),
                     navbar_link("About", navigation.routes.ABOUT_US_ROUTE),
+                    navbar_link("Gallery", navigation.routes.GALLERY_ROUTE),
                     navbar_link("Pricing", navigation.routes.PRICING_ROUTE),
                     navbar_link("Contact", navigation.routes.CONTACT_US_ROUTE),
                     spacing="5",
@@ -66,6 +67,9 @@ def navbar() -> rx.Component:
                         rx.menu.item(
                             "About", on_click=navigation.state.NavState.to_about_us
                         ),
+                        rx.menu.item(
+                            "Gallery", on_click=navigation.state.NavState.to_gallery
+                        ),
                         rx.menu.item(
                             "Pricing", on_click=navigation.state.NavState.to_pricing
                         ),
@@ -0,0 +1,269 @@
+import subprocess
+import threading
+from collections import deque
+from pathlib import Path
+
+from progress import run_ffmpeg
+
+try:
+    from PIL import Image, ImageSequence
+except ImportError:
+    Image = None
+
+ANIMATED_EXTENSIONS = {".gif", ".webp"}
+
+# Animations are resampled to the rate of their shortest frame, capped at
+# this, so short frames survive and held frames are simply repeated
+MAX_FPS = 30
+
+ANIMATION_ENCODER_ARGS = [
+    "-c:v",
+    "libx264",
+    "-crf",
+    "23",
+    "-preset",
+    "medium",
+    "-pix_fmt",
+    "yuv420p",
+    "-movflags",
+    "+faststart",
+    "-an",
+]
+
+# H.264 with yuv420p needs even dimensions; pad with the same white the
+# JPG path flattens transparency onto
+EVEN_PAD = "pad=ceil(iw/2)*2:ceil(ih/2)*2:color=white"
+
+
+def _skip_sub_blocks(fh):
+    while True:
+        size = fh.read(1)
+        if not size or size == b"\x00":
+            return
+        fh.seek(size[0], 1)
+
+
+def _gif_frames(fh, max_frames: int | None) -> tuple[int, float, int, int, float]:
+    """Walk the GIF block structure without decoding any image data"""
+    header = fh.read(13)
+    if header[:6] not in (b"GIF87a", b"GIF89a"):
+        return 0, 0.0, 0, 0, 0.0
+    width = int.from_bytes(header[6:8], "little")
+    height = int.from_bytes(header[8:10], "little")
+    if header[10] & 0x80:
+        fh.seek(3 << ((header[10] & 7) + 1), 1)
+
+    frames, duration, delay, shortest = 0, 0.0, 0, 0.0
+    while max_frames is None or frames < max_frames:
+        block = fh.read(1)
+        if block == b"\x21":
+            label = fh.read(1)
+            if label == b"\xf9":
+                data = fh.read(5)
+                delay = int.from_bytes(data[2:4], "little")
+            _skip_sub_blocks(fh)
+        elif block == b"\x2c":
+            descriptor = fh.read(9)
+            if len(descriptor) < 9:
+                break
+            if descriptor[8] & 0x80:
+                fh.seek(3 << ((descriptor[8] & 7) + 1), 1)
+            fh.seek(1, 1)
+            _skip_sub_blocks(fh)
+            # Browsers play delays under 2/100 s as 1/10 s
+            frames += 1
+            seconds = (delay if delay >= 2 else 10) / 100
+            duration += seconds
+            shortest = min(shortest or seconds, seconds)
+            delay = 0
+        else:
+            break
+    return frames, duration, width, height, shortest
+
+
+def _webp_frames(fh, max_frames: int | None) -> tuple[int, float, int, int, float]:
+    """Walk the RIFF chunks of a WebP, counting ANMF (animation frame) chunks"""
+    header = fh.read(12)
+    if header[:4] != b"RIFF" or header[8:12] != b"WEBP":
+        return 0, 0.0, 0, 0, 0.0
+
+    frames, duration, width, height, shortest = 0, 0.0, 0, 0, 0.0
+    while max_frames is None or frames < max_frames:
+        chunk = fh.read(8)
+        if len(chunk) < 8:
+            break
+        size = int.from_bytes(chunk[4:8], "little")
+        if chunk[:4] == b"VP8X":
+            data = fh.read(10)
+            if not data[0] & 0x02:
+                return 1, 0.0, 0, 0, 0.0
+            width = 1 + int.from_bytes(data[4:7], "little")
+            height = 1 + int.from_bytes(data[7:10], "little")
+            size -= 10
+        elif chunk[:4] == b"ANMF":
+            data = fh.read(16)
+            frames += 1
+            seconds = int.from_bytes(data[12:15], "little") / 1000
+            duration += seconds
+            if seconds:
+                shortest = min(shortest or seconds, seconds)
+            size -= 16
+        elif chunk[:4] in (b"VP8 ", b"VP8L"):
+            return 1, 0.0, 0, 0, 0.0
+        fh.seek(size + (size & 1), 1)
+    return frames, duration, width, height, shortest
+
+
+def animation_info(file_path: Path, max_frames: int | None = None) -> dict | None:
+    """
+    Frame count, duration (seconds), size and output frame rate of an
+    animated GIF/WebP, read from the container structure only; None for
+    still images. The rate is that of the shortest frame, capped at
+    MAX_FPS: an average would drop short frames of animations that also
+    hold some frames for long. max_frames stops the walk early when only
+    the classification is needed.
+    """
+    suffix = file_path.suffix.lower()
+    if suffix not in ANIMATED_EXTENSIONS:
+        return None
+    parse = _gif_frames if suffix == ".gif" else _webp_frames
+    try:
+        with open(file_path, "rb") as fh:
+            frames, duration, width, height, shortest = parse(fh, max_frames)
+    except (OSError, IndexError):
+        return None
+    if frames < 2:
+        return None
+    return {
+        "frames": frames,
+        "duration": duration,
+        "width": width,
+        "height": height,
+        "fps": min(MAX_FPS, max(1.0, 1 / shortest)) if shortest else 10.0,
+    }
+
+
+def is_animated(file_path: Path) -> bool:
+    return animation_info(file_path, max_frames=2) is not None
+
+
+def pipes_webp(file_path: Path) -> bool:
+    """Whether the animation is decoded by Pillow and piped (see pipe_webp)"""
+    return file_path.suffix.lower() == ".webp" and Image is not None
+
+
+def pipe_webp(file_path: Path, cmd: list[str], fps: float):
+    """
+    Decode an animated WebP with Pillow (older ffmpeg builds can't) and
+    feed ffmpeg constant-rate RGB frames, repeating each for its duration
+    """
+    proc = subprocess.Popen(
+        cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    tail = deque(maxlen=50)
+    reader = threading.Thread(target=lambda: tail.extend(proc.stderr), daemon=True)
+    reader.start()
+
+    try:
+        with Image.open(file_path) as image:
+            shown = 0.0
+            emitted = 0
+            for frame in ImageSequence.Iterator(image):
+                rgba = frame.convert("RGBA")
+                flat = Image.new("RGB", rgba.size, (255, 255, 255))
+                flat.paste(rgba, mask=rgba.getchannel("A"))
+                data = flat.tobytes()
+                shown += frame.info.get("duration", 100) / 1000
+                while emitted < max(1, round(shown * fps)):
+                    proc.stdin.write(data)
+                    emitted += 1
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    finally:
+        returncode = proc.wait()
+        reader.join()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=b"".join(tail))
+
+
+def animation_command(
+    file_path: Path, output_path: Path, info: dict, threads: int | None = None
+) -> list[str]:
+    """
+    ffmpeg command for convert_animation. For WebPs that pipes_webp, it
+    reads raw frames from stdin and must be run through pipe_webp.
+    """
+    fps = f"{info['fps']:.3f}"
+    threads_args = ["-threads", str(threads)] if threads else []
+    size = f"{info['width']}x{info['height']}"
+    if pipes_webp(file_path):
+        return [
+            "ffmpeg",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgb24",
+            "-s",
+            size,
+            "-framerate",
+            fps,
+            "-i",
+            "-",
+            "-vf",
+            EVEN_PAD,
+            *ANIMATION_ENCODER_ARGS,
+            *threads_args,
+            "-y",
+            str(output_path),
+        ]
+    # Transparent GIF pixels would otherwise turn black in yuv420p. The
+    # background runs at the GIF's rate, or overlay would resample to 25 fps
+    graph = (
+        f"color=white:s={size}:r={fps}[bg];"
+        f"[bg][0:v]overlay=shortest=1,fps={fps},{EVEN_PAD}"
+    )
+    return [
+        "ffmpeg",
+        "-i",
+        str(file_path),
+        "-filter_complex",
+        graph,
+        *ANIMATION_ENCODER_ARGS,
+        *threads_args,
+        "-y",
+        str(output_path),
+    ]
+
+
+def convert_animation(
+    file_path: Path,
+    output_folder: Path,
+    threads: int | None = None,
+    info: dict | None = None,
+    progress=None,
+    keep_originals: bool = False,
+) -> tuple[bool, str]:
+    """
+    Convert an animated GIF/WebP to a silent H.264 MP4 at the rate of its
+    shortest frame (capped at MAX_FPS), flattened onto white and padded to
+    even dimensions. info is the animation_info result, read here if not
+    given.
+    """
+    try:
+        info = info or animation_info(file_path)
+        if info is None:
+            return False, f"{file_path.name} is not animated"
+        output_folder.mkdir(exist_ok=True)
+        output_path = output_folder / f"{file_path.stem}.mp4"
+        cmd = animation_command(file_path, output_path, info, threads)
+        if pipes_webp(file_path):
+            pipe_webp(file_path, cmd, info["fps"])
+        else:
+            run_ffmpeg(cmd, on_progress=progress)
+
+        if not keep_originals:
+            file_path.unlink()
+        return True, f"Animated ({info['frames']} frames): {file_path.name}"
+    except Exception as e:
+        return False, f"Error processing {file_path.name}: {str(e)}"
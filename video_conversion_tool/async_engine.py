@@ -0,0 +1,403 @@
+"""
+asyncio conversion engine.
+
+Every ffmpeg runs as an asyncio subprocess instead of blocking a pool
+thread, so the number of queued jobs costs nothing but the scan generator:
+at most `concurrency` jobs exist at any time. stderr is streamed into a
+small ring buffer rather than captured whole. Cancelling (Ctrl-C) kills
+the running ffmpeg processes and removes their partial outputs; their
+manifest entries stay "running", so the next run picks them up again.
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+from collections import deque
+from pathlib import Path
+
+from convert_both import (
+    IMAGE_ENCODER_ARGS,
+    VIDEO_ENCODER_ARGS,
+    image_command,
+    manifest_settings,
+    scan_media,
+    video_command,
+)
+from animation import (
+    ANIMATION_ENCODER_ARGS,
+    animation_command,
+    animation_info,
+    pipe_webp,
+    pipes_webp,
+)
+from fastpath import place_file
+from manifest import ConversionManifest
+from probe_index import index_for_folder
+from profiles import PROFILES
+from progress import ProgressBlocks, ProgressTracker, progress_command
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+async def run_ffmpeg_async(
+    cmd: list[str],
+    on_progress=None,
+    stderr_lines: int = 50,
+    outputs: list[Path] = (),
+) -> dict:
+    """
+    asyncio counterpart of progress.run_ffmpeg. outputs are the files the
+    command writes; they are removed if ffmpeg fails or the task is
+    cancelled (which also kills ffmpeg).
+    """
+    cmd = progress_command(cmd)
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    tail = deque(maxlen=stderr_lines)
+
+    async def read_stderr():
+        async for line in proc.stderr:
+            tail.append(line.decode(errors="replace"))
+
+    stderr_task = asyncio.create_task(read_stderr())
+    blocks = ProgressBlocks()
+    try:
+        async for line in proc.stdout:
+            metrics = blocks.feed(line.decode(errors="replace"))
+            if metrics is not None and on_progress is not None:
+                on_progress(metrics)
+        await stderr_task
+        returncode = await proc.wait()
+    except asyncio.CancelledError:
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+        stderr_task.cancel()
+        _remove(outputs)
+        raise
+
+    if returncode != 0:
+        _remove(outputs)
+        raise subprocess.CalledProcessError(
+            returncode, cmd, stderr="".join(tail).encode()
+        )
+    return blocks.last
+
+
+class AsyncEngine:
+    """
+    Runs job coroutines with at most `concurrency` in flight. Jobs are
+    pulled from an iterable only when a slot frees up, so a generator of
+    100k jobs never turns into 100k tasks.
+    """
+
+    def __init__(self, concurrency: int | None = None):
+        self.concurrency = concurrency or os.cpu_count() or 1
+
+    async def run(self, jobs) -> list[BaseException]:
+        """
+        Run every job (a zero-argument coroutine function) and wait. jobs is
+        advanced in a worker thread, so a generator that blocks (scandir,
+        manifest lookups) doesn't stall the running jobs. A job that raises
+        doesn't stop the others; the exceptions are returned.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        errors = []
+        jobs = iter(jobs)
+
+        def done(task):
+            tasks.discard(task)
+            semaphore.release()
+            if not task.cancelled() and task.exception() is not None:
+                errors.append(task.exception())
+
+        try:
+            while True:
+                await semaphore.acquire()
+                job = await asyncio.to_thread(next, jobs, None)
+                if job is None:
+                    semaphore.release()
+                    break
+                task = asyncio.create_task(job())
+                tasks.add(task)
+                task.add_done_callback(done)
+            if tasks:
+                await asyncio.wait(tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return errors
+
+
+async def run_tracked_async(
+    convert, file_path: Path, output_path: Path, settings, manifest
+) -> tuple[bool, str]:
+    """
+    run_tracked for coroutines; failed jobs are marked failed, cancelled
+    ones stay running in the manifest. Manifest writes (which fingerprint
+    the input) run in a worker thread.
+    """
+    if manifest is not None:
+        await asyncio.to_thread(manifest.mark_started, file_path, output_path, settings)
+    try:
+        msg = await convert()
+        success = True
+    except Exception as e:
+        success, msg = False, f"Error processing {file_path.name}: {str(e)}"
+
+    if manifest is not None:
+        if success:
+            await asyncio.to_thread(manifest.mark_done, file_path, output_path)
+        else:
+            await asyncio.to_thread(manifest.mark_failed, file_path, msg)
+    return success, msg
+
+
+async def _convert_media(
+    input_path: Path,
+    media_type: str,
+    concurrency: int | None,
+    threads: int | None,
+    manifest: ConversionManifest | None,
+    video_encoder_args: list[str],
+    profiles: list[str],
+    keep_originals: bool,
+):
+    img_output = input_path / "JPG_CONVERTED"
+    vid_output = input_path / "MP4_CONVERTED"
+    settings_by_type = manifest_settings(video_encoder_args, profiles)
+    video_settings = settings_by_type["video"]
+    index = index_for_folder(str(input_path))
+    tracker = ProgressTracker()
+    counts = {"done": 0, "failed": 0}
+
+    def finish(success, msg):
+        counts["done" if success else "failed"] += 1
+        tracker.write(msg if success else f"Error: {msg}")
+
+    def image_job(f):
+        async def convert():
+            output_path = img_output / f"{f.stem}.jpg"
+            # The JPEG check reads the file, so it runs off the event loop too
+            cmd = await asyncio.to_thread(image_command, f, img_output, threads)
+            if cmd is None:
+                method = await asyncio.to_thread(
+                    place_file, f, output_path, keep_originals
+                )
+                return f"Copied JPG ({method}): {f.name}"
+            await run_ffmpeg_async(cmd, outputs=[output_path])
+            if f.suffix.lower() in [".jpg", ".jpeg"]:
+                return f"{f.name} (failed the JPEG check; source kept)"
+            if not keep_originals:
+                await asyncio.to_thread(f.unlink)
+            return f.name
+
+        async def job():
+            size = (await asyncio.to_thread(f.stat)).st_size
+            tracker.add("image", size)
+            output_path = img_output / f"{f.stem}.jpg"
+            finish(
+                *await run_tracked_async(
+                    convert, f, output_path, IMAGE_ENCODER_ARGS, manifest
+                )
+            )
+            tracker.advance("image", size)
+
+        return job
+
+    def video_job(f):
+        async def job():
+            # Saved once at the end: rewriting the cache per job is O(n^2)
+            info = await asyncio.to_thread(index.get, f, save=False)
+            duration = (info or {}).get("duration") or 0.0
+            tracker.add("video", duration)
+            callback, done = tracker.video_callback(duration, {})
+
+            async def convert():
+                label, cmd, outputs = await asyncio.to_thread(
+                    video_command,
+                    f,
+                    vid_output,
+                    threads,
+                    info,
+                    video_encoder_args,
+                    profiles,
+                )
+                if cmd is not None:
+                    try:
+                        await run_ffmpeg_async(
+                            cmd, on_progress=callback, outputs=outputs
+                        )
+                    except subprocess.CalledProcessError:
+                        if not label.startswith("Remuxed"):
+                            raise
+                        # Streams the MP4 muxer rejects as-is; encode them instead
+                        _, cmd, outputs = await asyncio.to_thread(
+                            video_command,
+                            f,
+                            vid_output,
+                            threads,
+                            info,
+                            video_encoder_args,
+                            profiles,
+                            remux=False,
+                        )
+                        await run_ffmpeg_async(
+                            cmd, on_progress=callback, outputs=outputs
+                        )
+                        label = "Transcoded (remux failed)"
+                if label == "Copied MP4":
+                    output_path = vid_output / f"{f.stem}.mp4"
+                    method = await asyncio.to_thread(
+                        place_file, f, output_path, keep_originals
+                    )
+                    label = f"{label} ({method})"
+                elif not keep_originals:
+                    await asyncio.to_thread(f.unlink)
+                return f"{label}: {f.name}"
+
+            output_path = vid_output / f"{f.stem}.mp4"
+            finish(
+                *await run_tracked_async(
+                    convert, f, output_path, video_settings, manifest
+                )
+            )
+            done()
+
+        return job
+
+    def animation_job(f):
+        async def job():
+            info = await asyncio.to_thread(animation_info, f)
+            duration = (info or {}).get("duration") or 0.0
+            tracker.add("video", duration)
+            callback, done = tracker.video_callback(duration, {})
+            output_path = vid_output / f"{f.stem}.mp4"
+
+            async def convert():
+                if info is None:
+                    raise ValueError(f"{f.name} is not animated")
+                await asyncio.to_thread(vid_output.mkdir, exist_ok=True)
+                cmd = animation_command(f, output_path, info, threads)
+                if pipes_webp(f):
+                    # Pillow feeds ffmpeg's stdin frame by frame, in a thread
+                    await asyncio.to_thread(pipe_webp, f, cmd, info["fps"])
+                else:
+                    await run_ffmpeg_async(
+                        cmd, on_progress=callback, outputs=[output_path]
+                    )
+                if not keep_originals:
+                    await asyncio.to_thread(f.unlink)
+                return f"Animated ({info['frames']} frames): {f.name}"
+
+            finish(
+                *await run_tracked_async(
+                    convert, f, output_path, ANIMATION_ENCODER_ARGS, manifest
+                )
+            )
+            done()
+
+        return job
+
+    job_by_type = {"image": image_job, "video": video_job, "animation": animation_job}
+
+    # Advanced in a worker thread by AsyncEngine.run, so the walk and the
+    # manifest lookups never block the event loop
+    def jobs():
+        for f, type_ in scan_media(input_path, media_type, detect_animation=True):
+            settings = settings_by_type[type_]
+            if manifest is not None and manifest.should_skip(f, settings):
+                continue
+            yield job_by_type[type_](f)
+
+    try:
+        # Jobs report their own failures; these escaped a job altogether
+        for error in await AsyncEngine(concurrency).run(jobs()):
+            finish(False, f"Unexpected error: {error!r}")
+    finally:
+        tracker.close()
+        index.save()
+    return counts
+
+
+def convert_media_async(
+    input_folder: str,
+    media_type: str = "both",
+    concurrency: int | None = None,
+    threads: int | None = 1,
+    incremental: bool = True,
+    hash_content: bool = False,
+    video_encoder_args: list[str] | None = None,
+    profiles: list[str] | None = None,
+    keep_originals: bool = False,
+):
+    """
+    convert_media on the asyncio engine: up to `concurrency` ffmpeg
+    processes (default: one per core) with `threads` threads each. Jobs
+    start in scan order. keep_originals leaves every input in place.
+    Returns the number of converted and failed files.
+    """
+    input_path = Path(input_folder)
+    if media_type in ["both", "images"]:
+        (input_path / "JPG_CONVERTED").mkdir(exist_ok=True)
+    if media_type in ["both", "videos"]:
+        (input_path / "MP4_CONVERTED").mkdir(exist_ok=True)
+        for name in profiles or []:
+            (input_path / PROFILES[name]["folder"]).mkdir(exist_ok=True)
+
+    manifest = (
+        ConversionManifest.for_folder(input_path, hash_content=hash_content)
+        if incremental
+        else None
+    )
+    if manifest is not None:
+        # They are not skipped, so this run converts them again
+        retry = [path for path in manifest.unfinished() if Path(path).exists()]
+        if retry:
+            print(f"Retrying {len(retry)} interrupted or failed jobs from a past run")
+    try:
+        counts = asyncio.run(
+            _convert_media(
+                input_path,
+                media_type,
+                concurrency,
+                threads,
+                manifest,
+                video_encoder_args or VIDEO_ENCODER_ARGS,
+                profiles or [],
+                keep_originals,
+            )
+        )
+    except KeyboardInterrupt:
+        print("Cancelled; running conversions were stopped and cleaned up")
+        return None
+    finally:
+        if manifest is not None:
+            manifest.close()
+
+    if not counts["done"] and not counts["failed"]:
+        print("No new media files to convert")
+    else:
+        print(f"Converted {counts['done']} files, {counts['failed']} failed")
+    return counts
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(f"Usage: python {sys.argv[0]} <folder>")
+    convert_media_async(sys.argv[1])
@@ -0,0 +1,253 @@
+"""
+Offline benchmark for the conversion pipeline.
+
+A synthetic corpus is generated with ffmpeg's lavfi sources (testsrc2 for
+pictures, sine for audio), so runs are reproducible on any machine. Each
+benchmark case converts a fresh copy of the corpus with convert_media in a
+child process, and the results are appended to a JSON-lines file so runs
+can be compared over time.
+
+Usage:
+    python benchmark.py [--quick] [--results benchmark_results.jsonl]
+    python benchmark.py --compare benchmark_results.jsonl
+"""
+
+import argparse
+import contextlib
+import hashlib
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# (extension, width, height, count)
+IMAGE_SPECS = [
+    ("png", 640, 480, 24),
+    ("png", 1920, 1080, 8),
+    ("webp", 1280, 720, 8),
+    ("bmp", 320, 240, 8),
+]
+
+# (extension, video codec, audio codec, width, height, seconds, count)
+# mpeg4/avi is transcoded, h264+aac/mkv is remuxed and h264+pcm/mov only
+# has its audio re-encoded, so all three video paths are exercised
+VIDEO_SPECS = [
+    ("avi", "mpeg4", "pcm_s16le", 640, 360, 8, 3),
+    ("mkv", "libx264", "aac", 1280, 720, 8, 2),
+    ("mov", "libx264", "pcm_s16le", 640, 360, 8, 2),
+]
+
+DEFAULT_MATRIX = {
+    "cpu_budget": sorted({2, 4, os.cpu_count() or 1}),
+    "image_backend": ["ffmpeg", "pillow"],
+    "preset": ["veryfast", "medium"],
+}
+
+QUICK_MATRIX = {
+    "cpu_budget": [os.cpu_count() or 1],
+    "image_backend": ["ffmpeg", "pillow"],
+    "preset": ["veryfast"],
+}
+
+
+def corpus_key() -> str:
+    blob = json.dumps([IMAGE_SPECS, VIDEO_SPECS])
+    return hashlib.sha1(blob.encode()).hexdigest()[:12]
+
+
+def _ffmpeg(*args):
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", *args], capture_output=True, check=True
+    )
+
+
+def generate_corpus(corpus_dir: Path) -> Path:
+    """Create the synthetic corpus once; later calls reuse it"""
+    done_marker = corpus_dir / ".complete"
+    if done_marker.exists():
+        return corpus_dir
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+
+    for ext, width, height, count in IMAGE_SPECS:
+        for i in range(count):
+            _ffmpeg(
+                "-f",
+                "lavfi",
+                "-i",
+                f"testsrc2=size={width}x{height}:rate=25",
+                "-vf",
+                f"select=eq(n\\,{i})",
+                "-frames:v",
+                "1",
+                str(corpus_dir / f"img_{width}x{height}_{i:03d}.{ext}"),
+            )
+
+    for ext, vcodec, acodec, width, height, seconds, count in VIDEO_SPECS:
+        for i in range(count):
+            _ffmpeg(
+                "-f",
+                "lavfi",
+                "-i",
+                f"testsrc2=size={width}x{height}:rate=30:duration={seconds}",
+                "-f",
+                "lavfi",
+                "-i",
+                f"sine=frequency={440 + 110 * i}:sample_rate=48000:duration={seconds}",
+                "-c:v",
+                vcodec,
+                "-pix_fmt",
+                "yuv420p",
+                "-c:a",
+                acodec,
+                "-shortest",
+                str(corpus_dir / f"vid_{vcodec}_{width}x{height}_{i:03d}.{ext}"),
+            )
+
+    done_marker.touch()
+    return corpus_dir
+
+
+def corpus_totals() -> dict:
+    return {
+        "files": sum(s[-1] for s in IMAGE_SPECS) + sum(s[-1] for s in VIDEO_SPECS),
+        "media_seconds": sum(s[5] * s[6] for s in VIDEO_SPECS),
+    }
+
+
+def run_case(corpus_dir: Path, config: dict) -> dict:
+    """Convert a copy of the corpus with one configuration (runs in a child)"""
+    from convert_both import VIDEO_ENCODER_ARGS, convert_media
+
+    encoder_args = list(VIDEO_ENCODER_ARGS)
+    encoder_args[encoder_args.index("-preset") + 1] = config["preset"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp) / "corpus"
+        shutil.copytree(corpus_dir, work_dir)
+        (work_dir / ".complete").unlink()
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+            devnull
+        ), contextlib.redirect_stderr(devnull):
+            start = time.perf_counter()
+            convert_media(
+                str(work_dir),
+                cpu_budget=config["cpu_budget"],
+                incremental=False,
+                image_backend=config["image_backend"],
+                video_encoder_args=encoder_args,
+            )
+            elapsed = time.perf_counter() - start
+
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak_rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    totals = corpus_totals()
+    return {
+        "seconds": elapsed,
+        "files_per_s": totals["files"] / elapsed,
+        "media_seconds_per_s": totals["media_seconds"] / elapsed,
+        "peak_rss_mb": peak_rss * scale / 2**20,
+    }
+
+
+def run_matrix(matrix: dict, results_path: Path, corpus_dir: Path):
+    import image_engine
+
+    keys = list(matrix)
+    for values in itertools.product(*(matrix[k] for k in keys)):
+        config = dict(zip(keys, values))
+        if config["image_backend"] == "pillow" and not image_engine.PILLOW_AVAILABLE:
+            continue
+
+        # A fresh interpreter per case keeps peak RSS and caches independent
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--run-case",
+                json.dumps(config),
+                "--corpus",
+                str(corpus_dir),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout
+        metrics = json.loads(output.strip().splitlines()[-1])
+
+        record = {
+            "timestamp": time.time(),
+            "host": platform.node(),
+            "cpu_count": os.cpu_count(),
+            "corpus": corpus_key(),
+            "config": config,
+            **metrics,
+        }
+        with open(results_path, "a") as fh:
+            fh.write(json.dumps(record) + "\n")
+        print(
+            f"{config}: {metrics['files_per_s']:.2f} files/s, "
+            f"{metrics['media_seconds_per_s']:.2f} media-s/s, "
+            f"peak RSS {metrics['peak_rss_mb']:.0f} MB"
+        )
+
+
+def compare(results_path: Path):
+    """Compare the latest run of each configuration with the one before it"""
+    runs = {}
+    with open(results_path) as fh:
+        for line in fh:
+            record = json.loads(line)
+            key = (record["host"], record["corpus"], json.dumps(record["config"]))
+            runs.setdefault(key, []).append(record)
+
+    for (host, _, config), records in sorted(runs.items()):
+        latest = records[-1]
+        line = f"{host} {config}: {latest['files_per_s']:.2f} files/s"
+        if len(records) > 1:
+            previous = records[-2]["files_per_s"]
+            change = (latest["files_per_s"] - previous) / previous * 100
+            line += f" ({change:+.1f}% vs previous)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--quick", action="store_true", help="small matrix")
+    parser.add_argument("--results", default="benchmark_results.jsonl")
+    parser.add_argument("--compare", metavar="RESULTS")
+    parser.add_argument(
+        "--corpus",
+        default=str(Path(tempfile.gettempdir()) / f"conversion_bench_{corpus_key()}"),
+    )
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(Path(args.compare))
+    elif args.run_case:
+        print(json.dumps(run_case(Path(args.corpus), json.loads(args.run_case))))
+    else:
+        corpus_dir = generate_corpus(Path(args.corpus))
+        run_matrix(
+            QUICK_MATRIX if args.quick else DEFAULT_MATRIX,
+            Path(args.results),
+            corpus_dir,
+        )
+        compare(Path(args.results))
+
+
+if __name__ == "__main__":
+    main()
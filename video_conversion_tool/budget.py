@@ -0,0 +1,171 @@
+import tempfile
+from pathlib import Path
+
+from progress import run_ffmpeg
+
+# Share of the budget kept back for the MP4 container and rate-control error
+CONTAINER_MARGIN = 0.03
+
+# Below this many bits per pixel per frame x264 output turns to mush, so
+# the resolution (then the frame rate) is lowered until it's reached
+MIN_BITS_PER_PIXEL = 0.05
+HEIGHT_LADDER = [2160, 1440, 1080, 720, 540, 480, 360, 240]
+FPS_LADDER = [30, 24]
+
+AUDIO_KBPS = 128
+MIN_AUDIO_KBPS = 48
+MIN_VIDEO_KBPS = 64
+
+
+def display_size(info: dict) -> tuple[int, int]:
+    """Width and height after autorotation"""
+    width, height = info["width"], info["height"]
+    if info.get("rotation") in (90, 270):
+        width, height = height, width
+    return width, height
+
+
+def plan_budget(
+    info: dict,
+    max_bytes: int,
+    max_height: int | None = None,
+    max_fps: float | None = None,
+    audio_kbps: int = AUDIO_KBPS,
+) -> dict:
+    """
+    Bitrates, output height and frame rate that fit max_bytes for the
+    probed duration. max_height/max_fps are hard caps; below them the size
+    is stepped down until the bitrate is enough for the picture.
+    """
+    duration = info.get("duration")
+    if not duration or not info.get("width"):
+        raise ValueError("budget mode needs the duration and size from a probe")
+
+    total_kbps = max_bytes * 8 / 1000 / duration * (1 - CONTAINER_MARGIN)
+    if info.get("audio_codec") is None:
+        audio_kbps = 0
+    elif total_kbps - audio_kbps < MIN_VIDEO_KBPS:
+        audio_kbps = MIN_AUDIO_KBPS
+    video_kbps = int(total_kbps - audio_kbps)
+    if video_kbps < MIN_VIDEO_KBPS:
+        raise ValueError(
+            f"{max_bytes / 2**20:.1f} MiB is too small for {duration:.0f}s of video"
+        )
+
+    source_width, source_height = display_size(info)
+    source_fps = info.get("fps") or 30.0
+    height = min(source_height, max_height or source_height)
+    fps = min(source_fps, max_fps or source_fps)
+
+    def bits_per_pixel(h, f):
+        pixels = h * h * source_width / source_height
+        return video_kbps * 1000 / (pixels * f)
+
+    for rung in HEIGHT_LADDER:
+        if bits_per_pixel(height, fps) >= MIN_BITS_PER_PIXEL:
+            break
+        height = min(height, rung)
+    for rung in FPS_LADDER:
+        if bits_per_pixel(height, fps) >= MIN_BITS_PER_PIXEL:
+            break
+        fps = min(fps, rung)
+
+    return {
+        "video_kbps": video_kbps,
+        "audio_kbps": audio_kbps,
+        "height": height if height < source_height else None,
+        "fps": fps if fps < source_fps else None,
+    }
+
+
+def encode_to_budget(
+    file_path: Path,
+    output_path: Path,
+    max_bytes: int,
+    info: dict,
+    threads: int | None = None,
+    progress=None,
+    max_height: int | None = None,
+    max_fps: float | None = None,
+    preset: str = "medium",
+) -> str:
+    """
+    Two-pass x264 encode at the bitrate that fills max_bytes. The first
+    pass only writes rate-control stats, which the second pass reuses to
+    spread the bits. Returns a report of the achieved size vs the budget.
+    """
+    plan = plan_budget(info, max_bytes, max_height, max_fps)
+    duration = info["duration"]
+
+    filters = []
+    if plan["height"]:
+        filters.append(f"scale=-2:{plan['height']}")
+    if plan["fps"]:
+        filters.append(f"fps={plan['fps']}")
+    filter_args = ["-vf", ",".join(filters)] if filters else []
+    threads_args = ["-threads", str(threads)] if threads else []
+    video_args = [
+        "-c:v",
+        "libx264",
+        "-preset",
+        preset,
+        "-b:v",
+        f"{plan['video_kbps']}k",
+        "-pix_fmt",
+        "yuv420p",
+    ]
+
+    # Each pass is half of the work on the progress bar
+    def scaled(offset):
+        def callback(metrics):
+            if progress is not None and "out_time" in metrics:
+                progress({**metrics, "out_time": offset + metrics["out_time"] / 2})
+
+        return callback
+
+    with tempfile.TemporaryDirectory() as tmp:
+        passlog = str(Path(tmp) / "x264")
+        common = ["ffmpeg", "-y", "-i", str(file_path), *filter_args, *video_args]
+        first = [
+            *common,
+            "-pass",
+            "1",
+            "-passlogfile",
+            passlog,
+            *threads_args,
+            "-an",
+            "-f",
+            "null",
+            "-",
+        ]
+        run_ffmpeg(first, on_progress=scaled(0.0))
+
+        audio_args = (
+            ["-c:a", "aac", "-b:a", f"{plan['audio_kbps']}k"]
+            if plan["audio_kbps"]
+            else ["-an"]
+        )
+        second = [
+            *common,
+            "-pass",
+            "2",
+            "-passlogfile",
+            passlog,
+            *threads_args,
+            *audio_args,
+            "-movflags",
+            "+faststart",
+            str(output_path),
+        ]
+        run_ffmpeg(second, on_progress=scaled(duration / 2))
+
+    size = output_path.stat().st_size
+    report = (
+        f"{size / 2**20:.1f} of {max_bytes / 2**20:.1f} MiB "
+        f"({size / max_bytes:.0%}) at {plan['video_kbps']} kb/s"
+    )
+    if plan["height"]:
+        report += f", {plan['height']}p"
+    if plan["fps"]:
+        report += f", {plan['fps']} fps"
+    return report
@@ -0,0 +1,195 @@
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+from convert_both import IMAGE_ENCODER_ARGS, VIDEO_ENCODER_ARGS, scan_media
+from image_engine import PILLOW_AVAILABLE, convert_batch
+
+TUNING_PATH = Path.home() / ".config" / "video_conversion_tool" / "tuning.json"
+
+# Seconds of each sample video encoded per calibration run
+SAMPLE_SECONDS = 4
+
+
+def load_tuning(host: str | None = None) -> dict | None:
+    """Stored calibration result for this host, if any"""
+    try:
+        tuning = json.loads(TUNING_PATH.read_text())
+    except (OSError, ValueError):
+        return None
+    return tuning.get(host or platform.node())
+
+
+def save_tuning(result: dict, host: str | None = None):
+    """
+    Merge result into this host's stored entry, so a calibration run keeps
+    the planner's measured throughput and vice versa
+    """
+    try:
+        tuning = json.loads(TUNING_PATH.read_text())
+    except (OSError, ValueError):
+        tuning = {}
+    host = host or platform.node()
+    tuning[host] = {**tuning.get(host, {}), **result}
+    TUNING_PATH.parent.mkdir(parents=True, exist_ok=True)
+    TUNING_PATH.write_text(json.dumps(tuning, indent=2))
+
+
+def _timed_parallel(cmds: list[list[str]], workers: int) -> float:
+    """
+    Wall time to run every command with the given concurrency; raises
+    CalledProcessError if one fails, since a failed run would look fast
+    """
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        list(
+            executor.map(
+                lambda cmd: subprocess.run(cmd, capture_output=True, check=True),
+                cmds,
+            )
+        )
+    return time.perf_counter() - start
+
+
+def _timed_pillow(jobs: list[tuple[str, str]], workers: int) -> float:
+    """
+    Wall time to convert (source, output) pairs in as many worker processes
+    as the Pillow engine would use; sources are kept. Raises ValueError if
+    Pillow can't read one.
+    """
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context) as pool:
+        # Start the workers first; the engine keeps its pool for the whole run
+        list(pool.map(abs, range(workers)))
+        start = time.perf_counter()
+        batches = [jobs[i::workers] for i in range(workers)]
+        results = pool.map(partial(convert_batch, keep_source=True), batches)
+        for src, status, msg in (r for batch in results for r in batch):
+            if status != "ok":
+                raise ValueError(f"{src}: {msg}")
+        return time.perf_counter() - start
+
+
+def calibrate_videos(samples: list[Path], cores: int, work_dir: Path) -> dict:
+    """
+    Encode a short slice of each sample with different -threads values,
+    running cores // threads encodes side by side, and keep the setting
+    with the best total throughput (media seconds per second).
+    """
+    best = None
+    for threads in sorted({1, 2, 4, 6, 8, cores}):
+        if threads > cores:
+            continue
+        slots = max(1, cores // threads)
+        cmds = [
+            [
+                "ffmpeg",
+                "-v",
+                "error",
+                "-t",
+                str(SAMPLE_SECONDS),
+                "-i",
+                str(sample),
+                *VIDEO_ENCODER_ARGS,
+                "-threads",
+                str(threads),
+                "-y",
+                str(work_dir / f"video_{threads}_{i}.mp4"),
+            ]
+            for i, sample in enumerate(samples * slots)
+        ]
+        rate = len(cmds) * SAMPLE_SECONDS / _timed_parallel(cmds, slots)
+        if best is None or rate > best["media_seconds_per_s"]:
+            best = {"video_threads": threads, "media_seconds_per_s": rate}
+    return best
+
+
+def calibrate_images(
+    samples: list[Path], cores: int, work_dir: Path, use_pillow: bool = False
+) -> dict:
+    """
+    Convert the sample images at several concurrencies, with the backend the
+    run will use, and keep the fastest. Concurrencies stay below the core
+    count: image_workers caps images while videos wait, so at cores or more
+    images would take every freed core and starve the video queue.
+    """
+    best = None
+    for workers in sorted({1, max(1, cores // 4), max(1, cores // 2), cores - 1}):
+        if workers < 1:
+            continue
+        outputs = [work_dir / f"image_{workers}_{i}.jpg" for i in range(len(samples))]
+        if use_pillow:
+            elapsed = _timed_pillow(
+                [(str(f), str(out)) for f, out in zip(samples, outputs)], workers
+            )
+        else:
+            cmds = [
+                [
+                    "ffmpeg",
+                    "-v",
+                    "error",
+                    "-i",
+                    str(sample),
+                    *IMAGE_ENCODER_ARGS,
+                    "-threads",
+                    "1",
+                    "-y",
+                    str(out),
+                ]
+                for sample, out in zip(samples, outputs)
+            ]
+            elapsed = _timed_parallel(cmds, workers)
+        rate = len(samples) / elapsed
+        if best is None or rate > best["images_per_s"]:
+            best = {"image_workers": workers, "images_per_s": rate}
+    return best
+
+
+def calibrate(
+    input_folder: str,
+    image_samples: int = 16,
+    video_samples: int = 2,
+    image_backend: str = "auto",
+) -> dict:
+    """
+    Pick per-host concurrency settings by timing short runs on a sample of
+    the real inputs. Inputs are only read; outputs go to a temp folder.
+    image_backend is the one the run will use (see convert_media). A kind
+    whose sample fails to convert is left to the scheduler's defaults.
+    """
+    cores = os.cpu_count() or 1
+    use_pillow = image_backend == "pillow" or (
+        image_backend == "auto" and PILLOW_AVAILABLE
+    )
+    images, videos = [], []
+    for f, type_ in scan_media(Path(input_folder)):
+        # JPGs are moved rather than converted, so they would time nothing
+        if f.suffix.lower() in [".jpg", ".jpeg"]:
+            continue
+        if type_ == "image" and len(images) < image_samples:
+            images.append(f)
+        elif type_ == "video" and len(videos) < video_samples:
+            videos.append(f)
+        if len(images) >= image_samples and len(videos) >= video_samples:
+            break
+
+    result = {"cores": cores, "calibrated_at": time.time()}
+    with tempfile.TemporaryDirectory() as tmp:
+        if videos:
+            try:
+                result.update(calibrate_videos(videos, cores, Path(tmp)))
+            except subprocess.CalledProcessError as e:
+                print(f"Video calibration failed, keeping defaults: {e}")
+        if images:
+            try:
+                result.update(calibrate_images(images, cores, Path(tmp), use_pillow))
+            except (subprocess.CalledProcessError, ValueError) as e:
+                print(f"Image calibration failed, keeping defaults: {e}")
+    return result
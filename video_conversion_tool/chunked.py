@@ -0,0 +1,170 @@
+import concurrent.futures
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+from probe_index import keyframe_times, probe_file
+from progress import run_ffmpeg
+
+# Inputs at least this large (bytes) are encoded in chunks
+CHUNK_THRESHOLD = 1 << 30
+
+# Target chunk length; actual cuts land on the nearest following keyframe
+CHUNK_SECONDS = 120.0
+
+# Threads per chunk encode; the job's threads are spread over this many
+# concurrent chunks
+CHUNK_THREADS = 2
+
+# Largest gap accepted between the output and source durations, and
+# between the output's video and audio streams
+DURATION_TOLERANCE = 0.5
+AV_SYNC_TOLERANCE = 0.1
+
+
+def chunk_bounds(
+    duration: float, keyframes: list[float], chunk_seconds: float = CHUNK_SECONDS
+) -> list[tuple[float, float]]:
+    """
+    (start, end) of each chunk. Cuts are due every chunk_seconds, and each
+    lands on the first keyframe at or after its due time (scene cuts usually
+    are one), so every chunk decodes without needing earlier frames.
+    """
+    cuts = [0.0]
+    due = chunk_seconds
+    for t in sorted(keyframes):
+        if t >= due and duration - t >= chunk_seconds / 2:
+            cuts.append(t)
+            due = (t // chunk_seconds + 1) * chunk_seconds
+    return list(zip(cuts, [*cuts[1:], duration]))
+
+
+def should_chunk(
+    file_path: Path,
+    info: dict | None,
+    threshold: int = CHUNK_THRESHOLD,
+    chunk_seconds: float = CHUNK_SECONDS,
+) -> bool:
+    duration = (info or {}).get("duration") or 0.0
+    return (
+        file_path.stat().st_size >= threshold
+        and duration >= 2 * chunk_seconds
+        and (info or {}).get("width") is not None
+    )
+
+
+def check_output(output_path: Path, duration: float, has_audio: bool):
+    """Raise if the stitched file is shorter/longer than the source or drifts"""
+    out = probe_file(output_path) or {}
+    video = out.get("video_duration") or out.get("duration") or 0.0
+    if abs(video - duration) > DURATION_TOLERANCE:
+        raise ValueError(f"duration {video:.2f}s, expected {duration:.2f}s")
+    audio = out.get("audio_duration")
+    if has_audio and audio is not None and abs(video - audio) > AV_SYNC_TOLERANCE:
+        raise ValueError(f"A/V drift: video {video:.2f}s, audio {audio:.2f}s")
+
+
+def encode_chunked(
+    file_path: Path,
+    output_path: Path,
+    encoder_args: list[str],
+    info: dict,
+    threads: int | None = None,
+    progress=None,
+    chunk_seconds: float = CHUNK_SECONDS,
+) -> int:
+    """
+    Encode one long video as keyframe-aligned chunks in parallel, all with
+    the same encoder_args, plus the audio track in a single pass of its own
+    (so no encoder priming gaps land at chunk joins). The pieces are joined
+    with a stream-copy concat and the result is checked for total duration
+    and A/V sync. Returns the number of chunks; raises on any failure.
+    """
+    duration = info["duration"]
+    # Only the stretch after each nominal cut is read to find its keyframe
+    targets = [chunk_seconds * k for k in range(1, int(duration // chunk_seconds) + 1)]
+    keyframes = keyframe_times(file_path, around=targets)
+    bounds = chunk_bounds(duration, keyframes, chunk_seconds)
+    has_audio = info.get("audio_codec") is not None
+    parallel = max(1, min(len(bounds), (threads or CHUNK_THREADS) // CHUNK_THREADS))
+
+    # Per-chunk encoded time, summed into one progress stream for the file
+    done = [0.0] * len(bounds)
+    lock = threading.Lock()
+
+    def chunk_progress(i):
+        def callback(metrics):
+            with lock:
+                done[i] = metrics.get("out_time", done[i])
+                total = sum(done)
+            if progress is not None:
+                progress({**metrics, "out_time": total})
+
+        return callback
+
+    with tempfile.TemporaryDirectory(
+        dir=output_path.parent, prefix=f".{file_path.stem}."
+    ) as tmp:
+        work_dir = Path(tmp)
+        chunks = [work_dir / f"chunk_{i:04d}.mp4" for i in range(len(bounds))]
+        audio_path = work_dir / "audio.m4a"
+
+        def encode_chunk(i):
+            start, end = bounds[i]
+            cmd = [
+                "ffmpeg",
+                "-ss",
+                f"{start:.6f}",
+                "-i",
+                str(file_path),
+                "-t",
+                f"{end - start:.6f}",
+                "-map",
+                "0:v:0",
+                "-an",
+                *encoder_args,
+                "-threads",
+                str(CHUNK_THREADS),
+                "-y",
+                str(chunks[i]),
+            ]
+            run_ffmpeg(cmd, on_progress=chunk_progress(i))
+
+        def encode_audio():
+            cmd = [
+                "ffmpeg",
+                "-i",
+                str(file_path),
+                "-map",
+                "0:a:0",
+                "-vn",
+                *encoder_args,
+                "-y",
+                str(audio_path),
+            ]
+            run_ffmpeg(cmd)
+
+        # The audio pass is submitted first so it gets its own worker
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=parallel + has_audio
+        ) as executor:
+            futures = [executor.submit(encode_audio)] if has_audio else []
+            futures += [executor.submit(encode_chunk, i) for i in range(len(bounds))]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+
+        concat_list = work_dir / "chunks.txt"
+        concat_list.write_text("".join(f"file '{c.name}'\n" for c in chunks))
+        cmd = ["ffmpeg", "-f", "concat", "-safe", "0", "-i", str(concat_list)]
+        if has_audio:
+            cmd += ["-i", str(audio_path), "-map", "0:v", "-map", "1:a"]
+        cmd += ["-c", "copy", "-movflags", "+faststart", "-y", str(output_path)]
+        subprocess.run(cmd, capture_output=True, check=True)
+
+    try:
+        check_output(output_path, duration, has_audio)
+    except ValueError:
+        output_path.unlink()
+        raise
+    return len(bounds)
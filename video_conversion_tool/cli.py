@@ -0,0 +1,310 @@
+"""
+Command-line entry point for converting a media folder.
+
+    python cli.py /path/to/folder [--media both|images|videos] [--auto-tune]
+    python cli.py /path/to/folder --plan
+    python cli.py /path/to/folder --watch
+
+With --auto-tune, a short calibration on a sample of the folder picks the
+video thread count and image concurrency for this machine; the result is
+stored per host and reused by later runs that don't pass explicit values.
+With --plan, nothing is converted: the predicted time and output size are
+printed, and the next real run reports how close the prediction was.
+With --watch, the process stays up and converts new files as they arrive
+(see watch.py).
+"""
+
+import argparse
+from pathlib import Path
+
+from async_engine import convert_media_async
+from calibrate import calibrate, load_tuning, save_tuning
+from convert_both import convert_media
+from gallery_index import build_gallery_index
+from hls import LADDER_KBPS, package_videos
+from planner import (
+    compare_with_plan,
+    format_comparison,
+    format_plan,
+    plan_media,
+    save_plan,
+)
+from profiles import PROFILES
+from sprites import generate_sprites
+from watch import SETTLE_SECONDS, watch_folder
+
+
+def parse_size(value: str) -> int:
+    """Byte count with an optional K/M/G suffix, e.g. 300K"""
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    suffix = value[-1:].upper()
+    if suffix in units:
+        return int(float(value[:-1]) * units[suffix])
+    return int(value)
+
+
+def parse_profile_budget(value: str) -> tuple[str, int]:
+    """NAME=SIZE, e.g. preview=10M"""
+    name, _, size = value.partition("=")
+    video_profiles = [p for p in PROFILES if not PROFILES[p].get("still")]
+    if name not in video_profiles or not size:
+        raise argparse.ArgumentTypeError(
+            f"expected NAME=SIZE with NAME one of {', '.join(video_profiles)}"
+        )
+    return name, parse_size(size)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Convert images to JPG and videos to MP4"
+    )
+    parser.add_argument("folder", help="folder to convert (walked recursively)")
+    parser.add_argument("--media", choices=["both", "images", "videos"], default="both")
+    parser.add_argument(
+        "--cpu-budget", type=int, help="cores to use (default: all of them)"
+    )
+    parser.add_argument("--video-threads", type=int, help="ffmpeg threads per video")
+    parser.add_argument(
+        "--image-workers", type=int, help="concurrent image jobs while videos wait"
+    )
+    parser.add_argument(
+        "--image-backend", choices=["auto", "pillow", "ffmpeg"], default="auto"
+    )
+    parser.add_argument(
+        "--max-bytes",
+        type=parse_size,
+        help="JPG size budget per image, e.g. 300K (searches the quality)",
+    )
+    parser.add_argument(
+        "--max-edge", type=int, help="downscale images to this longest edge"
+    )
+    parser.add_argument(
+        "--min-ssim",
+        type=float,
+        help="lowest structural similarity accepted by the quality search"
+        " (default 0.97)",
+    )
+    parser.add_argument(
+        "--chunk-over",
+        type=parse_size,
+        help="encode videos at least this large (e.g. 1G) in parallel chunks",
+    )
+    parser.add_argument(
+        "--max-video-bytes",
+        type=parse_size,
+        help="MP4 size budget per video, e.g. 50M (two-pass encode, may downscale)",
+    )
+    parser.add_argument(
+        "--keep-originals",
+        action="store_true",
+        help="leave inputs in place (files already JPG/MP4 are linked, not copied)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "asyncio"],
+        default="threads",
+        help="asyncio runs ffmpeg as async subprocesses in scan order"
+        " (no image batching or dedup)",
+    )
+    parser.add_argument(
+        "--jobs", type=int, help="concurrent ffmpeg processes (asyncio engine)"
+    )
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        choices=sorted(PROFILES),
+        default=[],
+        help="extra outputs per video, encoded from the same decode",
+    )
+    parser.add_argument(
+        "--profile-budget",
+        type=parse_profile_budget,
+        action="append",
+        default=[],
+        metavar="NAME=SIZE",
+        help="encode a profile to a size budget instead of its CRF (implies it)",
+    )
+    parser.add_argument(
+        "--sprites",
+        action="store_true",
+        help="build sprite sheets and posters for the converted videos",
+    )
+    parser.add_argument(
+        "--package",
+        action="store_true",
+        help="make the converted MP4s faststart and package them as HLS",
+    )
+    parser.add_argument(
+        "--hls-ladder",
+        type=int,
+        nargs="+",
+        choices=sorted(LADDER_KBPS, reverse=True),
+        metavar="HEIGHT",
+        help="extra HLS renditions to encode below the source, e.g. 720 480",
+    )
+    parser.add_argument(
+        "--gallery-index",
+        action="store_true",
+        help="index the converted files (sizes, durations, thumbnails) for the"
+        " gallery page",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=["link", "report"],
+        help="convert identical inputs once and hardlink the rest, or only list them",
+    )
+    parser.add_argument(
+        "--similar-images",
+        action="store_true",
+        help="list images that look alike (needs Pillow)",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="scan and probe only, and print the predicted time and output size",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and convert files as they are added to the folder",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=SETTLE_SECONDS,
+        help="seconds a new file must stop changing before it is converted"
+        " (--watch)",
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="poll directories instead of using inotify, e.g. on NFS (--watch)",
+    )
+    parser.add_argument(
+        "--auto-tune",
+        action="store_true",
+        help="calibrate on a sample of the folder and store the result for this host",
+    )
+    parser.add_argument(
+        "--no-incremental",
+        action="store_true",
+        help="ignore the conversion manifest and convert everything",
+    )
+    parser.add_argument("--hash-content", action="store_true")
+    parser.add_argument("--trace", help="where to write the Chrome trace")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.engine == "asyncio" and (args.max_video_bytes or args.profile_budget):
+        parser.error("--max-video-bytes and --profile-budget need --engine threads")
+
+    tuning = None
+    if args.auto_tune:
+        print("Calibrating...")
+        tuning = calibrate(args.folder, image_backend=args.image_backend)
+        save_tuning(tuning)
+    elif args.video_threads is None and args.image_workers is None:
+        tuning = load_tuning()
+
+    video_threads = args.video_threads
+    image_workers = args.image_workers
+    if tuning and ("video_threads" in tuning or "image_workers" in tuning):
+        video_threads = video_threads or tuning.get("video_threads")
+        image_workers = image_workers or tuning.get("image_workers")
+        print(
+            f"Using {video_threads or 'default'} threads per video, "
+            f"{image_workers or 'default'} image workers"
+        )
+
+    image_target = {
+        key: value
+        for key, value in [
+            ("max_bytes", args.max_bytes),
+            ("max_edge", args.max_edge),
+            ("min_ssim", args.min_ssim),
+        ]
+        if value is not None
+    }
+    profile_budgets = dict(args.profile_budget)
+    profiles = [*args.profiles, *(p for p in profile_budgets if p not in args.profiles)]
+
+    if args.plan:
+        plan = plan_media(
+            args.folder,
+            args.media,
+            cpu_budget=args.cpu_budget,
+            video_threads=video_threads,
+            image_workers=image_workers,
+            incremental=not args.no_incremental,
+            hash_content=args.hash_content,
+            profiles=profiles,
+            image_target=image_target or None,
+            video_max_bytes=args.max_video_bytes,
+            profile_budgets=profile_budgets or None,
+        )
+        print(format_plan(plan))
+        print(f"Plan saved to {save_plan(plan, args.folder)}")
+        return
+
+    if args.watch:
+        watch_folder(
+            args.folder,
+            args.media,
+            cpu_budget=args.cpu_budget,
+            video_threads=video_threads,
+            image_workers=image_workers,
+            profiles=profiles,
+            keep_originals=args.keep_originals,
+            settle_seconds=args.settle,
+            polling=args.poll,
+        )
+        return
+
+    if args.engine == "asyncio":
+        convert_media_async(
+            args.folder,
+            args.media,
+            concurrency=args.jobs,
+            threads=video_threads or 1,
+            incremental=not args.no_incremental,
+            hash_content=args.hash_content,
+            profiles=args.profiles,
+            keep_originals=args.keep_originals,
+        )
+    else:
+        convert_media(
+            args.folder,
+            args.media,
+            cpu_budget=args.cpu_budget,
+            video_threads=video_threads,
+            image_workers=image_workers,
+            incremental=not args.no_incremental,
+            hash_content=args.hash_content,
+            image_backend=args.image_backend,
+            trace_path=args.trace,
+            profiles=profiles,
+            dedup=args.dedup,
+            similar_images=args.similar_images,
+            image_target=image_target or None,
+            chunk_threshold=args.chunk_over,
+            keep_originals=args.keep_originals,
+            video_max_bytes=args.max_video_bytes,
+            profile_budgets=profile_budgets or None,
+        )
+        comparison = compare_with_plan(args.folder, args.trace)
+        if comparison is not None:
+            print(format_comparison(comparison))
+
+    if args.sprites and args.media in ["both", "videos"]:
+        generate_sprites(str(Path(args.folder) / "MP4_CONVERTED"))
+    if args.package and args.media in ["both", "videos"]:
+        package_videos(str(Path(args.folder) / "MP4_CONVERTED"), args.hls_ladder)
+    if args.gallery_index:
+        print(f"{build_gallery_index(args.folder)} assets in the gallery index")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,30 @@
+import os
 import subprocess
-import concurrent.futures
+from functools import partial
 from pathlib import Path
-from tqdm import tqdm
-import shutil
+import time
+
+from animation import (
+    ANIMATED_EXTENSIONS,
+    ANIMATION_ENCODER_ARGS,
+    animation_info,
+    convert_animation,
+    is_animated,
+)
+from budget import encode_to_budget
+from chunked import encode_chunked, should_chunk
+from fastpath import looks_like_h264_mp4, looks_like_jpeg, place_file
+from dedup import find_duplicates, find_similar_images, link_duplicates, print_groups
+from manifest import ConversionManifest, run_tracked
+from probe_index import index_for_folder, probe_file
+from remux import STREAM_MAP_ARGS, plan_video_conversion
+from image_engine import PILLOW_AVAILABLE, ImageBatchEngine
+from progress import ProgressTracker, Telemetry, run_ffmpeg
+from profiles import PROFILE_FOLDERS, PROFILES, build_profile_command, profile_output
+from gallery_index import THUMBNAILS_FOLDER
+from hls import PACKAGED_FOLDER
+from sprites import SPRITES_FOLDER
+from scheduler import BudgetScheduler, format_summary
 
 # File extensions
 IMAGE_EXTENSIONS = [
@@ -42,60 +64,475 @@ VIDEO_EXTENSIONS = [
     ".vob",
 ]
 
+IMAGE_EXTENSION_SET = frozenset(IMAGE_EXTENSIONS)
+VIDEO_EXTENSION_SET = frozenset(VIDEO_EXTENSIONS)
 
-def convert_single_image(file_path: Path, output_folder: Path) -> tuple[bool, str]:
-    """Convert a single image to JPG using ffmpeg"""
-    try:
-        output_path = output_folder / f"{file_path.stem}.jpg"
+# Folders written by the converters directly under the input folder; never
+# scanned for inputs (a user folder of the same name deeper down still is)
+OUTPUT_FOLDERS = {
+    "JPG_CONVERTED",
+    "MP4_CONVERTED",
+    SPRITES_FOLDER,
+    PACKAGED_FOLDER,
+    THUMBNAILS_FOLDER,
+    *PROFILE_FOLDERS,
+}
 
-        # If already JPG, just move
-        if file_path.suffix.lower() in [".jpg", ".jpeg"]:
-            shutil.move(file_path, output_path)
-            return True, f"Copied JPG: {file_path.name}"
+# Encoder settings, recorded in the manifest so changing them re-queues jobs
+IMAGE_ENCODER_ARGS = ["-quality", "95"]
+VIDEO_ENCODER_ARGS = [
+    "-c:v",
+    "libx264",
+    "-crf",
+    "23",
+    "-preset",
+    "medium",
+    "-c:a",
+    "aac",
+]
 
-        cmd = ["ffmpeg", "-i", str(file_path), "-quality", "95", "-y", str(output_path)]
-        subprocess.run(cmd, capture_output=True, check=True)
-        file_path.unlink()
-        return True, file_path.name
-    except Exception as e:
-        return False, f"Error processing {file_path.name}: {str(e)}"
 
+# Index (moov) at the front of the MP4 so playback can start before the
+# whole file has downloaded; not an encoder setting, so not in the manifest
+FASTSTART_ARGS = ["-movflags", "+faststart"]
+
+
+def threads_args(threads: int | None) -> list[str]:
+    """Explicit ffmpeg thread count, so concurrent jobs don't oversubscribe"""
+    return ["-threads", str(threads)] if threads else []
 
-def convert_single_video(file_path: Path, output_folder: Path) -> tuple[bool, str]:
-    """Convert a single video to MP4 using ffmpeg"""
-    try:
-        output_path = output_folder / f"{file_path.stem}.mp4"
 
-        # If already MP4, just move
-        if file_path.suffix.lower() == ".mp4":
-            shutil.move(file_path, output_path)
-            return True, f"Copied MP4: {file_path.name}"
+def image_command(
+    file_path: Path, output_folder: Path, threads: int | None = None
+) -> list[str] | None:
+    """ffmpeg command converting an image to JPG, or None if it is one already"""
+    if file_path.suffix.lower() in [".jpg", ".jpeg"] and looks_like_jpeg(file_path):
+        return None
+    return [
+        "ffmpeg",
+        "-i",
+        str(file_path),
+        *IMAGE_ENCODER_ARGS,
+        *threads_args(threads),
+        "-y",
+        str(output_folder / f"{file_path.stem}.jpg"),
+    ]
+
+
+def video_command(
+    file_path: Path,
+    output_folder: Path,
+    threads: int | None = None,
+    info: dict | None = None,
+    encoder_args: list[str] | None = None,
+    profiles: list[str] | None = None,
+    remux: bool = True,
+) -> tuple[str, list[str] | None, list[Path]]:
+    """
+    Plan one video job: (label, ffmpeg command, files the command writes).
+    H.264 MP4 inputs are labelled "Copied MP4" and are moved rather than
+    converted, so their command (if any) only writes the profile outputs.
+    An .mp4 that fails the header/codec check is converted like any input.
+    remux=False transcodes even when the streams could be copied.
+    """
+    outputs = [profile_output(output_folder, p, file_path.stem) for p in profiles or []]
+    if (
+        remux
+        and file_path.suffix.lower() == ".mp4"
+        and looks_like_h264_mp4(file_path, info or probe_file(file_path))
+    ):
+        if not profiles:
+            return "Copied MP4", None, []
+        cmd = build_profile_command(
+            file_path, output_folder, None, profiles, info, threads
+        )
+        return "Copied MP4", cmd, outputs
 
+    output_path = output_folder / f"{file_path.stem}.mp4"
+    label, codec_args = plan_video_conversion(
+        file_path, encoder_args or VIDEO_ENCODER_ARGS, info, remux
+    )
+    if profiles:
+        cmd = build_profile_command(
+            file_path, output_folder, codec_args, profiles, info, threads
+        )
+    else:
         cmd = [
             "ffmpeg",
             "-i",
             str(file_path),
-            "-c:v",
-            "libx264",
-            "-crf",
-            "23",
-            "-preset",
-            "medium",
-            "-c:a",
-            "aac",
+            *STREAM_MAP_ARGS,
+            *codec_args,
+            *threads_args(threads),
+            *FASTSTART_ARGS,
             "-y",
             str(output_path),
         ]
+    return label, cmd, [output_path, *outputs]
+
+
+def convert_single_image(
+    file_path: Path,
+    output_folder: Path,
+    threads: int | None = None,
+    keep_originals: bool = False,
+) -> tuple[bool, str]:
+    """
+    Convert a single image to JPG using ffmpeg.
+    Valid JPGs are moved (or linked/copied, see fastpath.place_file) instead.
+    A JPG that fails the check (e.g. truncated) is re-encoded from whatever
+    ffmpeg can decode, and its source is always kept.
+    keep_originals leaves every input in place.
+    """
+    try:
+        output_path = output_folder / f"{file_path.stem}.jpg"
+        cmd = image_command(file_path, output_folder, threads)
+
+        # If already JPG, just move
+        if cmd is None:
+            method = place_file(file_path, output_path, keep_originals)
+            return True, f"Copied JPG ({method}): {file_path.name}"
+
         subprocess.run(cmd, capture_output=True, check=True)
-        file_path.unlink()
+        if file_path.suffix.lower() in [".jpg", ".jpeg"]:
+            return True, f"{file_path.name} (failed the JPEG check; source kept)"
+        if not keep_originals:
+            file_path.unlink()
         return True, file_path.name
     except Exception as e:
         return False, f"Error processing {file_path.name}: {str(e)}"
 
 
-def convert_media(input_folder: str, media_type: str = "both", max_workers: int = 4):
-    """Convert images and/or videos in parallel"""
+def over_budget(file_path: Path, max_bytes: int | None) -> bool:
+    """
+    Whether a video is fitted to max_bytes straight away: its input is
+    already larger, so a remux or CRF encode would most likely be too.
+    Smaller inputs are encoded first and refitted only if the output isn't.
+    """
+    return max_bytes is not None and file_path.stat().st_size > max_bytes
+
+
+def will_chunk(
+    file_path: Path,
+    info: dict | None,
+    chunk_threshold: int | None,
+    encoder_args: list[str] | None = None,
+    profiles: list[str] | None = None,
+    max_bytes: int | None = None,
+) -> bool:
+    """
+    Whether convert_single_video encodes this input in chunks: only plain
+    transcodes (not remuxes, MP4 moves, budget fits or profile runs) of
+    inputs of at least chunk_threshold bytes are split.
+    """
+    if chunk_threshold is None or profiles or over_budget(file_path, max_bytes):
+        return False
+    if not should_chunk(file_path, info, chunk_threshold):
+        return False
+    label, _, _ = video_command(
+        file_path, file_path.parent, info=info, encoder_args=encoder_args
+    )
+    return label == "Transcoded"
+
+
+def convert_single_video(
+    file_path: Path,
+    output_folder: Path,
+    threads: int | None = None,
+    info: dict | None = None,
+    progress=None,
+    encoder_args: list[str] | None = None,
+    profiles: list[str] | None = None,
+    chunk_threshold: int | None = None,
+    keep_originals: bool = False,
+    max_bytes: int | None = None,
+    profile_budgets: dict[str, int] | None = None,
+) -> tuple[bool, str]:
+    """
+    Convert a single video to MP4 using ffmpeg.
+    Inputs that already hold H.264 (and AAC) are remuxed instead of
+    re-encoded; info is the probe_file result, probed here if not given.
+    progress is called with each ffmpeg -progress block.
+    encoder_args overrides VIDEO_ENCODER_ARGS for transcodes.
+    profiles names extra outputs (see profiles.PROFILES) produced from the
+    same decode, each in its own folder next to output_folder.
+    Transcodes of inputs of at least chunk_threshold bytes are split into
+    chunks encoded in parallel over the given threads (see chunked.py).
+    keep_originals leaves the input in place.
+    Inputs larger than max_bytes are instead fitted to it with a two-pass
+    encode (see budget.py), as are smaller ones whose output still came
+    out larger. profile_budgets fits each of those profiles
+    ({"preview": 10 << 20}); profiles without one keep their CRF.
+    """
+    try:
+        budgets = {
+            p: size
+            for p, size in (profile_budgets or {}).items()
+            if p in (profiles or []) and not PROFILES[p].get("still")
+        }
+        crf_profiles = [p for p in profiles or [] if p not in budgets]
+        if over_budget(file_path, max_bytes):
+            info = info or probe_file(file_path)
+            if crf_profiles:
+                cmd = build_profile_command(
+                    file_path, output_folder, None, crf_profiles, info, threads
+                )
+                run_ffmpeg(cmd)
+            fitted = encode_to_budget(
+                file_path,
+                output_folder / f"{file_path.stem}.mp4",
+                max_bytes,
+                info,
+                threads,
+                progress,
+            )
+            label, cmd = f"Fitted to budget ({fitted})", None
+        else:
+            label, cmd, _ = video_command(
+                file_path, output_folder, threads, info, encoder_args, crf_profiles
+            )
+        if (
+            chunk_threshold is not None
+            and label == "Transcoded"
+            and not profiles
+            and should_chunk(file_path, info, chunk_threshold)
+        ):
+            try:
+                chunks = encode_chunked(
+                    file_path,
+                    output_folder / f"{file_path.stem}.mp4",
+                    encoder_args or VIDEO_ENCODER_ARGS,
+                    info,
+                    threads,
+                    progress,
+                )
+                label, cmd = f"Transcoded in {chunks} chunks", None
+            except ValueError as e:
+                # The stitched file failed its checks; encode it in one piece
+                label = f"Transcoded (chunked output rejected: {e})"
+            except subprocess.CalledProcessError:
+                # A chunk, the audio pass or the concat failed; same fallback
+                label = "Transcoded (chunked encode failed)"
+        if cmd is not None:
+            try:
+                run_ffmpeg(cmd, on_progress=progress)
+            except subprocess.CalledProcessError:
+                if not label.startswith("Remuxed"):
+                    raise
+                # Streams the MP4 muxer rejects as-is; encode them instead
+                _, cmd, _ = video_command(
+                    file_path,
+                    output_folder,
+                    threads,
+                    info,
+                    encoder_args,
+                    crf_profiles,
+                    remux=False,
+                )
+                run_ffmpeg(cmd, on_progress=progress)
+                label = "Transcoded (remux failed)"
+        output_path = output_folder / f"{file_path.stem}.mp4"
+        if (
+            max_bytes is not None
+            and label != "Copied MP4"
+            and not label.startswith("Fitted")
+            and output_path.stat().st_size > max_bytes
+        ):
+            # A small input can still encode larger (e.g. HEVC to H.264)
+            size = output_path.stat().st_size
+            info = info or probe_file(file_path)
+            fitted = encode_to_budget(file_path, output_path, max_bytes, info, threads)
+            label = f"Fitted to budget after {size / 2**20:.1f} MiB at CRF ({fitted})"
+        fitted_profiles = ""
+        for name, size in budgets.items():
+            info = info or probe_file(file_path)
+            fitted = encode_to_budget(
+                file_path,
+                profile_output(output_folder, name, file_path.stem),
+                size,
+                info,
+                threads,
+                max_height=PROFILES[name]["max_height"],
+            )
+            fitted_profiles += f", {name} {fitted}"
+
+        # If already MP4, just move (after deriving any profile outputs)
+        if label == "Copied MP4":
+            method = place_file(file_path, output_path, keep_originals)
+            label = f"{label} ({method})"
+        elif not keep_originals:
+            file_path.unlink()
+        return True, f"{label}{fitted_profiles}: {file_path.name}"
+    except Exception as e:
+        return False, f"Error processing {file_path.name}: {str(e)}"
+
+
+def convert_image_batch(
+    engine: ImageBatchEngine,
+    files: list[Path],
+    output_folder: Path,
+    manifest: ConversionManifest | None,
+    threads: int | None = None,
+    settings=IMAGE_ENCODER_ARGS,
+) -> list[tuple[bool, str]]:
+    """Convert a batch through the image engine, tracking each file"""
+    if manifest is not None:
+        for f in files:
+            manifest.mark_started(f, output_folder / f"{f.stem}.jpg", settings)
+
+    results = engine.convert(files, output_folder, threads=threads)
+
+    if manifest is not None:
+        for f, (success, msg) in zip(files, results):
+            if success:
+                manifest.mark_done(f, output_folder / f"{f.stem}.jpg")
+            else:
+                manifest.mark_failed(f, msg)
+    return results
+
+
+def media_kind(
+    file_path: Path, media_type: str = "both", detect_animation: bool = False
+) -> str | None:
+    """Kind of input ("image", "video" or "animation"), None if not media_type"""
+    suffix = file_path.suffix.lower()
+    if media_type in ["both", "images"] and suffix in IMAGE_EXTENSION_SET:
+        if (
+            detect_animation
+            and suffix in ANIMATED_EXTENSIONS
+            and is_animated(file_path)
+        ):
+            return "animation"
+        return "image"
+    if media_type in ["both", "videos"] and suffix in VIDEO_EXTENSION_SET:
+        return "video"
+    return None
+
+
+def scan_media(
+    input_path: Path, media_type: str = "both", detect_animation: bool = False
+):
+    """
+    Walk input_path once with os.scandir, yielding (path, "image"|"video").
+    Output folders directly under input_path are pruned instead of being
+    walked and filtered.
+    With detect_animation, animated GIF/WebP images (found from their frame
+    count) are yielded as "animation" instead.
+    """
+    stack = [(str(input_path), True)]
+    while stack:
+        directory, top = stack.pop()
+        try:
+            it = os.scandir(directory)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not (top and entry.name in OUTPUT_FOLDERS):
+                            stack.append((entry.path, False))
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+
+                path = Path(entry.path)
+                kind = media_kind(path, media_type, detect_animation)
+                if kind is not None:
+                    yield path, kind
+
+
+def manifest_settings(
+    video_encoder_args: list[str] | None = None,
+    profiles: list[str] | None = None,
+    image_target: dict | None = None,
+    video_max_bytes: int | None = None,
+    profile_budgets: dict[str, int] | None = None,
+) -> dict:
+    """
+    Settings recorded in the manifest per media type; a file converted with
+    other settings is converted again
+    """
+    # Profiles and budgets change what a video job produces, so they are
+    # part of its settings
+    video_settings = [
+        *(video_encoder_args or VIDEO_ENCODER_ARGS),
+        *(f"profile:{p}" for p in profiles or []),
+    ]
+    if video_max_bytes is not None:
+        video_settings.append(f"max_bytes:{video_max_bytes}")
+    video_settings += [f"budget:{p}={n}" for p, n in (profile_budgets or {}).items()]
+    return {
+        "image": (
+            [*IMAGE_ENCODER_ARGS, image_target] if image_target else IMAGE_ENCODER_ARGS
+        ),
+        "video": video_settings,
+        "animation": ANIMATION_ENCODER_ARGS,
+    }
+
+
+def convert_media(
+    input_folder: str,
+    media_type: str = "both",
+    cpu_budget: int | None = None,
+    video_threads: int | None = None,
+    image_workers: int | None = None,
+    incremental: bool = True,
+    hash_content: bool = False,
+    image_backend: str = "auto",
+    image_batch_size: int = 32,
+    trace_path: str | None = None,
+    video_encoder_args: list[str] | None = None,
+    profiles: list[str] | None = None,
+    dedup: str | None = None,
+    similar_images: bool = False,
+    image_target: dict | None = None,
+    chunk_threshold: int | None = None,
+    keep_originals: bool = False,
+    video_max_bytes: int | None = None,
+    profile_budgets: dict[str, int] | None = None,
+):
+    """
+    Convert images and/or videos in parallel.
+    Jobs share a budget of cpu_budget cores (default: all of them); each
+    ffmpeg gets an explicit thread count and videos run longest first.
+    video_threads and image_workers override the scheduler's default split
+    (see calibrate.py for picking them per host).
+    image_backend "pillow" converts images in batches inside worker
+    processes (ffmpeg remains the fallback for unreadable formats);
+    "auto" uses it when Pillow is installed, "ffmpeg" never does.
+    With incremental=True, a manifest in the input folder records every job
+    so unchanged inputs already converted with the same settings are skipped
+    and interrupted runs pick up the jobs that never finished.
+    Progress is shown in media seconds (videos) and bytes (images); scan,
+    probe, encode and move timings per job are written as a Chrome trace
+    to trace_path (default: .conversion_trace.json in the input folder).
+    video_encoder_args overrides VIDEO_ENCODER_ARGS (e.g. another -preset).
+    profiles adds derived outputs per video (e.g. ["preview", "poster"]),
+    encoded from the same decode as the main MP4.
+    dedup finds byte-identical inputs before converting: "link" converts one
+    copy and hardlinks its outputs for the rest (converting each of them on
+    its own if that copy fails), "report" lists them and
+    leaves the extra copies unconverted. similar_images also lists images
+    that look alike (perceptual hash, needs Pillow) without touching them.
+    image_target ({"max_bytes", "max_edge", "min_ssim"}, all optional)
+    replaces the fixed JPG quality with a per-image quality search against
+    an SSIM threshold and byte budget (Pillow only; JPG inputs included).
+    Animated GIFs/WebPs become silent H.264 MP4s in MP4_CONVERTED rather
+    than single JPG frames, scheduled like videos.
+    Videos of at least chunk_threshold bytes are encoded in parallel chunks
+    and get the cores of several regular video jobs.
+    keep_originals leaves every input where it was; files already in the
+    target format are then hardlinked or reflinked when the filesystem
+    allows, so keeping them costs no copy.
+    video_max_bytes fits every larger video into that many bytes with a
+    two-pass encode; profile_budgets does the same per profile.
+    """
     input_path = Path(input_folder)
+    video_encoder_args = video_encoder_args or VIDEO_ENCODER_ARGS
+    trace_path = trace_path or input_path / ".conversion_trace.json"
 
     # Setup output folders
     img_output = input_path / "JPG_CONVERTED"
@@ -105,48 +542,294 @@ def convert_media(input_folder: str, media_type: str = "both", max_workers: int
         img_output.mkdir(exist_ok=True)
     if media_type in ["both", "videos"]:
         vid_output.mkdir(exist_ok=True)
+        for name in profiles or []:
+            (input_path / PROFILES[name]["folder"]).mkdir(exist_ok=True)
 
-    # Find media files
-    files = []
-    if media_type in ["both", "images"]:
-        files.extend(
-            [
-                (f, "image")
-                for f in input_path.rglob("*")
-                if f.suffix.lower() in IMAGE_EXTENSIONS and "CONVERTED" not in str(f)
-            ]
-        )
-    if media_type in ["both", "videos"]:
-        files.extend(
-            [
-                (f, "video")
-                for f in input_path.rglob("*")
-                if f.suffix.lower() in VIDEO_EXTENSIONS and "CONVERTED" not in str(f)
-            ]
+    settings_by_type = manifest_settings(
+        video_encoder_args, profiles, image_target, video_max_bytes, profile_budgets
+    )
+    video_settings = settings_by_type["video"]
+    image_settings = settings_by_type["image"]
+
+    manifest = (
+        ConversionManifest.for_folder(input_path, hash_content=hash_content)
+        if incremental
+        else None
+    )
+    if manifest is not None:
+        # They are not skipped, so this run converts them again
+        retry = [path for path in manifest.unfinished() if Path(path).exists()]
+        if retry:
+            print(f"Retrying {len(retry)} interrupted or failed jobs from a past run")
+
+    scheduler = BudgetScheduler(
+        cores=cpu_budget, video_threads=video_threads, image_share=image_workers
+    )
+    use_pillow = (
+        image_backend == "pillow"
+        or image_target is not None
+        or (image_backend == "auto" and PILLOW_AVAILABLE)
+    )
+    engine = (
+        ImageBatchEngine(
+            partial(convert_single_image, keep_originals=keep_originals),
+            workers=scheduler.cores,
+            target=image_target,
+            keep_originals=keep_originals,
         )
+        if use_pillow and media_type in ["both", "images"]
+        else None
+    )
+    tracker = ProgressTracker()
+    telemetry = Telemetry()
+
+    # Original input -> byte-identical copies to link once it is converted
+    duplicates = {}
+
+    def link_copies(f, outputs):
+        if dedup != "link" or f not in duplicates:
+            return []
+        with telemetry.span(f.name, "dedup"):
+            return link_duplicates(outputs, duplicates[f], keep_originals)
+
+    def convert_copies(f, convert):
+        """
+        The original failed, so there is nothing to link its copies to:
+        convert(copy) each of them on its own instead
+        """
+        results = []
+        for copy in duplicates.pop(f, []) if dedup == "link" else []:
+            result = convert(copy)
+            results += [result] if isinstance(result, tuple) else result
+        return results
 
-    if not files:
-        print("No media files found to convert")
-        return
+    def image_copy_job(threads):
+        def convert(copy):
+            size = copy.stat().st_size
+            tracker.add("image", size)
+            return image_job(copy, size, threads=threads)
 
-    # Convert files in parallel
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for f, type_ in files:
-            if type_ == "image":
-                futures.append(executor.submit(convert_single_image, f, img_output))
+        return convert
+
+    def image_job(f, size, threads=None):
+        start = time.perf_counter()
+        success, msg = run_tracked(
+            partial(convert_single_image, keep_originals=keep_originals),
+            f,
+            img_output / f"{f.stem}.jpg",
+            image_settings,
+            manifest,
+            threads=threads,
+        )
+        phase = "move" if msg.startswith("Copied") else "encode"
+        telemetry.record(
+            f.name,
+            phase,
+            start,
+            time.perf_counter(),
+            kind="image",
+            path=str(f),
+            threads=threads or 1,
+            success=success,
+        )
+        tracker.advance("image", size)
+        if success:
+            return [(success, msg), *link_copies(f, [img_output / f"{f.stem}.jpg"])]
+        return [(success, msg), *convert_copies(f, image_copy_job(threads))]
+
+    def image_batch_job(files, size, threads=None):
+        with telemetry.span(
+            f"batch of {len(files)}",
+            "encode",
+            kind="image",
+            paths=[str(f) for f in files],
+            threads=min(len(files), scheduler.cores),
+        ):
+            results = convert_image_batch(
+                engine, files, img_output, manifest, threads, image_settings
+            )
+        tracker.advance("image", size)
+        for f, (success, _) in zip(files, list(results)):
+            if success:
+                results += link_copies(f, [img_output / f"{f.stem}.jpg"])
             else:
-                futures.append(executor.submit(convert_single_video, f, vid_output))
+                results += convert_copies(f, image_copy_job(threads))
+        return results
+
+    def video_job(f, info, threads=None):
+        duration = (info or {}).get("duration") or 0.0
+        metrics = {}
+        callback, finish = tracker.video_callback(duration, metrics)
+        start = time.perf_counter()
+        if f.suffix.lower() in ANIMATED_EXTENSIONS:
+            convert = partial(
+                convert_animation,
+                info=info,
+                progress=callback,
+                keep_originals=keep_originals,
+            )
+            settings = ANIMATION_ENCODER_ARGS
+        else:
+            convert = partial(
+                convert_single_video,
+                info=info,
+                progress=callback,
+                encoder_args=video_encoder_args,
+                profiles=profiles,
+                chunk_threshold=chunk_threshold,
+                keep_originals=keep_originals,
+                max_bytes=video_max_bytes,
+                profile_budgets=profile_budgets,
+            )
+            settings = video_settings
+        success, msg = run_tracked(
+            convert,
+            f,
+            vid_output / f"{f.stem}.mp4",
+            settings,
+            manifest,
+            threads=threads,
+        )
+        finish()
+        phase = "move" if msg.startswith("Copied") else "encode"
+        telemetry.record(
+            f.name,
+            phase,
+            start,
+            time.perf_counter(),
+            kind="video",
+            path=str(f),
+            threads=threads or 1,
+            duration=duration,
+            success=success,
+            **metrics,
+        )
+        if success:
+            outputs = [vid_output / f"{f.stem}.mp4"]
+            outputs += [profile_output(vid_output, p, f.stem) for p in profiles or []]
+            return [(success, msg), *link_copies(f, outputs)]
+
+        def convert(copy):
+            tracker.add("video", duration)
+            return video_job(copy, info, threads=threads)
+
+        return [(success, msg), *convert_copies(f, convert)]
+
+    def report(future):
+        results = future.result()
+        if isinstance(results, tuple):
+            results = [results]
+        for success, msg in results:
+            tracker.write(msg if success else f"Error: {msg}")
+
+    def flush_batch():
+        size = sum(f.stat().st_size for f in batch)
+        tracker.add("image", size)
+        future = scheduler.submit_image(image_batch_job, list(batch), size)
+        future.add_done_callback(report)
+        batch.clear()
 
-        with tqdm(total=len(files), desc="Converting media") as pbar:
-            for future in concurrent.futures.as_completed(futures):
-                success, msg = future.result()
-                pbar.write(msg if success else f"Error: {msg}")
-                pbar.update(1)
+    def pending():
+        for f, type_ in scan_media(input_path, media_type, detect_animation=True):
+            settings = settings_by_type[type_]
+            if manifest is None or not manifest.should_skip(f, settings):
+                yield f, type_
+
+    entries = pending()
+    if dedup or similar_images:
+        # Duplicates can only be told apart once the whole walk is done
+        with telemetry.span(str(input_path), "scan"):
+            entries = list(entries)
+        images = [f for f, type_ in entries if type_ == "image"]
+        if dedup:
+            with telemetry.span(str(input_path), "dedup"):
+                groups = find_duplicates(images)
+                groups += find_duplicates([f for f, t in entries if t == "video"])
+            print_groups(groups, "Duplicates of", tracker.write)
+            for original, *copies in groups:
+                duplicates[original] = copies
+            skipped = {f for copies in duplicates.values() for f in copies}
+            entries = [(f, type_) for f, type_ in entries if f not in skipped]
+        if similar_images:
+            print_groups(find_similar_images(images), "Similar to", tracker.write)
+
+    # Images are converted while the walk is still running; videos and
+    # animations are collected so they can be ordered longest first
+    videos = []
+    animations = []
+    batch = []
+    with telemetry.span(str(input_path), "scan"):
+        for f, type_ in entries:
+            if type_ == "video":
+                videos.append(f)
+                continue
+            if type_ == "animation":
+                animations.append(f)
+                continue
+            # JPGs are moved as they are, unless they have a target to meet
+            is_jpg = f.suffix.lower() in [".jpg", ".jpeg"]
+            if engine is not None and (image_target or not is_jpg):
+                batch.append(f)
+                if len(batch) >= image_batch_size:
+                    flush_batch()
+                continue
+            size = f.stat().st_size
+            tracker.add("image", size)
+            scheduler.submit_image(image_job, f, size).add_done_callback(report)
+
+        if batch:
+            flush_batch()
+
+    if videos or animations:
+        with telemetry.span(f"{len(videos)} videos", "probe"):
+            infos = index_for_folder(str(input_path)).probe_many(videos)
+            infos.update((str(f.resolve()), animation_info(f)) for f in animations)
+        if animations:
+            vid_output.mkdir(exist_ok=True)
+        animated = set(animations)
+        for f in [*videos, *animations]:
+            info = infos.get(str(f.resolve()))
+            duration = (info or {}).get("duration") or 0.0
+            tracker.add("video", duration)
+            # Only jobs that really split get the cores of several videos
+            chunked = f not in animated and will_chunk(
+                f,
+                info,
+                chunk_threshold,
+                video_encoder_args,
+                profiles,
+                video_max_bytes,
+            )
+            future = scheduler.submit_video(
+                video_job,
+                f,
+                info,
+                duration=duration,
+                cost=scheduler.cores if chunked else None,
+            )
+            future.add_done_callback(report)
+
+    scheduler.close()
+    tracker.close()
+    if engine is not None:
+        engine.close()
+
+    if manifest is not None:
+        manifest.close()
+
+    if scheduler.jobs:
+        telemetry.write_chrome_trace(trace_path)
+
+    if not scheduler.jobs:
+        print("No new media files to convert")
+    else:
+        print(format_summary(scheduler.summary()))
+        for phase, seconds in sorted(telemetry.totals().items()):
+            print(f"{phase.capitalize()} time: {seconds:.1f}s")
+        print(f"Trace written to {trace_path}")
 
 
 if __name__ == "__main__":
-    folder_path = (
-        "/Users/omchavan/Documents/projects/reflex_tutorial/insta_pro-jan-2025"
-    )
-    convert_media(folder_path, "both")
+    from cli import main
+
+    main()
@@ -0,0 +1,206 @@
+import concurrent.futures
+import hashlib
+import mmap
+import os
+import shutil
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Bytes hashed from each end of a file before committing to a full read
+EDGE_BYTES = 4 << 20
+
+# Largest Hamming distance between two dHashes still reported as similar
+SIMILAR_DISTANCE = 5
+
+
+def edge_hash(file_path: Path, size: int) -> str:
+    """BLAKE2 of the first and last EDGE_BYTES (the whole file if smaller)"""
+    digest = hashlib.blake2b()
+    with open(file_path, "rb") as fh:
+        digest.update(fh.read(EDGE_BYTES))
+        if size > EDGE_BYTES:
+            fh.seek(max(EDGE_BYTES, size - EDGE_BYTES))
+            digest.update(fh.read(EDGE_BYTES))
+    return digest.hexdigest()
+
+
+def full_hash(file_path: Path) -> str:
+    """BLAKE2 of the whole file, read through a memory map"""
+    digest = hashlib.blake2b()
+    with open(file_path, "rb") as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            digest.update(mm)
+    return digest.hexdigest()
+
+
+def _refine(groups, key, max_workers):
+    """Split each group by key(path, size), dropping singletons"""
+    refined = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for size, files in groups:
+            keys = executor.map(lambda f: key(f, size), files)
+            buckets = defaultdict(list)
+            for f, k in zip(files, keys):
+                buckets[k].append(f)
+            refined += [(size, b) for b in buckets.values() if len(b) > 1]
+    return refined
+
+
+def find_duplicates(
+    files: list[Path], max_workers: int | None = None
+) -> list[list[Path]]:
+    """
+    Groups of byte-identical files. Candidates are narrowed by size, then by
+    a hash of both ends, and only what still collides is hashed in full.
+    Each group is sorted, so its first file is a stable pick to keep.
+    """
+    by_size = defaultdict(list)
+    for f in files:
+        try:
+            size = f.stat().st_size
+        except OSError:
+            continue
+        # Empty files are all "equal" but not worth linking
+        if size:
+            by_size[size].append(f)
+
+    groups = [(size, fs) for size, fs in by_size.items() if len(fs) > 1]
+    max_workers = max_workers or min(8, os.cpu_count() or 1)
+    groups = _refine(groups, edge_hash, max_workers)
+
+    # Files that fit in the two edges were already hashed in full
+    small = [g for g in groups if g[0] <= 2 * EDGE_BYTES]
+    large = [g for g in groups if g[0] > 2 * EDGE_BYTES]
+    large = _refine(large, lambda f, _: full_hash(f), max_workers)
+
+    return sorted(sorted(fs) for _, fs in small + large)
+
+
+def perceptual_hash(file_path: Path) -> int | None:
+    """64-bit difference hash (dHash) of an image, or None if unreadable"""
+    try:
+        with Image.open(file_path) as image:
+            # JPEGs can be decoded straight at a reduced scale
+            image.draft("L", (64, 64))
+            pixels = list(image.convert("L").resize((9, 8)).getdata())
+    except Exception:
+        return None
+
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            bits = (bits << 1) | (left > pixels[row * 9 + col + 1])
+    return bits
+
+
+def find_similar_images(
+    files: list[Path], max_distance: int = SIMILAR_DISTANCE
+) -> list[list[Path]]:
+    """
+    Groups of images that look alike (re-encodes, resizes) by comparing
+    perceptual hashes. Requires Pillow; returns nothing without it.
+    Hashes are split into max_distance + 1 bands: two hashes within
+    max_distance bits must agree on a whole band, so only images sharing
+    a band are compared rather than every pair.
+    """
+    if Image is None:
+        return []
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        hashes = zip(files, executor.map(perceptual_hash, files))
+        hashes = [(f, h) for f, h in hashes if h is not None]
+
+    bands = min(max_distance + 1, 64)
+    edges = [64 * i // bands for i in range(bands + 1)]
+
+    def band_keys(h):
+        return [
+            (band, (h >> lo) & ((1 << (hi - lo)) - 1))
+            for band, (lo, hi) in enumerate(zip(edges, edges[1:]))
+        ]
+
+    buckets = defaultdict(list)
+    for i, (_, h) in enumerate(hashes):
+        for key in band_keys(h):
+            buckets[key].append(i)
+
+    groups = []
+    seen = set()
+    for i, (f, h) in enumerate(hashes):
+        if i in seen:
+            continue
+        candidates = {j for key in band_keys(h) for j in buckets[key]}
+        group = [f]
+        for j in sorted(candidates):
+            if (
+                j > i
+                and j not in seen
+                and (h ^ hashes[j][1]).bit_count() <= max_distance
+            ):
+                group.append(hashes[j][0])
+                seen.add(j)
+        if len(group) > 1:
+            groups.append(sorted(group))
+    return groups
+
+
+def link_output(source: Path, target: Path) -> str:
+    """Hardlink target to source, copying instead across filesystems"""
+    if target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+        return "Linked"
+    except OSError:
+        shutil.copy2(source, target)
+        return "Copied"
+
+
+def link_duplicates(
+    outputs: list[Path], duplicates: list[Path], keep_originals: bool = False
+) -> list[tuple[bool, str]]:
+    """
+    Give every duplicate the outputs already converted for its original,
+    named after the duplicate, and remove the duplicate input (unless
+    keep_originals).
+    """
+    results = []
+    for dup in duplicates:
+        try:
+            for output in outputs:
+                target = output.with_stem(dup.stem)
+                if target != output and output.exists():
+                    link_output(output, target)
+            if not keep_originals:
+                dup.unlink()
+            results.append((True, f"Duplicate linked: {dup.name}"))
+        except Exception as e:
+            results.append((False, f"Error linking {dup.name}: {str(e)}"))
+    return results
+
+
+def print_groups(groups: list[list[Path]], label: str, write=print):
+    for group in groups:
+        write(f"{label}: {group[0]}")
+        for f in group[1:]:
+            write(f"    {f}")
+
+
+if __name__ == "__main__":
+    from convert_both import scan_media
+
+    if len(sys.argv) != 2:
+        sys.exit(f"Usage: python {sys.argv[0]} <folder>")
+    media = list(scan_media(Path(sys.argv[1])))
+    print_groups(find_duplicates([f for f, _ in media]), "Identical")
+    print_groups(
+        find_similar_images([f for f, type_ in media if type_ == "image"]),
+        "Similar",
+    )
@@ -0,0 +1,159 @@
+import errno
+import fcntl
+import os
+import shutil
+from pathlib import Path
+
+# ioctl that makes dst share src's extents (Btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+
+COPY_CHUNK = 8 << 20
+
+# MP4-family major brands an H.264 MP4 may carry in its ftyp box
+MP4_BRANDS = {b"isom", b"iso2", b"iso4", b"iso5", b"iso6", b"mp41", b"mp42", b"avc1"}
+
+
+def _scan_offset(fh) -> int | None:
+    """
+    Offset of the first scan's entropy-coded data, found by walking the
+    marker segments after SOI (so an EXIF thumbnail's own SOS/EOI inside
+    APP1 is skipped), or None if the headers are malformed
+    """
+    fh.seek(2)
+    while True:
+        marker = fh.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        if marker[1] == 0xFF:
+            # Fill byte before the marker
+            fh.seek(-1, os.SEEK_CUR)
+            continue
+        length = fh.read(2)
+        if len(length) < 2:
+            return None
+        size = int.from_bytes(length, "big")
+        if marker[1] == 0xDA:
+            return fh.tell() + size - 2
+        fh.seek(size - 2, os.SEEK_CUR)
+
+
+def looks_like_jpeg(file_path: Path, tail_bytes: int = 4096) -> bool:
+    """
+    SOI marker at the start and an EOI marker somewhere after the first
+    scan, which catches mislabeled files and truncated downloads without
+    decoding anything. EOI can't occur inside scan data (0xFF is stuffed
+    there), and data may follow it: Motion Photos append an MP4. The tail
+    is checked first, so only such files are read further.
+    """
+    try:
+        with open(file_path, "rb") as fh:
+            if fh.read(3) != b"\xff\xd8\xff":
+                return False
+            start = _scan_offset(fh)
+            if start is None:
+                return False
+            size = fh.seek(0, os.SEEK_END)
+            fh.seek(max(start, size - tail_bytes))
+            if b"\xff\xd9" in fh.read():
+                return True
+            fh.seek(start)
+            carry = b""
+            while chunk := fh.read(COPY_CHUNK):
+                if b"\xff\xd9" in carry + chunk:
+                    return True
+                carry = chunk[-1:]
+            return False
+    except OSError:
+        return False
+
+
+def looks_like_h264_mp4(file_path: Path, info: dict | None) -> bool:
+    """An ftyp box with an MP4 brand, and a probe that found H.264 video"""
+    try:
+        with open(file_path, "rb") as fh:
+            header = fh.read(12)
+    except OSError:
+        return False
+    if header[4:8] != b"ftyp" or header[8:12] not in MP4_BRANDS:
+        return False
+    return (info or {}).get("codec") == "h264"
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        try:
+            fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+            return True
+        except OSError:
+            pass
+    dst.unlink()
+    return False
+
+
+def _copy_file_range(src: Path, dst: Path) -> bool:
+    """
+    In-kernel copy, which NFS and some filesystems turn into a server-side
+    copy or a reflink. False if the kernel or filesystem can't do it.
+    """
+    if not hasattr(os, "copy_file_range"):
+        return False
+    unsupported = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP)
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        remaining = os.fstat(fin.fileno()).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(fin.fileno(), fout.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError as e:
+            if e.errno not in unsupported:
+                raise
+            remaining = -1
+    if remaining != 0:
+        dst.unlink()
+        return False
+    return True
+
+
+def _chunked_copy(src: Path, dst: Path):
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while chunk := fin.read(COPY_CHUNK):
+            fout.write(chunk)
+
+
+def place_file(src: Path, dst: Path, keep_original: bool = False) -> str:
+    """
+    Put src at dst as cheaply as the filesystems allow, trying a rename
+    (unless keep_original), a hardlink, a reflink, copy_file_range and
+    finally a chunked copy. Copies go to a temporary name first, so dst
+    never holds a partial file. Returns the method that worked.
+    """
+    if not keep_original:
+        try:
+            os.replace(src, dst)
+            return "renamed"
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+
+    tmp = dst.with_name(f".{dst.name}.part")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp)
+        method = "hardlinked"
+    except OSError:
+        if _reflink(src, tmp):
+            method = "reflinked"
+        elif _copy_file_range(src, tmp):
+            method = "copied in kernel"
+        else:
+            _chunked_copy(src, tmp)
+            method = "copied"
+        # A new inode: keep the source's mtime and mode, as a rename would
+        shutil.copystat(src, tmp)
+    os.replace(tmp, dst)
+
+    if not keep_original:
+        src.unlink()
+    return method
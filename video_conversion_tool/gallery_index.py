@@ -0,0 +1,190 @@
+import concurrent.futures
+import os
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+from tqdm import tqdm
+
+from budget import display_size
+from probe_index import index_for_folder
+from profiles import poster_time
+from sprites import SPRITES_FOLDER, sprite_paths
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Read by the Reflex gallery page; paths in it are relative to its folder
+GALLERY_INDEX_NAME = ".gallery_index.sqlite"
+THUMBNAILS_FOLDER = "THUMBNAILS"
+THUMBNAIL_WIDTH = 320
+
+# Converted folder -> kind of asset it holds
+ASSET_FOLDERS = {"JPG_CONVERTED": "image", "MP4_CONVERTED": "video"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    duration REAL,
+    thumbnail TEXT
+);
+CREATE INDEX IF NOT EXISTS assets_by_kind ON assets (kind, mtime_ns DESC);
+CREATE INDEX IF NOT EXISTS assets_by_time ON assets (mtime_ns DESC);
+"""
+
+
+def _image_thumbnail(source: Path, thumbnail: Path) -> tuple[int, int]:
+    """Write an upright thumbnail with Pillow; returns the full displayed size"""
+    with Image.open(source) as image:
+        size = image.size
+        # EXIF orientations 5-8 turn the picture by 90 degrees
+        if image.getexif().get(0x0112) in (5, 6, 7, 8):
+            size = size[::-1]
+        # JPEG draft mode decodes at 1/2..1/8 scale, far cheaper than a resize
+        image.draft("RGB", (THUMBNAIL_WIDTH, THUMBNAIL_WIDTH))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * 4))
+        image.save(thumbnail, "JPEG", quality=80)
+    return size
+
+
+def _ffmpeg_thumbnail(source: Path, thumbnail: Path, seek: float = 0.0):
+    cmd = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-ss",
+        f"{seek:.3f}",
+        "-i",
+        str(source),
+        "-frames:v",
+        "1",
+        "-vf",
+        f"scale={THUMBNAIL_WIDTH}:-2",
+        "-q:v",
+        "5",
+        "-y",
+        str(thumbnail),
+    ]
+    subprocess.run(cmd, capture_output=True, check=True)
+
+
+def index_asset(root: Path, source: Path, kind: str, info: dict | None) -> tuple | None:
+    """Row for one converted file, making its thumbnail; None on failure"""
+    thumbnails = root / THUMBNAILS_FOLDER
+    stat = source.stat()
+    info = info or {}
+    # Rotated phone videos are stored landscape; the gallery shows them as played
+    width, height = (
+        display_size(info) if info.get("width") and info.get("height") else (None, None)
+    )
+    duration = info.get("duration") if kind == "video" else None
+    thumbnail = thumbnails / f"{source.name}.jpg"
+    try:
+        if kind == "video":
+            # Reuse the poster from the sprites stage when there is one
+            poster = sprite_paths(source, root / SPRITES_FOLDER)["poster"]
+            if poster.exists():
+                thumbnail = poster
+            else:
+                _ffmpeg_thumbnail(source, thumbnail, poster_time(duration))
+        elif Image is not None:
+            width, height = _image_thumbnail(source, thumbnail)
+        else:
+            _ffmpeg_thumbnail(source, thumbnail)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return (
+        str(source.relative_to(root)),
+        kind,
+        stat.st_size,
+        stat.st_mtime_ns,
+        width,
+        height,
+        duration,
+        str(thumbnail.relative_to(root)),
+    )
+
+
+def build_gallery_index(media_folder: str, max_workers: int | None = None) -> int:
+    """
+    Index the JPG_CONVERTED and MP4_CONVERTED folders under media_folder
+    (dimensions, duration, thumbnail) so the gallery never lists or probes
+    directories per request. Unchanged files keep their rows; rows for
+    removed files are dropped with their thumbnails. Returns the number of
+    assets in the index.
+    """
+    root = Path(media_folder).resolve()
+    (root / THUMBNAILS_FOLDER).mkdir(exist_ok=True)
+    conn = sqlite3.connect(str(root / GALLERY_INDEX_NAME))
+    conn.executescript(SCHEMA)
+    known = {
+        path: (size, mtime_ns, thumbnail)
+        for path, size, mtime_ns, thumbnail in conn.execute(
+            "SELECT path, size, mtime_ns, thumbnail FROM assets"
+        )
+    }
+
+    seen = set()
+    stale = []
+    for folder, kind in ASSET_FOLDERS.items():
+        try:
+            entries = list(os.scandir(root / folder))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            rel = f"{folder}/{entry.name}"
+            seen.add(rel)
+            stat = entry.stat()
+            if known.get(rel, (None, None))[:2] != (stat.st_size, stat.st_mtime_ns):
+                stale.append((Path(entry.path), kind))
+
+    for path in set(known) - seen:
+        conn.execute("DELETE FROM assets WHERE path = ?", (path,))
+        thumbnail = root / known[path][2]
+        if thumbnail.parent.name == THUMBNAILS_FOLDER:
+            thumbnail.unlink(missing_ok=True)
+    conn.commit()
+
+    videos = [f for f, kind in stale if kind == "video"]
+    infos = index_for_folder(str(root / "MP4_CONVERTED")).probe_many(videos)
+    # Without Pillow, image sizes come from ffprobe
+    if Image is None:
+        images = [f for f, kind in stale if kind == "image"]
+        infos.update(index_for_folder(str(root / "JPG_CONVERTED")).probe_many(images))
+
+    max_workers = max_workers or os.cpu_count() or 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(index_asset, root, f, kind, infos.get(str(f.resolve())))
+            for f, kind in stale
+        ]
+        with tqdm(total=len(stale), desc="Indexing gallery") as pbar:
+            for future in concurrent.futures.as_completed(futures):
+                row = future.result()
+                if row is not None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        row,
+                    )
+                pbar.update(1)
+    conn.commit()
+    (count,) = conn.execute("SELECT COUNT(*) FROM assets").fetchone()
+    conn.close()
+    return count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(f"Usage: python {sys.argv[0]} <folder with *_CONVERTED folders>")
+    print(f"{build_gallery_index(sys.argv[1])} assets indexed")
@@ -0,0 +1,337 @@
+import concurrent.futures
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+from tqdm import tqdm
+
+from budget import display_size
+from probe_index import index_for_folder, probe_file
+
+PACKAGED_FOLDER = "HLS_PACKAGED"
+
+SEGMENT_SECONDS = 6
+
+# Rendition height -> video kb/s for the optional bitrate ladder. Heights
+# apply to the short side, so portrait clips get the same rungs; rungs at
+# or above the source are dropped, as the source itself is always packaged
+# as a stream copy. A copy can only be cut at its own keyframes, so the
+# ladder encodes put theirs exactly where the copy's segments start.
+LADDER_KBPS = {1080: 5000, 720: 2800, 480: 1400, 360: 800, 240: 400}
+AUDIO_KBPS = 128
+
+# RFC 6381 codec strings: H.264 profile -> profile_idc and constraint flags
+# (hex), AAC profile -> object type
+AVC_PROFILES = {
+    "Constrained Baseline": "42C0",
+    "Baseline": "4200",
+    "Main": "4D40",
+    "Extended": "5800",
+    "High": "6400",
+    "High 10": "6E00",
+    "High 4:2:2": "7A00",
+    "High 4:4:4 Predictive": "F400",
+}
+AAC_PROFILES = {"LC": "mp4a.40.2", "HE-AAC": "mp4a.40.5", "HE-AACv2": "mp4a.40.29"}
+
+
+def top_level_boxes(file_path: Path) -> list[str]:
+    """Types of the top-level MP4 boxes, in file order"""
+    boxes = []
+    with open(file_path, "rb") as fh:
+        end = os.fstat(fh.fileno()).st_size
+        offset = 0
+        while offset + 8 <= end:
+            fh.seek(offset)
+            header = fh.read(16)
+            size = int.from_bytes(header[:4], "big")
+            if size == 1:
+                size = int.from_bytes(header[8:16], "big")
+            elif size == 0:
+                size = end - offset
+            if size < 8:
+                break
+            boxes.append(header[4:8].decode("latin-1"))
+            offset += size
+    return boxes
+
+
+def is_faststart(file_path: Path) -> bool:
+    """True if the moov box comes before the media data"""
+    boxes = top_level_boxes(file_path)
+    if "moov" not in boxes:
+        return False
+    return "mdat" not in boxes or boxes.index("moov") < boxes.index("mdat")
+
+
+def make_faststart(file_path: Path):
+    """Move the moov box to the front with a stream copy, replacing the file"""
+    tmp = file_path.with_name(f".{file_path.name}.part")
+    cmd = [
+        "ffmpeg",
+        "-i",
+        str(file_path),
+        "-map",
+        "0",
+        "-c",
+        "copy",
+        "-movflags",
+        "+faststart",
+        "-f",
+        "mp4",
+        "-y",
+        str(tmp),
+    ]
+    try:
+        subprocess.run(cmd, capture_output=True, check=True)
+        os.replace(tmp, file_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def renditions(info: dict, ladder: list[int] | None) -> list[int]:
+    """Ladder heights below the source's short side, highest first"""
+    if not info.get("width") or not info.get("height"):
+        return []
+    short_side = min(display_size(info))
+    return sorted((h for h in ladder or [] if h < short_side), reverse=True)
+
+
+def is_fresh(video_path: Path, packaged_folder: Path, heights: list[int]) -> bool:
+    """True if the master playlist and every rendition are newer than the video"""
+    target = packaged_folder / video_path.stem
+    master = target / "master.m3u8"
+    if not master.exists() or master.stat().st_mtime < video_path.stat().st_mtime:
+        return False
+    expected = {"source", *(f"{h}p" for h in heights)}
+    found = {d.name for d in target.iterdir() if (d / "index.m3u8").exists()}
+    return found == expected
+
+
+def segment_starts(playlist: Path) -> list[float]:
+    """Start time of every segment after the first, from the EXTINF durations"""
+    starts, elapsed = [], 0.0
+    for line in playlist.read_text().splitlines():
+        if line.startswith("#EXTINF:"):
+            elapsed += float(line[len("#EXTINF:") :].split(",")[0])
+            starts.append(elapsed)
+    return starts[:-1]
+
+
+def codecs(file_path: Path) -> str | None:
+    """
+    CODECS value for the streams of a rendition (its init segment), or None
+    if one of them isn't H.264/AAC: a wrong or partial list is worse than
+    none, since players use it to reject variants they can't play
+    """
+    cmd = [
+        "ffprobe",
+        "-v",
+        "quiet",
+        "-print_format",
+        "json",
+        "-show_entries",
+        "stream=codec_name,profile,level",
+        str(file_path),
+    ]
+    try:
+        streams = json.loads(subprocess.check_output(cmd)).get("streams", [])
+    except (subprocess.CalledProcessError, OSError, ValueError):
+        return None
+    found = []
+    for stream in streams:
+        if stream.get("codec_name") == "h264":
+            profile = AVC_PROFILES.get(stream.get("profile"))
+            level = stream.get("level")
+            if profile is None or not isinstance(level, int) or level <= 0:
+                return None
+            found.append(f"avc1.{profile}{level:02X}")
+        elif stream.get("codec_name") == "aac":
+            if stream.get("profile") not in AAC_PROFILES:
+                return None
+            found.append(AAC_PROFILES[stream["profile"]])
+        else:
+            return None
+    return ",".join(found) or None
+
+
+def stream_inf(rendition_dir: Path, kbps: float) -> str:
+    """EXT-X-STREAM-INF line with the rendition's resolution and codecs"""
+    attributes = [f"BANDWIDTH={int(kbps * 1000)}"]
+    init = rendition_dir / "init.mp4"
+    info = probe_file(init) or {}
+    if info.get("width") and info.get("height"):
+        width, height = display_size(info)
+        attributes.append(f"RESOLUTION={width}x{height}")
+    codec_list = codecs(init)
+    if codec_list:
+        attributes.append(f'CODECS="{codec_list}"')
+    return "#EXT-X-STREAM-INF:" + ",".join(attributes)
+
+
+def _hls_args(work_dir: Path) -> list[str]:
+    return [
+        "-f",
+        "hls",
+        "-hls_time",
+        str(SEGMENT_SECONDS),
+        "-hls_playlist_type",
+        "vod",
+        "-hls_segment_type",
+        "fmp4",
+        "-hls_fmp4_init_filename",
+        "init.mp4",
+        "-hls_segment_filename",
+        str(work_dir / "seg_%05d.m4s"),
+        str(work_dir / "index.m3u8"),
+    ]
+
+
+def package_video(
+    video_path: Path,
+    packaged_folder: Path,
+    info: dict,
+    ladder: list[int] | None = None,
+    threads: int | None = None,
+) -> tuple[bool, str]:
+    """
+    Make video_path faststart (in place) and write an HLS package for it:
+    <stem>/master.m3u8 over fragmented-MP4 renditions, the source as a
+    stream copy plus one encode per ladder height below it. Ladder encodes
+    get keyframes only where the copy's segments start, so every rendition
+    is cut at the same times and players can switch at any segment. The
+    package is built under a temporary name and swapped in when complete.
+    """
+    try:
+        if not is_faststart(video_path):
+            make_faststart(video_path)
+
+        heights = renditions(info, ladder)
+        target = packaged_folder / video_path.stem
+        work = packaged_folder / f".{video_path.stem}.part"
+        shutil.rmtree(work, ignore_errors=True)
+        work.mkdir()
+        threads_args = ["-threads", str(threads)] if threads else []
+
+        source_dir = work / "source"
+        source_dir.mkdir()
+        cmd = ["ffmpeg", "-i", str(video_path), "-map", "0:v:0", "-map", "0:a:0?"]
+        subprocess.run(
+            [*cmd, "-c", "copy", *_hls_args(source_dir)],
+            capture_output=True,
+            check=True,
+        )
+
+        # The copy could only be cut at the source's own keyframes
+        cuts = ",".join(f"{t:.3f}" for t in segment_starts(source_dir / "index.m3u8"))
+        key_frames = ["-force_key_frames", cuts] if cuts else []
+        duration = info.get("duration") or 0.0
+        width, height = display_size(info) if heights else (0, 0)
+        source_kbps = video_path.stat().st_size * 8 / 1000 / duration if duration else 0
+        # BANDWIDTH is a peak rate; leave headroom over the copy's average
+        variants = [(source_kbps * 1.2, "source")]
+        for h in heights:
+            kbps = LADDER_KBPS[h]
+            rung_dir = work / f"{h}p"
+            rung_dir.mkdir()
+            scale = f"scale=-2:{h}" if width >= height else f"scale={h}:-2"
+            subprocess.run(
+                [
+                    *cmd,
+                    "-vf",
+                    scale,
+                    "-c:v",
+                    "libx264",
+                    "-preset",
+                    "veryfast",
+                    "-b:v",
+                    f"{kbps}k",
+                    "-maxrate",
+                    f"{int(kbps * 1.1)}k",
+                    "-bufsize",
+                    f"{kbps * 2}k",
+                    *key_frames,
+                    # No keyframes of x264's own, which could cut elsewhere
+                    "-x264-params",
+                    "keyint=infinite:scenecut=0",
+                    "-pix_fmt",
+                    "yuv420p",
+                    "-c:a",
+                    "aac",
+                    "-b:a",
+                    f"{AUDIO_KBPS}k",
+                    *threads_args,
+                    *_hls_args(rung_dir),
+                ],
+                capture_output=True,
+                check=True,
+            )
+            variants.append((kbps * 1.1 + AUDIO_KBPS, f"{h}p"))
+
+        lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+        for kbps, name in variants:
+            lines.append(stream_inf(work / name, kbps))
+            lines.append(f"{name}/index.m3u8")
+        (work / "master.m3u8").write_text("\n".join(lines) + "\n")
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(work, target)
+        return True, f"{video_path.name}: {len(variants)} renditions"
+    except Exception as e:
+        shutil.rmtree(packaged_folder / f".{video_path.stem}.part", ignore_errors=True)
+        return False, f"Error packaging {video_path.name}: {str(e)}"
+
+
+def package_videos(
+    video_folder: str,
+    ladder: list[int] | None = None,
+    max_workers: int | None = None,
+):
+    """
+    Package every MP4 in video_folder (e.g. MP4_CONVERTED) for streaming
+    into an HLS_PACKAGED folder next to it, in parallel. Clips whose
+    package is newer than the video are skipped, but are still made
+    faststart if they aren't.
+    """
+    video_path = Path(video_folder)
+    packaged_folder = video_path.parent / PACKAGED_FOLDER
+    packaged_folder.mkdir(exist_ok=True)
+
+    mp4s = [f for f in video_path.iterdir() if f.suffix.lower() == ".mp4"]
+    infos = index_for_folder(str(video_path)).probe_many(mp4s)
+    videos = []
+    for f in mp4s:
+        info = infos.get(str(f.resolve())) or {}
+        if not is_fresh(f, packaged_folder, renditions(info, ladder)):
+            videos.append((f, info))
+        elif not is_faststart(f):
+            make_faststart(f)
+    if not videos:
+        print("All HLS packages are up to date")
+        return
+
+    # Stream copies are I/O bound; ladder encodes each want a few cores
+    cores = os.cpu_count() or 1
+    max_workers = max_workers or (max(1, cores // 4) if ladder else cores)
+    threads = max(1, cores // max_workers) if ladder else None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(package_video, f, packaged_folder, info, ladder, threads)
+            for f, info in videos
+        ]
+
+        with tqdm(total=len(videos), desc="Packaging HLS") as pbar:
+            for future in concurrent.futures.as_completed(futures):
+                success, msg = future.result()
+                if not success:
+                    pbar.write(msg)
+                pbar.update(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(f"Usage: python {sys.argv[0]} <MP4 folder> [ladder heights...]")
+    package_videos(sys.argv[1], [int(h) for h in sys.argv[2:]] or None)
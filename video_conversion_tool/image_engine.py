@@ -0,0 +1,329 @@
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Optional decoders; without them HEIC/AVIF inputs fall back to ffmpeg
+try:
+    import pillow_heif
+
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pass
+try:
+    import pillow_avif  # noqa: F401 (registers the AVIF plugin)
+except ImportError:
+    pass
+
+PILLOW_AVAILABLE = Image is not None
+
+# SSIM is measured on a grid of up to SSIM_TILES x SSIM_TILES full-resolution
+# 8x8 luma windows, so the cost per step stays fixed without numpy and
+# downscaling doesn't hide block artifacts. The windows are offset by half a
+# JPEG block, so each one straddles block edges where blocking shows; a
+# window aligned with a block would only see its smoothed interior
+SSIM_TILES = 32
+SSIM_WINDOW = 8
+
+
+def _to_rgb(image):
+    """Flatten onto white so transparent areas don't turn black in the JPG"""
+    if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _upright(image):
+    """
+    Apply the EXIF orientation to the pixels, and return the ICC profile
+    and (now orientation-free) EXIF as save arguments, so the JPG neither
+    turns sideways nor loses its colour space and capture metadata.
+    """
+    image = ImageOps.exif_transpose(image)
+    metadata = {}
+    if image.info.get("icc_profile"):
+        metadata["icc_profile"] = image.info["icc_profile"]
+    exif = image.getexif()
+    if exif:
+        metadata["exif"] = exif.tobytes()
+    return image, metadata
+
+
+def _luma(image) -> tuple[list[int], int]:
+    """Grayscale pixels of the sampled windows, tiled side by side, for SSIM"""
+    gray = image.convert("L")
+    w = SSIM_WINDOW
+    cols = min(SSIM_TILES, gray.width // w) or 1
+    rows = min(SSIM_TILES, gray.height // w) or 1
+    step_x = gray.width // w // cols * w
+    step_y = gray.height // w // rows * w
+    # Images too small to shift the last window stay block-aligned
+    shift_x = w // 2 if (cols - 1) * step_x + w + w // 2 <= gray.width else 0
+    shift_y = w // 2 if (rows - 1) * step_y + w + w // 2 <= gray.height else 0
+    mosaic = Image.new("L", (cols * w, rows * w))
+    for row in range(rows):
+        for col in range(cols):
+            left, top = col * step_x + shift_x, row * step_y + shift_y
+            box = (left, top, left + w, top + w)
+            mosaic.paste(gray.crop(box), (col * w, row * w))
+    return list(mosaic.getdata()), mosaic.width
+
+
+def ssim(reference: tuple[list[int], int], candidate: tuple[list[int], int]) -> float:
+    """Mean SSIM over non-overlapping windows of two _luma results"""
+    (a, width), (b, _) = reference, candidate
+    height = len(a) // width
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    n = SSIM_WINDOW * SSIM_WINDOW
+    total, windows = 0.0, 0
+    for top in range(0, height - SSIM_WINDOW + 1, SSIM_WINDOW):
+        for left in range(0, width - SSIM_WINDOW + 1, SSIM_WINDOW):
+            sa = sb = saa = sbb = sab = 0
+            for row in range(top, top + SSIM_WINDOW):
+                start = row * width + left
+                end = start + SSIM_WINDOW
+                for x, y in zip(a[start:end], b[start:end]):
+                    sa += x
+                    sb += y
+                    saa += x * x
+                    sbb += y * y
+                    sab += x * y
+            mean_a, mean_b = sa / n, sb / n
+            var_a = saa / n - mean_a * mean_a
+            var_b = sbb / n - mean_b * mean_b
+            cov = sab / n - mean_a * mean_b
+            total += ((2 * mean_a * mean_b + c1) * (2 * cov + c2)) / (
+                (mean_a * mean_a + mean_b * mean_b + c1) * (var_a + var_b + c2)
+            )
+            windows += 1
+    return total / windows if windows else 1.0
+
+
+def encode_to_target(
+    image,
+    max_bytes: int | None = None,
+    min_ssim: float = 0.97,
+    min_quality: int = 30,
+    max_quality: int = 95,
+    metadata: dict | None = None,
+) -> tuple[bytes, int, float]:
+    """
+    Binary-search the lowest JPEG quality whose SSIM against the decoded
+    image reaches min_ssim; if that is still over max_bytes, the highest
+    quality that fits instead (or min_quality if nothing fits). The image
+    is decoded once, and every step only re-encodes it in memory.
+    metadata (ICC profile, EXIF) is written into every candidate, so it
+    counts against max_bytes. Returns (jpeg bytes, quality, ssim).
+    """
+    reference = _luma(image)
+    tried = {}
+
+    def encode(quality):
+        if quality not in tried:
+            buffer = io.BytesIO()
+            image.save(
+                buffer, "JPEG", quality=quality, optimize=True, **(metadata or {})
+            )
+            data = buffer.getvalue()
+            with Image.open(io.BytesIO(data)) as decoded:
+                score = ssim(reference, _luma(decoded))
+            tried[quality] = (data, score)
+        return tried[quality]
+
+    lo, hi = min_quality, max_quality
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if encode(mid)[1] >= min_ssim:
+            hi = mid
+        else:
+            lo = mid + 1
+    quality = lo
+
+    if max_bytes is not None and len(encode(quality)[0]) > max_bytes:
+        lo, hi = min_quality, quality - 1
+        quality = min_quality
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if len(encode(mid)[0]) <= max_bytes:
+                quality, lo = mid, mid + 1
+            else:
+                hi = mid - 1
+
+    data, score = encode(quality)
+    return data, quality, score
+
+
+def convert_batch(
+    jobs: list[tuple[str, str]],
+    quality: int = 95,
+    target: dict | None = None,
+    keep_source: bool = False,
+) -> list[tuple[str, str, str]]:
+    """
+    Worker-process entry point: decode and encode a batch of images to JPG.
+    Returns (source, status, message) per job, where status is "ok",
+    or "fallback" when Pillow can't read the input.
+    target switches from a fixed quality to a search (see encode_to_target)
+    with optional keys max_bytes, max_edge and min_ssim; the chosen quality
+    and output size go into the message. keep_source leaves inputs in place.
+    """
+    results = []
+    for src, dst in jobs:
+        try:
+            with Image.open(src) as image:
+                image, metadata = _upright(image)
+                image = _to_rgb(image)
+            if target is None:
+                image.save(dst, "JPEG", quality=quality, **metadata)
+                msg = os.path.basename(src)
+            else:
+                max_edge = target.get("max_edge")
+                if max_edge:
+                    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+                data, chosen, score = encode_to_target(
+                    image,
+                    max_bytes=target.get("max_bytes"),
+                    min_ssim=target.get("min_ssim", 0.97),
+                    max_quality=quality,
+                    metadata=metadata,
+                )
+                with open(dst, "wb") as fh:
+                    fh.write(data)
+                msg = (
+                    f"{os.path.basename(src)}: quality {chosen}, "
+                    f"{len(data) / 1024:.0f} KiB, SSIM {score:.3f}"
+                )
+        except Exception as e:
+            results.append((src, "fallback", str(e)))
+            continue
+        if not keep_source and os.path.abspath(src) != os.path.abspath(dst):
+            os.unlink(src)
+        results.append((src, "ok", msg))
+    return results
+
+
+class ImageBatchEngine:
+    """
+    Converts images to JPG in worker processes, a batch per task, so the
+    cost of starting ffmpeg isn't paid for every image. Files Pillow
+    can't decode are handed to the fallback converter (ffmpeg).
+    """
+
+    def __init__(
+        self,
+        fallback,
+        workers: int | None = None,
+        quality: int = 95,
+        target: dict | None = None,
+        keep_originals: bool = False,
+    ):
+        if not PILLOW_AVAILABLE:
+            raise RuntimeError("Pillow is not installed")
+        self.fallback = fallback
+        self.quality = quality
+        self.target = target
+        self.keep_originals = keep_originals
+        # Workers are started from scheduler threads; forking a threaded
+        # process can deadlock on locks held elsewhere, so always spawn
+        self._pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def convert(
+        self, files: list[Path], output_folder: Path, threads: int | None = None
+    ) -> list[tuple[bool, str]]:
+        """Convert one batch; blocks until every file is done"""
+        jobs = [(str(f), str(output_folder / f"{f.stem}.jpg")) for f in files]
+        results = []
+        for src, status, msg in self._pool.submit(
+            convert_batch, jobs, self.quality, self.target, self.keep_originals
+        ).result():
+            if status == "ok":
+                results.append((True, msg))
+            else:
+                results.append(self.fallback(Path(src), output_folder, threads=threads))
+        return results
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def benchmark_backends(sample_folder: str, batch_size: int = 32) -> dict:
+    """
+    Compare images/s of the per-file ffmpeg path and the batched Pillow
+    engine on copies of the images in sample_folder (originals untouched).
+    """
+    from convert_both import IMAGE_EXTENSIONS, convert_single_image
+
+    samples = [
+        f
+        for f in Path(sample_folder).iterdir()
+        if f.suffix.lower() in IMAGE_EXTENSIONS
+        and f.suffix.lower() not in (".jpg", ".jpeg")
+    ]
+    if not samples:
+        raise ValueError(f"No convertible images in {sample_folder}")
+
+    def staged(work_dir: Path) -> list[Path]:
+        copies = []
+        for f in samples:
+            shutil.copy2(f, work_dir / f.name)
+            copies.append(work_dir / f.name)
+        (work_dir / "out").mkdir()
+        return copies
+
+    rates = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp) / "ffmpeg"
+        work_dir.mkdir()
+        copies = staged(work_dir)
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            list(
+                executor.map(
+                    lambda f: convert_single_image(f, work_dir / "out", threads=1),
+                    copies,
+                )
+            )
+        rates["ffmpeg"] = len(copies) / (time.perf_counter() - start)
+
+        work_dir = Path(tmp) / "pillow"
+        work_dir.mkdir()
+        copies = staged(work_dir)
+        start = time.perf_counter()
+        with ImageBatchEngine(convert_single_image) as engine:
+            batches = [
+                copies[i : i + batch_size] for i in range(0, len(copies), batch_size)
+            ]
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                list(
+                    executor.map(lambda b: engine.convert(b, work_dir / "out"), batches)
+                )
+        rates["pillow"] = len(copies) / (time.perf_counter() - start)
+
+    return rates
+
+
+if __name__ == "__main__":
+    import sys
+
+    for backend, rate in benchmark_backends(sys.argv[1]).items():
+        print(f"{backend}: {rate:.1f} images/s")
@@ -1,8 +1,12 @@
+import os
 import subprocess
+import sys
 import concurrent.futures
 from pathlib import Path
 from tqdm import tqdm
 
+from manifest import ConversionManifest, run_tracked
+
 IMAGE_EXTENSIONS = [
     ".jpg",
     ".jpeg",
@@ -21,6 +25,8 @@ IMAGE_EXTENSIONS = [
     ".heif",
 ]
 
+IMAGE_ENCODER_ARGS = ["-quality", "95"]
+
 
 def convert_single_image(file_path: Path, output_folder: Path) -> tuple[bool, str]:
     """Convert a single image to JPG using ffmpeg"""
@@ -30,8 +36,7 @@ def convert_single_image(file_path: Path, output_folder: Path) -> tuple[bool, st
             "ffmpeg",
             "-i",
             str(file_path),
-            "-quality",
-            "95",
+            *IMAGE_ENCODER_ARGS,
             "-y",  # Overwrite output files
             str(output_path),
         ]
@@ -43,10 +48,15 @@ def convert_single_image(file_path: Path, output_folder: Path) -> tuple[bool, st
         return False, f"Error converting {file_path.name}: {e.stderr.decode()}"
 
 
-def convert_images_to_jpg(input_folder: str, max_workers: int = 4):
+def convert_images_to_jpg(
+    input_folder: str, max_workers: int | None = None, incremental: bool = True
+):
     """
     Converts all supported image files to JPG format using ffmpeg.
-    Uses parallel processing for better performance.
+    Uses parallel processing for better performance (one worker per core
+    unless max_workers is given).
+    With incremental=True, images already converted with the same settings
+    (per the folder's conversion manifest) are skipped.
     """
     input_path = Path(input_folder)
     output_folder = input_path / "JPG_CONVERTED"
@@ -59,14 +69,31 @@ def convert_images_to_jpg(input_folder: str, max_workers: int = 4):
         if f.suffix.lower() in IMAGE_EXTENSIONS and "JPG_CONVERTED" not in str(f)
     ]
 
+    manifest = ConversionManifest.for_folder(input_path) if incremental else None
+    if manifest is not None:
+        image_files = [
+            f for f in image_files if not manifest.should_skip(f, IMAGE_ENCODER_ARGS)
+        ]
+
     if not image_files:
         print("No images found to convert")
+        if manifest is not None:
+            manifest.close()
         return
 
     # Convert images in parallel with progress bar
+    max_workers = max_workers or os.cpu_count() or 1
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
         futures = [
-            executor.submit(convert_single_image, f, output_folder) for f in image_files
+            executor.submit(
+                run_tracked,
+                convert_single_image,
+                f,
+                output_folder / f"{f.stem}.jpg",
+                IMAGE_ENCODER_ARGS,
+                manifest,
+            )
+            for f in image_files
         ]
 
         with tqdm(total=len(image_files), desc="Converting images") as pbar:
@@ -78,9 +105,11 @@ def convert_images_to_jpg(input_folder: str, max_workers: int = 4):
                     pbar.write(msg)
                 pbar.update(1)
 
+    if manifest is not None:
+        manifest.close()
+
 
 if __name__ == "__main__":
-    folder_path = (
-        "/Users/omchavan/Documents/projects/reflex_tutorial/insta_pro-jan-2025"
-    )
-    convert_images_to_jpg(folder_path)
+    if len(sys.argv) != 2:
+        sys.exit(f"Usage: python {sys.argv[0]} <folder>")
+    convert_images_to_jpg(sys.argv[1])
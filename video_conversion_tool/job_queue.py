@@ -0,0 +1,511 @@
+"""
+Shared job queue for converting one media tree from many processes/hosts.
+
+One process enqueues the scanned files, then any number of workers (on
+any machine that mounts the tree) claim jobs under a time-limited lease:
+
+    python job_queue.py enqueue /mnt/media
+    python job_queue.py work /mnt/media        # as many as you like
+    python job_queue.py status /mnt/media
+
+A worker renews its lease while the job runs. If it dies, the lease
+expires and another worker takes the job over (reported as a steal); a
+worker that loses its lease kills its conversion (ffmpeg included) so the
+file is never converted twice at once. Expiry is judged without comparing
+clocks across hosts: each renewal bumps a counter, and a lease counts as
+expired once a worker has seen the counter stand still for the lease
+length on its own monotonic clock. Failed jobs, and jobs whose worker
+died, are retried up to max_attempts times.
+
+The default backend is a SQLite file in the media folder. It uses a
+rollback journal rather than WAL, because WAL needs shared memory that
+network filesystems don't provide. Other backends (a database server, a
+broker) only need to implement QueueBackend.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import signal
+import sqlite3
+import threading
+import time
+from functools import partial
+from pathlib import Path
+
+from animation import animation_info, convert_animation
+from convert_both import (
+    VIDEO_ENCODER_ARGS,
+    convert_single_image,
+    convert_single_video,
+    scan_media,
+)
+from probe_index import index_for_folder
+from profiles import PROFILES
+
+QUEUE_NAME = ".conversion_queue.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    options TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    lease_seconds REAL,
+    renewals INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    steals INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class Job:
+    __slots__ = ("id", "path", "kind", "options", "attempts", "stolen_from")
+
+    def __init__(self, id, path, kind, options, attempts, stolen_from=None):
+        self.id = id
+        self.path = path
+        self.kind = kind
+        self.options = options
+        self.attempts = attempts
+        self.stolen_from = stolen_from
+
+
+class QueueBackend:
+    """
+    Interface a queue backend implements. Paths are relative to the media
+    folder, since hosts may mount it in different places.
+    """
+
+    def enqueue(self, jobs: list[tuple[str, str, dict, float]]) -> int:
+        """Add (path, kind, options, priority) jobs; returns how many are new"""
+        raise NotImplementedError
+
+    def claim(self, worker: str, lease_seconds: float, max_attempts: int) -> Job | None:
+        """
+        Lease the next queued (or expired) job to worker. Expired jobs that
+        already had max_attempts are failed instead: their file keeps
+        killing the workers that convert it.
+        """
+        raise NotImplementedError
+
+    def renew(self, job: Job, worker: str, lease_seconds: float) -> bool:
+        """Extend a lease; False if another worker has taken the job"""
+        raise NotImplementedError
+
+    def complete(self, job: Job, worker: str) -> bool:
+        """Mark a job done; False if the lease was lost in the meantime"""
+        raise NotImplementedError
+
+    def fail(self, job: Job, worker: str, error: str, max_attempts: int) -> bool:
+        """Requeue a failed job, or give up on it after max_attempts"""
+        raise NotImplementedError
+
+    def pending(self) -> int:
+        """Jobs queued or leased, i.e. work that may still need a worker"""
+        raise NotImplementedError
+
+    def counts(self) -> dict:
+        raise NotImplementedError
+
+
+class SQLiteQueue(QueueBackend):
+    def __init__(self, db_path: Path, timeout: float = 60.0):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.db_path),
+            timeout=timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.execute(SCHEMA)
+        # Queues created before leases were judged by renewal counts
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(queue)")}
+        for column, ddl in [
+            ("lease_seconds", "lease_seconds REAL"),
+            ("renewals", "renewals INTEGER NOT NULL DEFAULT 0"),
+        ]:
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE queue ADD COLUMN {ddl}")
+        # Leased job id -> (renewals, monotonic time that count was first seen)
+        self._seen = {}
+
+    @classmethod
+    def for_folder(cls, input_folder: Path):
+        return cls(Path(input_folder) / QUEUE_NAME)
+
+    def _transaction(self, fn):
+        """Run fn(conn) inside BEGIN IMMEDIATE, so claims never race"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, jobs):
+        def insert(conn):
+            before = conn.total_changes
+            # A path that was finished before and exists again is new work
+            conn.executemany(
+                "INSERT INTO queue"
+                " (path, kind, options, priority, status, updated_at)"
+                " VALUES (?, ?, ?, ?, 'queued', ?)"
+                " ON CONFLICT(path) DO UPDATE SET"
+                " status = 'queued', options = excluded.options,"
+                " priority = excluded.priority, attempts = 0, error = NULL,"
+                " worker = NULL, updated_at = excluded.updated_at"
+                " WHERE status IN ('done', 'failed')",
+                [
+                    (path, kind, json.dumps(options), priority, time.time())
+                    for path, kind, options, priority in jobs
+                ],
+            )
+            return conn.total_changes - before
+
+        return self._transaction(insert)
+
+    def _expired(self, conn, lease_seconds) -> list[int]:
+        """
+        Ids of leases whose renewal count this process has seen unchanged
+        for their whole lease. Only this host's monotonic clock is used, so
+        skew between hosts can't make a live lease look expired.
+        """
+        now = time.monotonic()
+        seen = {}
+        expired = []
+        for id_, renewals, seconds in conn.execute(
+            "SELECT id, renewals, lease_seconds FROM queue WHERE status = 'leased'"
+        ):
+            count, since = self._seen.get(id_, (None, now))
+            if count != renewals:
+                since = now
+            seen[id_] = (renewals, since)
+            if now - since >= (seconds or lease_seconds):
+                expired.append(id_)
+        self._seen = seen
+        return expired
+
+    def claim(self, worker, lease_seconds, max_attempts):
+        def take(conn):
+            now = time.time()
+            expired = self._expired(conn, lease_seconds)
+            marks = ", ".join("?" * len(expired))
+            if expired:
+                conn.execute(
+                    "UPDATE queue SET status = 'failed', lease_until = NULL,"
+                    " error = 'worker died or stalled on every attempt',"
+                    f" updated_at = ? WHERE id IN ({marks}) AND attempts >= ?",
+                    (now, *expired, max_attempts),
+                )
+            row = conn.execute(
+                "SELECT id, path, kind, options, attempts, status, worker"
+                " FROM queue WHERE status = 'queued'"
+                f" OR (status = 'leased' AND id IN ({marks}))"
+                " ORDER BY priority DESC, id LIMIT 1",
+                expired,
+            ).fetchone()
+            if row is None:
+                return None
+
+            id_, path, kind, options, attempts, status, previous = row
+            stolen = status == "leased"
+            conn.execute(
+                "UPDATE queue SET status = 'leased', worker = ?, lease_until = ?,"
+                " lease_seconds = ?, renewals = renewals + 1,"
+                " attempts = attempts + 1, steals = steals + ?, updated_at = ?"
+                " WHERE id = ?",
+                (worker, now + lease_seconds, lease_seconds, int(stolen), now, id_),
+            )
+            return Job(
+                id_,
+                path,
+                kind,
+                json.loads(options),
+                attempts + 1,
+                stolen_from=previous if stolen else None,
+            )
+
+        return self._transaction(take)
+
+    def _update_if_owner(self, job, worker, sql, params) -> bool:
+        def update(conn):
+            cursor = conn.execute(
+                f"UPDATE queue SET {sql}, updated_at = ?"
+                " WHERE id = ? AND worker = ? AND status = 'leased'",
+                (*params, time.time(), job.id, worker),
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(update)
+
+    def renew(self, job, worker, lease_seconds):
+        # lease_until is informational; expiry is judged from renewals
+        return self._update_if_owner(
+            job,
+            worker,
+            "renewals = renewals + 1, lease_seconds = ?, lease_until = ?",
+            (lease_seconds, time.time() + lease_seconds),
+        )
+
+    def complete(self, job, worker):
+        return self._update_if_owner(
+            job, worker, "status = 'done', lease_until = NULL, error = NULL", ()
+        )
+
+    def fail(self, job, worker, error, max_attempts):
+        status = "failed" if job.attempts >= max_attempts else "queued"
+        return self._update_if_owner(
+            job, worker, "status = ?, lease_until = NULL, error = ?", (status, error)
+        )
+
+    def pending(self):
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM queue WHERE status IN ('queued', 'leased')"
+            ).fetchone()
+        return count
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*), SUM(steals) FROM queue GROUP BY status"
+            ).fetchall()
+        counts = {status: count for status, count, _ in rows}
+        counts["steals"] = sum(steals or 0 for _, _, steals in rows)
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def enqueue_folder(
+    input_folder: str,
+    queue: QueueBackend,
+    media_type: str = "both",
+    profiles: list[str] | None = None,
+    video_encoder_args: list[str] | None = None,
+) -> int:
+    """
+    Scan a folder and queue every image/video/animation in it. Videos and
+    animations are probed so workers pick up the longest ones first.
+    """
+    input_path = Path(input_folder)
+    files = list(scan_media(input_path, media_type, detect_animation=True))
+    videos = [f for f, type_ in files if type_ == "video"]
+    infos = index_for_folder(str(input_path)).probe_many(videos) if videos else {}
+
+    video_options = {
+        "profiles": profiles or [],
+        "encoder_args": video_encoder_args or VIDEO_ENCODER_ARGS,
+    }
+    jobs = []
+    for f, type_ in files:
+        relative = str(f.relative_to(input_path))
+        if type_ == "image":
+            jobs.append((relative, "image", {}, 0.0))
+        elif type_ == "animation":
+            info = animation_info(f) or {}
+            jobs.append((relative, "animation", {}, info.get("duration") or 0))
+        else:
+            info = infos.get(str(f.resolve())) or {}
+            jobs.append((relative, "video", video_options, info.get("duration") or 0))
+    return queue.enqueue(jobs)
+
+
+def _run_job(job: Job, input_path: Path, threads: int | None) -> tuple[bool, str]:
+    file_path = input_path / job.path
+    if not file_path.exists():
+        return False, f"{job.path} no longer exists"
+
+    if job.kind == "image":
+        return convert_single_image(
+            file_path, input_path / "JPG_CONVERTED", threads=threads
+        )
+    if job.kind == "animation":
+        return convert_animation(
+            file_path, input_path / "MP4_CONVERTED", threads=threads
+        )
+
+    profiles = job.options.get("profiles") or []
+    for name in profiles:
+        (input_path / PROFILES[name]["folder"]).mkdir(exist_ok=True)
+    convert = partial(
+        convert_single_video,
+        encoder_args=job.options.get("encoder_args"),
+        profiles=profiles,
+    )
+    return convert(file_path, input_path / "MP4_CONVERTED", threads=threads)
+
+
+def _run_in_child(job: Job, input_path: Path, threads: int | None, conn):
+    """
+    Child process side of _convert_leased. It leads its own process group,
+    so killing the group also stops the ffmpeg it started.
+    """
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    try:
+        result = _run_job(job, input_path, threads)
+    except Exception as e:
+        result = False, f"Error processing {job.path}: {str(e)}"
+    conn.send(result)
+
+
+def _kill(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+        # No process groups here, or the child hadn't made its own yet
+        process.kill()
+
+
+def _convert_leased(
+    job: Job,
+    input_path: Path,
+    threads: int | None,
+    queue: QueueBackend,
+    worker: str,
+    lease_seconds: float,
+) -> tuple[bool, str] | None:
+    """
+    Convert a job in a child process while renewing its lease. If a renewal
+    fails, another worker owns the job now: the child is killed and None is
+    returned. A child that dies without a result (e.g. a decoder crash)
+    fails the job instead of the worker.
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    child = multiprocessing.Process(
+        target=_run_in_child, args=(job, input_path, threads, sender)
+    )
+    child.start()
+    sender.close()
+    try:
+        while not receiver.poll(lease_seconds / 3):
+            if not queue.renew(job, worker, lease_seconds):
+                _kill(child)
+                return None
+        try:
+            return receiver.recv()
+        except EOFError:
+            child.join()
+            return False, f"{job.path}: conversion exited with code {child.exitcode}"
+    except BaseException:
+        _kill(child)
+        raise
+    finally:
+        child.join()
+        receiver.close()
+
+
+def run_worker(
+    input_folder: str,
+    queue: QueueBackend,
+    worker: str | None = None,
+    lease_seconds: float = 300.0,
+    max_attempts: int = 3,
+    threads: int | None = None,
+    poll_seconds: float = 5.0,
+) -> dict:
+    """
+    Claim and convert jobs until the queue has no queued or leased work
+    left. While other workers still hold leases this one keeps polling, so
+    it can take over their jobs if they die. Returns per-outcome counts.
+    """
+    input_path = Path(input_folder)
+    worker = worker or f"{platform.node()}:{os.getpid()}"
+    (input_path / "JPG_CONVERTED").mkdir(exist_ok=True)
+    (input_path / "MP4_CONVERTED").mkdir(exist_ok=True)
+    stats = {"done": 0, "failed": 0, "lost": 0, "stolen": 0}
+
+    while True:
+        job = queue.claim(worker, lease_seconds, max_attempts)
+        if job is None:
+            if not queue.pending():
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        if job.stolen_from:
+            stats["stolen"] += 1
+            print(f"Took over {job.path} from {job.stolen_from} (lease expired)")
+
+        result = _convert_leased(job, input_path, threads, queue, worker, lease_seconds)
+        if result is None:
+            recorded = False
+        else:
+            success, msg = result
+            if success:
+                recorded = queue.complete(job, worker)
+            else:
+                recorded = queue.fail(job, worker, msg, max_attempts)
+
+        if not recorded:
+            stats["lost"] += 1
+            print(f"Lost the lease on {job.path}; another worker took it over")
+        elif success:
+            stats["done"] += 1
+            print(msg)
+        else:
+            stats["failed"] += 1
+            print(f"Error (attempt {job.attempts}/{max_attempts}): {msg}")
+
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=["enqueue", "work", "status"])
+    parser.add_argument("folder")
+    parser.add_argument(
+        "--queue", help=f"queue database (default: <folder>/{QUEUE_NAME})"
+    )
+    parser.add_argument("--media", choices=["both", "images", "videos"], default="both")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=[])
+    parser.add_argument("--lease", type=float, default=300.0, help="lease seconds")
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--threads", type=int, help="ffmpeg threads per job")
+    args = parser.parse_args(argv)
+
+    queue = (
+        SQLiteQueue(Path(args.queue))
+        if args.queue
+        else SQLiteQueue.for_folder(Path(args.folder))
+    )
+    try:
+        if args.command == "enqueue":
+            added = enqueue_folder(args.folder, queue, args.media, args.profiles)
+            print(f"Queued {added} new jobs")
+        elif args.command == "work":
+            stats = run_worker(
+                args.folder,
+                queue,
+                lease_seconds=args.lease,
+                max_attempts=args.max_attempts,
+                threads=args.threads,
+            )
+            print(
+                f"Worker finished: {stats['done']} done, {stats['failed']} failed, "
+                f"{stats['stolen']} taken over, {stats['lost']} lost"
+            )
+        print(json.dumps(queue.counts()))
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+MANIFEST_NAME = ".conversion_manifest.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT,
+    settings_hash TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    output TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+def settings_hash(settings) -> str:
+    """Stable hash of an encoder settings object (list/dict of args)"""
+    blob = json.dumps(settings, sort_keys=True)
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+def content_hash(file_path: Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-1 of the file contents, read in chunks"""
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ConversionManifest:
+    """
+    Persistent record of conversion jobs, stored in SQLite next to the
+    output folders. Each input is keyed on its path and fingerprinted by
+    size, mtime and (optionally) a content hash, so a re-run can skip
+    inputs that were already converted with the same encoder settings.
+    """
+
+    def __init__(self, db_path: Path, hash_content: bool = False):
+        self.db_path = Path(db_path)
+        self.hash_content = hash_content
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    @classmethod
+    def for_folder(cls, input_folder: Path, hash_content: bool = False):
+        """Open (or create) the manifest that lives in an input folder"""
+        return cls(Path(input_folder) / MANIFEST_NAME, hash_content=hash_content)
+
+    def fingerprint(self, file_path: Path) -> tuple[int, int, str | None]:
+        stat = file_path.stat()
+        digest = content_hash(file_path) if self.hash_content else None
+        return stat.st_size, stat.st_mtime_ns, digest
+
+    def should_skip(self, file_path: Path, settings) -> bool:
+        """True if this exact input was already converted with these settings"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, content_hash, settings_hash, output, status"
+                " FROM jobs WHERE path = ?",
+                (str(file_path),),
+            ).fetchone()
+        if row is None:
+            return False
+
+        size, mtime_ns, digest, s_hash, output, status = row
+        if status != "done" or s_hash != settings_hash(settings):
+            return False
+        if not output or not Path(output).exists():
+            return False
+
+        stat = file_path.stat()
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            return False
+        if self.hash_content and digest != content_hash(file_path):
+            return False
+        return True
+
+    def mark_started(self, file_path: Path, output_path: Path, settings):
+        """Record a job as running; called before the source is touched"""
+        size, mtime_ns, digest = self.fingerprint(file_path)
+        self._upsert(
+            file_path, size, mtime_ns, digest, settings, output_path, "running", None
+        )
+
+    def mark_done(self, file_path: Path, output_path: Path):
+        self._set_status(file_path, "done", None, output_path)
+
+    def mark_failed(self, file_path: Path, error: str):
+        self._set_status(file_path, "failed", error, None)
+
+    def unfinished(self) -> list[str]:
+        """Paths of jobs that were started but never completed"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM jobs WHERE status IN ('running', 'failed')"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _upsert(
+        self, file_path, size, mtime_ns, digest, settings, output_path, status, error
+    ):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (path, size, mtime_ns, content_hash, settings_hash,"
+                " settings, output, status, error, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(path) DO UPDATE SET size = excluded.size,"
+                " mtime_ns = excluded.mtime_ns, content_hash = excluded.content_hash,"
+                " settings_hash = excluded.settings_hash, settings = excluded.settings,"
+                " output = excluded.output, status = excluded.status,"
+                " error = excluded.error, updated_at = excluded.updated_at",
+                (
+                    str(file_path),
+                    size,
+                    mtime_ns,
+                    digest,
+                    settings_hash(settings),
+                    json.dumps(settings, sort_keys=True),
+                    str(output_path) if output_path else None,
+                    status,
+                    error,
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+
+    def _set_status(self, file_path, status, error, output_path):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?,"
+                " output = COALESCE(?, output), updated_at = ? WHERE path = ?",
+                (
+                    status,
+                    error,
+                    str(output_path) if output_path else None,
+                    time.time(),
+                    str(file_path),
+                ),
+            )
+            self._conn.commit()
+
+
+def run_tracked(
+    convert,
+    file_path: Path,
+    output_path: Path,
+    settings,
+    manifest: ConversionManifest | None,
+    **kwargs,
+) -> tuple[bool, str]:
+    """Run a converter and record its start/outcome in the manifest"""
+    if manifest is None:
+        return convert(file_path, output_path.parent, **kwargs)
+
+    manifest.mark_started(file_path, output_path, settings)
+    success, msg = convert(file_path, output_path.parent, **kwargs)
+    if success:
+        manifest.mark_done(file_path, output_path)
+    else:
+        manifest.mark_failed(file_path, msg)
+    return success, msg
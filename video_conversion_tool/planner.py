@@ -0,0 +1,417 @@
+"""
+Dry-run planner: predict what a conversion will cost before running it.
+
+    python cli.py /path/to/folder --plan [same options as the real run]
+
+Inputs are scanned and probed (probes go to the same cache as a real run)
+but nothing is encoded. Each job is classified as skip, move, remux or
+transcode and costed from per-host throughput stored with the calibration
+results. The plan is saved in the input folder; the next real run compares
+itself against it and folds the measured rates back into the store, so
+estimates for a host improve with every run.
+"""
+
+import heapq
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from animation import animation_info
+from calibrate import load_tuning, save_tuning
+from convert_both import (
+    VIDEO_ENCODER_ARGS,
+    image_command,
+    manifest_settings,
+    over_budget,
+    scan_media,
+)
+from fastpath import looks_like_h264_mp4
+from manifest import ConversionManifest
+from probe_index import index_for_folder
+from remux import plan_video_conversion
+from scheduler import split_budget
+
+PLAN_FILENAME = ".conversion_plan.json"
+
+# Video work is counted in media seconds at 1080p, so one rate covers
+# sources of any resolution
+REFERENCE_PIXELS = 1920 * 1080
+
+# Work per CPU-second until a host has measured its own: 1080p media
+# seconds for x264 by -preset, remuxes and animations, input bytes for images
+PRESET_RATES = {
+    "ultrafast": 4.0,
+    "superfast": 3.0,
+    "veryfast": 2.0,
+    "faster": 1.2,
+    "fast": 0.8,
+    "medium": 0.5,
+    "slow": 0.25,
+    "slower": 0.12,
+    "veryslow": 0.05,
+}
+DEFAULT_RATES = {"remux": 100.0, "remux_audio": 20.0, "animation": 0.5, "image": 1e7}
+DEFAULT_SIZE_RATIOS = {
+    "transcode": 0.5,
+    "remux": 1.0,
+    "remux_audio": 1.0,
+    "animation": 0.3,
+    "image": 0.6,
+}
+
+# Measurements from earlier runs count this much against each new one, so
+# the stored rates follow changes to the machine
+HISTORY_WEIGHT = 0.5
+
+ACTIONS = ["skip", "move", "remux", "transcode"]
+
+
+def _preset(encoder_args: list[str]) -> str:
+    args = list(encoder_args)
+    return args[args.index("-preset") + 1] if "-preset" in args else "medium"
+
+
+def _scaled_duration(info: dict | None) -> float:
+    """Duration in 1080p media seconds"""
+    info = info or {}
+    pixels = (info.get("width") or 1920) * (info.get("height") or 1080)
+    return (info.get("duration") or 0.0) * pixels / REFERENCE_PIXELS
+
+
+def _classify_video(
+    f: Path, info: dict | None, encoder_args: list[str], max_bytes: int | None
+) -> tuple[str, str | None, float]:
+    """(action, rate key, work) for a video, mirroring convert_single_video"""
+    transcode_key = f"transcode:{(info or {}).get('codec')}/{_preset(encoder_args)}"
+    if over_budget(f, max_bytes):
+        # Two passes over the source
+        return "transcode", transcode_key, 2 * _scaled_duration(info)
+    if f.suffix.lower() == ".mp4" and looks_like_h264_mp4(f, info):
+        return "move", None, 0.0
+    label, _ = plan_video_conversion(f, encoder_args, info or {})
+    if label == "Remuxed":
+        return "remux", "remux", (info or {}).get("duration") or 0.0
+    if label.startswith("Remuxed"):
+        return "remux", "remux_audio", (info or {}).get("duration") or 0.0
+    return "transcode", transcode_key, _scaled_duration(info)
+
+
+def _default_rate(key: str) -> float:
+    if key.startswith("transcode:"):
+        return PRESET_RATES.get(key.rsplit("/", 1)[1], PRESET_RATES["medium"])
+    return DEFAULT_RATES[key]
+
+
+def predict_wall(jobs: list[dict], cores: int, video_threads: int, image_share: int):
+    """
+    Makespan of the jobs under BudgetScheduler's rules: videos longest first,
+    each holding video_threads cores, and images on image_share cores while
+    videos are queued (on every core once they are done)
+    """
+    video_walls = sorted(
+        (j["wall_seconds"] for j in jobs if j["kind"] == "video"), reverse=True
+    )
+    image_cpu = sum(j["cpu_seconds"] for j in jobs if j["kind"] == "image")
+
+    video_cores = cores - image_share if image_cpu else cores
+    slots = [0.0] * max(1, video_cores // video_threads)
+    for wall in video_walls:
+        heapq.heapreplace(slots, slots[0] + wall)
+    video_end = max(slots)
+
+    if image_cpu <= image_share * video_end:
+        image_end = image_cpu / image_share
+    else:
+        image_end = video_end + (image_cpu - image_share * video_end) / cores
+    return max(video_end, image_end)
+
+
+def plan_media(
+    input_folder: str,
+    media_type: str = "both",
+    cpu_budget: int | None = None,
+    video_threads: int | None = None,
+    image_workers: int | None = None,
+    incremental: bool = True,
+    hash_content: bool = False,
+    video_encoder_args: list[str] | None = None,
+    profiles: list[str] | None = None,
+    image_target: dict | None = None,
+    video_max_bytes: int | None = None,
+    profile_budgets: dict[str, int] | None = None,
+) -> dict:
+    """
+    Classify and cost every job convert_media would run with the same
+    arguments. Returns the plan: per-job action, CPU and wall seconds and
+    output bytes, plus the predicted wall time at that concurrency.
+    Profile outputs are not costed separately; runs with profiles measure
+    them into the transcode rates.
+    """
+    input_path = Path(input_folder)
+    encoder_args = video_encoder_args or VIDEO_ENCODER_ARGS
+    settings_by_type = manifest_settings(
+        encoder_args, profiles, image_target, video_max_bytes, profile_budgets
+    )
+    budget = split_budget(cpu_budget)
+    cores = budget["cores"]
+    video_threads = min(video_threads or budget["video_threads"], cores)
+    image_share = image_workers or budget["image_share"]
+    throughput = (load_tuning() or {}).get("throughput", {})
+
+    manifest = (
+        ConversionManifest.for_folder(input_path, hash_content=hash_content)
+        if incremental
+        else None
+    )
+    entries = []
+    for f, type_ in scan_media(input_path, media_type, detect_animation=True):
+        skip = manifest is not None and manifest.should_skip(f, settings_by_type[type_])
+        entries.append((f, type_, skip))
+    if manifest is not None:
+        manifest.close()
+
+    videos = [f for f, type_, skip in entries if type_ == "video" and not skip]
+    infos = index_for_folder(str(input_path)).probe_many(videos) if videos else {}
+
+    jobs = []
+    measured_keys = set()
+
+    def rates(key):
+        """(work per CPU-second, output/input bytes) for a rate key"""
+        stored = throughput.get(key)
+        if stored:
+            measured_keys.add(key)
+            return (
+                stored["work"] / stored["cpu_seconds"],
+                stored["output_bytes"] / stored["input_bytes"],
+            )
+        return _default_rate(key), DEFAULT_SIZE_RATIOS[key.split(":")[0]]
+
+    for f, type_, skip in entries:
+        input_bytes = f.stat().st_size
+        kind = "image" if type_ == "image" else "video"
+        threads = video_threads
+        if skip:
+            action, key, work = "skip", None, 0.0
+        elif type_ == "image":
+            threads = 1
+            # Mirrors convert_single_image: only JPGs that pass the check move
+            if not image_target and image_command(f, input_path) is None:
+                action, key, work = "move", None, 0.0
+            else:
+                action, key, work = "transcode", "image", float(input_bytes)
+        elif type_ == "animation":
+            info = animation_info(f)
+            action, key, work = "transcode", "animation", _scaled_duration(info)
+        else:
+            info = infos.get(str(f.resolve()))
+            # Remuxes hold video_threads cores in the real run too, and the
+            # trace measures them with that count (see compare_with_plan)
+            action, key, work = _classify_video(f, info, encoder_args, video_max_bytes)
+
+        cpu_seconds, output_bytes = 0.0, 0
+        if action in ("move", "remux"):
+            output_bytes = input_bytes
+        if key is not None:
+            rate, ratio = rates(key)
+            cpu_seconds = work / rate
+            output_bytes = int(input_bytes * ratio)
+            if video_max_bytes is not None and kind == "video" and work:
+                if (
+                    type_ == "video"
+                    and output_bytes > video_max_bytes
+                    and not over_budget(f, video_max_bytes)
+                ):
+                    # convert_single_video refits the output in two passes
+                    refit_key = f"transcode:{(info or {}).get('codec')}/"
+                    refit_key += _preset(encoder_args)
+                    cpu_seconds += 2 * _scaled_duration(info) / rates(refit_key)[0]
+                output_bytes = min(output_bytes, video_max_bytes)
+
+        output_folder = "JPG_CONVERTED" if kind == "image" else "MP4_CONVERTED"
+        extension = ".jpg" if kind == "image" else ".mp4"
+        jobs.append(
+            {
+                "path": str(f),
+                "folder": str(f.parent.relative_to(input_path)),
+                "kind": kind,
+                "action": action,
+                "key": key,
+                "work": work,
+                "input_bytes": input_bytes,
+                "output": str(input_path / output_folder / f"{f.stem}{extension}"),
+                "output_bytes": output_bytes,
+                "cpu_seconds": cpu_seconds,
+                "wall_seconds": cpu_seconds / threads,
+            }
+        )
+
+    return {
+        "created_at": time.time(),
+        "cores": cores,
+        "video_threads": video_threads,
+        "image_share": image_share,
+        "measured_keys": sorted(measured_keys),
+        "wall_seconds": predict_wall(jobs, cores, video_threads, image_share),
+        "jobs": jobs,
+    }
+
+
+def format_duration(seconds: float) -> str:
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    return f"{minutes}m{secs:02d}s" if minutes else f"{secs}s"
+
+
+def format_bytes(size: float) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+def format_plan(plan: dict) -> str:
+    """Per-folder table of job counts, CPU time and output size, plus totals"""
+    folders = defaultdict(lambda: {"counts": defaultdict(int), "cpu": 0.0, "out": 0})
+    for job in plan["jobs"]:
+        for name in (job["folder"], "Total"):
+            folders[name]["counts"][job["action"]] += 1
+            folders[name]["cpu"] += job["cpu_seconds"]
+            if job["action"] != "skip":
+                folders[name]["out"] += job["output_bytes"]
+
+    width = max([len(name) for name in folders] + [6])
+    header = "".join(f"{action.capitalize():>10}" for action in ACTIONS)
+    lines = [f"{'Folder':<{width}}{header}{'CPU time':>12}{'Output':>12}"]
+    for name in sorted(folders, key=lambda n: (n == "Total", n)):
+        row = folders[name]
+        counts = "".join(f"{row['counts'][action]:>10}" for action in ACTIONS)
+        lines.append(
+            f"{name:<{width}}{counts}{format_duration(row['cpu']):>12}"
+            f"{format_bytes(row['out']):>12}"
+        )
+
+    wall = plan["wall_seconds"]
+    finish = time.strftime("%a %H:%M", time.localtime(time.time() + wall))
+    lines.append(
+        f"Predicted wall time: {format_duration(wall)} on {plan['cores']} cores, "
+        f"{plan['video_threads']} threads per video (done around {finish})"
+    )
+    keys = {job["key"] for job in plan["jobs"] if job["key"]}
+    guessed = sorted(keys - set(plan["measured_keys"]))
+    if guessed:
+        lines.append(f"No measurements on this host yet for: {', '.join(guessed)}")
+    return "\n".join(lines)
+
+
+def save_plan(plan: dict, input_folder: str) -> Path:
+    plan_path = Path(input_folder) / PLAN_FILENAME
+    plan_path.write_text(json.dumps(plan))
+    return plan_path
+
+
+def _percent_off(predicted: float, actual: float) -> str:
+    return f"{(predicted - actual) / actual:+.0%}" if actual else "n/a"
+
+
+def compare_with_plan(input_folder: str, trace_path: str | None = None) -> dict | None:
+    """
+    Check a saved plan against the trace of the run that followed it and
+    fold the measured rates and size ratios into this host's store. The
+    plan is consumed. Returns the comparison, or None without a plan (or
+    without a trace newer than it).
+    """
+    input_path = Path(input_folder)
+    plan_path = input_path / PLAN_FILENAME
+    trace_path = Path(trace_path or input_path / ".conversion_trace.json")
+    try:
+        plan = json.loads(plan_path.read_text())
+        if trace_path.stat().st_mtime < plan["created_at"]:
+            return None
+        events = json.loads(trace_path.read_text())["traceEvents"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+    jobs = {job["path"]: job for job in plan["jobs"]}
+    # Rate key -> [work, CPU seconds, input bytes, output bytes]
+    measured = defaultdict(lambda: [0.0, 0.0, 0, 0])
+    done = set()
+    actual_cpu = 0.0
+    for event in events:
+        args = event.get("args", {})
+        paths = args.get("paths") or ([args["path"]] if "path" in args else [])
+        ran = [jobs[p] for p in paths if p in jobs]
+        if not ran or args.get("success") is False:
+            continue
+        cpu = event["dur"] / 1e6 * args.get("threads", 1)
+        actual_cpu += cpu
+        # Batches are split over their files by planned work
+        total_work = sum(job["work"] for job in ran)
+        for job in ran:
+            done.add(job["path"])
+            if job["key"] and total_work:
+                measured[job["key"]][0] += job["work"]
+                measured[job["key"]][1] += cpu * job["work"] / total_work
+
+    actual_out = 0
+    for path in done:
+        job = jobs[path]
+        try:
+            size = Path(job["output"]).stat().st_size
+        except OSError:
+            continue
+        actual_out += size
+        if job["key"]:
+            measured[job["key"]][2] += job["input_bytes"]
+            measured[job["key"]][3] += size
+
+    tuning = load_tuning() or {}
+    store = tuning.setdefault("throughput", {})
+    for key, (work, cpu, input_bytes, output_bytes) in measured.items():
+        if work <= 0 or cpu <= 0 or input_bytes <= 0:
+            continue
+        old = store.get(key, {})
+        store[key] = {
+            "work": HISTORY_WEIGHT * old.get("work", 0.0) + work,
+            "cpu_seconds": HISTORY_WEIGHT * old.get("cpu_seconds", 0.0) + cpu,
+            "input_bytes": HISTORY_WEIGHT * old.get("input_bytes", 0) + input_bytes,
+            "output_bytes": HISTORY_WEIGHT * old.get("output_bytes", 0) + output_bytes,
+        }
+    save_tuning(tuning)
+    plan_path.unlink()
+
+    starts = [event["ts"] for event in events]
+    ends = [event["ts"] + event["dur"] for event in events]
+    planned = [job for job in plan["jobs"] if job["action"] != "skip"]
+    return {
+        "jobs_planned": len(planned),
+        "jobs_run": len(done),
+        "wall_seconds": (plan["wall_seconds"], (max(ends) - min(starts)) / 1e6),
+        "cpu_seconds": (sum(job["cpu_seconds"] for job in planned), actual_cpu),
+        "output_bytes": (
+            sum(job["output_bytes"] for job in planned if job["path"] in done),
+            actual_out,
+        ),
+    }
+
+
+def format_comparison(comparison: dict) -> str:
+    lines = [
+        f"Plan vs actual ({comparison['jobs_run']} of "
+        f"{comparison['jobs_planned']} planned jobs ran)"
+    ]
+    for label, field, fmt in [
+        ("Wall time", "wall_seconds", format_duration),
+        ("CPU time", "cpu_seconds", format_duration),
+        ("Output", "output_bytes", format_bytes),
+    ]:
+        predicted, actual = comparison[field]
+        lines.append(
+            f"{label}: predicted {fmt(predicted)}, actual {fmt(actual)} "
+            f"({_percent_off(predicted, actual)})"
+        )
+    return "\n".join(lines)
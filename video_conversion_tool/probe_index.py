@@ -0,0 +1,261 @@
+import concurrent.futures
+import json
+import os
+import subprocess
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+PROBE_CACHE_NAME = ".probe_cache.json"
+
+
+def _parse_rate(rate: str | None) -> float | None:
+    """Turn an ffprobe rate like '30000/1001' into a float"""
+    if not rate:
+        return None
+    try:
+        num, _, den = rate.partition("/")
+        den = float(den) if den else 1.0
+        return float(num) / den if den else None
+    except ValueError:
+        return None
+
+
+def _to_number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rotation(stream: dict) -> int:
+    """Rotation in degrees from either the rotate tag or display matrix"""
+    rotate = stream.get("tags", {}).get("rotate")
+    if rotate is not None:
+        return int(_to_number(rotate, int) or 0) % 360
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            return int(_to_number(side_data["rotation"], int) or 0) % 360
+    return 0
+
+
+def probe_file(file_path) -> dict | None:
+    """
+    Probe a media file with a single ffprobe call covering all streams and
+    the container, and flatten the fields we care about into a dict.
+    """
+    cmd = [
+        "ffprobe",
+        "-v",
+        "quiet",
+        "-print_format",
+        "json",
+        "-show_streams",
+        "-show_format",
+        str(file_path),
+    ]
+    try:
+        data = json.loads(subprocess.check_output(cmd))
+    except (subprocess.CalledProcessError, OSError, ValueError):
+        return None
+
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    fmt = data.get("format", {})
+
+    info = {
+        "width": None,
+        "height": None,
+        "codec": None,
+        "pix_fmt": None,
+        "fps": None,
+        "rotation": 0,
+        "audio_codec": audio.get("codec_name") if audio else None,
+        "audio_channels": audio.get("channels") if audio else None,
+        "audio_rate": _to_number(audio.get("sample_rate"), int) if audio else None,
+        "duration": _to_number(fmt.get("duration")),
+        "bit_rate": _to_number(fmt.get("bit_rate"), int),
+        "format": fmt.get("format_name"),
+        "nb_frames": None,
+        "video_duration": None,
+        "audio_duration": _to_number(audio.get("duration")) if audio else None,
+    }
+    if video:
+        info.update(
+            width=_to_number(video.get("width"), int),
+            height=_to_number(video.get("height"), int),
+            codec=video.get("codec_name"),
+            pix_fmt=video.get("pix_fmt"),
+            fps=_parse_rate(video.get("avg_frame_rate"))
+            or _parse_rate(video.get("r_frame_rate")),
+            rotation=_rotation(video),
+            nb_frames=_to_number(video.get("nb_frames"), int),
+            video_duration=_to_number(video.get("duration")),
+        )
+        if info["duration"] is None:
+            info["duration"] = _to_number(video.get("duration"))
+    return info
+
+
+def keyframe_times(
+    file_path: Path, around: list[float] | None = None, window: float = 10.0
+) -> list[float]:
+    """
+    Timestamps of the video keyframes, read from packet flags so nothing
+    has to be decoded. around limits the read to the window seconds after
+    each of those offsets (-read_intervals); without it the whole file is
+    demuxed, which is a full read of a long video.
+    """
+    if around is not None and not around:
+        return []
+    cmd = ["ffprobe", "-v", "quiet", "-select_streams", "v:0"]
+    if around is not None:
+        intervals = ",".join(f"{t:.3f}%+{window:g}" for t in sorted(around))
+        cmd += ["-read_intervals", intervals]
+    cmd += [
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-of",
+        "csv=p=0",
+        str(file_path),
+    ]
+    try:
+        output = subprocess.check_output(cmd, text=True)
+    except (subprocess.CalledProcessError, OSError):
+        return []
+
+    times = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                times.append(float(pts_time))
+            except ValueError:
+                continue
+    # Overlapping windows can list a packet twice
+    return sorted(set(times))
+
+
+class ProbeIndex:
+    """
+    Cache of probe_file results, persisted as JSON and keyed on absolute
+    path. An entry is reused while the file's size and mtime are unchanged.
+    Missing or stale entries are probed concurrently.
+    """
+
+    def __init__(self, cache_path: Path | None = None, max_workers: int = 8):
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.max_workers = max_workers
+        self.entries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if self.cache_path is None or not self.cache_path.exists():
+            return
+        try:
+            self.entries = json.loads(self.cache_path.read_text())
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        """
+        Write the cache atomically. Saves are serialized, and the temp file
+        is unique to this process and thread, so concurrent savers (other
+        threads, or workers sharing the folder) never replace each other's
+        half-written file.
+        """
+        if self.cache_path is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                blob = json.dumps(self.entries)
+            tmp = self.cache_path.with_name(
+                f"{self.cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            tmp.write_text(blob)
+            os.replace(tmp, self.cache_path)
+
+    def _fresh(self, key: str, stat: os.stat_result) -> dict | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return entry["info"]
+
+    def get(self, file_path, save: bool = True) -> dict | None:
+        """Metadata for one file, probing it if the cache is stale"""
+        key = str(Path(file_path).resolve())
+        return self.probe_many([file_path], save).get(key)
+
+    def probe_many(self, paths, save: bool = True) -> dict[str, dict | None]:
+        """
+        Metadata for many files; cache misses are probed in parallel.
+        save=False leaves writing the cache to a later save(), for callers
+        probing one file at a time that would otherwise rewrite it per file.
+        """
+        results = {}
+        missing = []
+        for path in paths:
+            key = str(Path(path).resolve())
+            try:
+                stat = os.stat(key)
+            except OSError:
+                results[key] = None
+                continue
+            info = self._fresh(key, stat)
+            if info is None:
+                missing.append((key, stat))
+            else:
+                results[key] = info
+
+        if missing:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers
+            ) as executor:
+                probed = executor.map(lambda item: probe_file(item[0]), missing)
+                for (key, stat), info in zip(missing, probed):
+                    results[key] = info
+                    if info is not None:
+                        with self._lock:
+                            self.entries[key] = {
+                                "size": stat.st_size,
+                                "mtime_ns": stat.st_mtime_ns,
+                                "info": info,
+                            }
+            if save:
+                self.save()
+        return results
+
+    def probe_folder(self, directory, extensions=(".mp4",)) -> dict[str, dict]:
+        """Probe every file in a folder (non-recursive) with a given extension"""
+        paths = [
+            entry.path
+            for entry in os.scandir(directory)
+            if entry.is_file() and entry.name.lower().endswith(tuple(extensions))
+        ]
+        return {k: v for k, v in self.probe_many(paths).items() if v is not None}
+
+    @staticmethod
+    def largest(infos: dict[str, dict], field: str) -> tuple[str, float]:
+        """(path, value) of the entry with the largest value for field"""
+        best = ("", 0)
+        for path, info in infos.items():
+            value = info.get(field) or 0
+            if value > best[1]:
+                best = (path, value)
+        return best
+
+    @staticmethod
+    def total(infos: dict[str, dict], field: str = "duration") -> float:
+        """Sum of a numeric field, e.g. total duration in seconds"""
+        return sum(info.get(field) or 0 for info in infos.values())
+
+
+@lru_cache(maxsize=None)
+def index_for_folder(directory: str, max_workers: int = 8) -> ProbeIndex:
+    """Shared ProbeIndex whose cache file lives inside directory"""
+    return ProbeIndex(Path(directory) / PROBE_CACHE_NAME, max_workers=max_workers)
@@ -0,0 +1,109 @@
+from pathlib import Path
+
+# Derived outputs that can be produced alongside the main MP4 from a single
+# decode of the source. Each lands in its own folder next to MP4_CONVERTED.
+PROFILES = {
+    "preview": {
+        "folder": "PREVIEW_CONVERTED",
+        "extension": ".mp4",
+        "max_height": 480,
+        "audio": True,
+        "args": [
+            "-c:v",
+            "libx264",
+            "-crf",
+            "30",
+            "-preset",
+            "veryfast",
+            "-pix_fmt",
+            "yuv420p",
+            "-c:a",
+            "aac",
+            "-b:a",
+            "96k",
+            "-movflags",
+            "+faststart",
+        ],
+    },
+    "poster": {
+        "folder": "POSTER_CONVERTED",
+        "extension": ".jpg",
+        "max_height": 720,
+        "audio": False,
+        "still": True,
+        "args": ["-frames:v", "1", "-q:v", "3"],
+    },
+}
+
+PROFILE_FOLDERS = {profile["folder"] for profile in PROFILES.values()}
+
+
+def profile_output(output_folder: Path, name: str, stem: str) -> Path:
+    """Where a profile's output goes, given the main MP4 output folder"""
+    profile = PROFILES[name]
+    return output_folder.parent / profile["folder"] / f"{stem}{profile['extension']}"
+
+
+def poster_time(duration: float | None) -> float:
+    """Grab the poster a little way in, since first frames are often black"""
+    return min(3.0, 0.1 * duration) if duration else 0.0
+
+
+def build_profile_command(
+    file_path: Path,
+    output_folder: Path,
+    main_args: list[str] | None,
+    profiles: list[str],
+    info: dict | None = None,
+    threads: int | None = None,
+) -> list[str]:
+    """
+    One ffmpeg command that decodes the source once and splits the video
+    through a filtergraph into the main MP4 (unless main_args is None) and
+    every requested profile (at least one is required). A stream-copy main
+    output ("-c copy" / "-c:v copy") reads input packets and skips the split.
+    """
+    copy_main = main_args is not None and "copy" in main_args
+    encode_main = main_args is not None and not copy_main
+
+    branches = len(profiles) + (1 if encode_main else 0)
+    labels = [f"[s{i}]" for i in range(branches)]
+    graph = [f"[0:v]split={branches}{''.join(labels)}"]
+
+    # -threads is an output option, so every output gets its own copy
+    threads_args = ["-threads", str(threads)] if threads else []
+    outputs = []
+    if main_args is not None:
+        video = "[s0]" if encode_main else "0:v:0"
+        outputs += [
+            "-map",
+            video,
+            "-map",
+            "0:a:0?",
+            *main_args,
+            *threads_args,
+            "-movflags",
+            "+faststart",
+            str(output_folder / f"{file_path.stem}.mp4"),
+        ]
+
+    first = 1 if encode_main else 0
+    for i, name in enumerate(profiles, start=first):
+        profile = PROFILES[name]
+        chain = f"scale=-2:'min({profile['max_height']},ih)'"
+        if profile.get("still"):
+            t = poster_time((info or {}).get("duration"))
+            chain = f"select=gte(t\\,{t:.3f}),{chain}"
+        graph.append(f"[s{i}]{chain}[o{i}]")
+
+        outputs += ["-map", f"[o{i}]"]
+        if profile["audio"]:
+            outputs += ["-map", "0:a:0?"]
+        outputs += [
+            *profile["args"],
+            *threads_args,
+            str(profile_output(output_folder, name, file_path.stem)),
+        ]
+
+    cmd = ["ffmpeg", "-y", "-i", str(file_path), "-filter_complex", ";".join(graph)]
+    return cmd + outputs
@@ -0,0 +1,178 @@
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from tqdm import tqdm
+
+# Keys ffmpeg prints in each -progress block that we keep
+PROGRESS_FIELDS = {
+    "frame": int,
+    "fps": float,
+    "total_size": int,
+    "out_time_us": int,
+    "speed": lambda v: float(v.rstrip("x")),
+}
+
+
+class ProgressBlocks:
+    """Turns ffmpeg -progress output, fed line by line, into metric dicts"""
+
+    def __init__(self):
+        self.block = {}
+        self.last = {}
+
+    def feed(self, line: str) -> dict | None:
+        """Returns the finished block when line ends one, else None"""
+        key, _, value = line.strip().partition("=")
+        if key == "progress":
+            metrics, self.block = self.block, {}
+            if "out_time_us" in metrics:
+                metrics["out_time"] = metrics["out_time_us"] / 1e6
+            self.last = metrics
+            return metrics
+        if key in PROGRESS_FIELDS:
+            try:
+                self.block[key] = PROGRESS_FIELDS[key](value)
+            except ValueError:
+                pass
+        return None
+
+
+def progress_command(cmd: list[str]) -> list[str]:
+    """Make ffmpeg report progress on stdout instead of stats on stderr"""
+    return [cmd[0], "-nostats", "-progress", "pipe:1", *cmd[1:]]
+
+
+def run_ffmpeg(cmd: list[str], on_progress=None, stderr_lines: int = 50) -> dict:
+    """
+    Run an ffmpeg command with -progress on stdout and return the last
+    progress block (frame, fps, speed, out_time, output size).
+    on_progress is called with each block as it arrives. Only the tail of
+    stderr is kept; it is attached to CalledProcessError on failure.
+    """
+    cmd = progress_command(cmd)
+    proc = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+
+    tail = deque(maxlen=stderr_lines)
+    reader = threading.Thread(target=lambda: tail.extend(proc.stderr), daemon=True)
+    reader.start()
+
+    blocks = ProgressBlocks()
+    for line in proc.stdout:
+        metrics = blocks.feed(line)
+        if metrics is not None and on_progress is not None:
+            on_progress(metrics)
+
+    returncode = proc.wait()
+    reader.join()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(
+            returncode, cmd, stderr="".join(tail).encode()
+        )
+    return blocks.last
+
+
+class ProgressTracker:
+    """
+    Two progress bars weighted by work rather than file count: videos by
+    media seconds (advanced live from ffmpeg progress) and images by input
+    bytes (advanced when each image finishes).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.video = tqdm(total=0, desc="Videos", unit="s", position=0)
+        self.images = tqdm(
+            total=0, desc="Images", unit="B", unit_scale=True, position=1
+        )
+
+    def _bar(self, kind):
+        return self.video if kind == "video" else self.images
+
+    def add(self, kind: str, weight: float):
+        with self._lock:
+            bar = self._bar(kind)
+            bar.total += weight
+            bar.refresh()
+
+    def advance(self, kind: str, amount: float):
+        if amount > 0:
+            with self._lock:
+                self._bar(kind).update(amount)
+
+    def write(self, msg: str):
+        with self._lock:
+            tqdm.write(msg)
+
+    def video_callback(self, duration: float, metrics_out: dict):
+        """
+        Progress callback for one video: advances the bar by the media time
+        encoded since the last block and keeps the latest metrics.
+        Returns (callback, finish) where finish() tops up whatever is left.
+        """
+        done = [0.0]
+
+        def callback(metrics):
+            metrics_out.update(metrics)
+            out_time = min(metrics.get("out_time", 0.0), duration)
+            self.advance("video", out_time - done[0])
+            done[0] = max(done[0], out_time)
+
+        def finish():
+            self.advance("video", duration - done[0])
+            done[0] = duration
+
+        return callback, finish
+
+    def close(self):
+        self.images.close()
+        self.video.close()
+
+
+class Telemetry:
+    """Per-job phase timings, exportable as a Chrome trace (chrome://tracing)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.events = []
+
+    @contextmanager
+    def span(self, name: str, phase: str, **args):
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.record(name, phase, start, time.perf_counter(), **args)
+
+    def record(self, name: str, phase: str, start: float, end: float, **args):
+        with self._lock:
+            self.events.append(
+                {
+                    "name": name,
+                    "cat": phase,
+                    "ph": "X",
+                    "ts": (start - self._origin) * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": args,
+                }
+            )
+
+    def totals(self) -> dict:
+        """Total seconds spent per phase"""
+        totals = {}
+        for event in self.events:
+            totals[event["cat"]] = totals.get(event["cat"], 0.0) + event["dur"] / 1e6
+        return totals
+
+    def write_chrome_trace(self, path):
+        with open(path, "w") as fh:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, fh)
@@ -0,0 +1,33 @@
+from probe_index import probe_file
+
+# Codecs the MP4 container carries as-is, so these streams can be copied
+COPYABLE_VIDEO_CODECS = {"h264"}
+COPYABLE_AUDIO_CODECS = {"aac"}
+
+AUDIO_ENCODER_ARGS = ["-c:a", "aac"]
+
+# The first video and audio stream only: subtitle and data tracks (subrip,
+# tmcd timecodes) often can't be stream-copied into MP4
+STREAM_MAP_ARGS = ["-map", "0:v:0", "-map", "0:a:0?"]
+
+
+def plan_video_conversion(
+    file_path, encoder_args: list[str], info: dict | None = None, remux: bool = True
+) -> tuple[str, list[str]]:
+    """
+    Pick the cheapest way to get a video into an H.264/AAC MP4.
+    Returns (label, ffmpeg codec args), where label is one of
+    "Remuxed" (stream copy), "Remuxed, audio re-encoded" or "Transcoded".
+    remux=False always transcodes, for inputs whose remux failed.
+    """
+    if not remux:
+        return "Transcoded", list(encoder_args)
+    if info is None:
+        info = probe_file(file_path)
+    if not info or info.get("codec") not in COPYABLE_VIDEO_CODECS:
+        return "Transcoded", list(encoder_args)
+
+    audio_codec = info.get("audio_codec")
+    if audio_codec is None or audio_codec in COPYABLE_AUDIO_CODECS:
+        return "Remuxed", ["-c", "copy"]
+    return "Remuxed, audio re-encoded", ["-c:v", "copy", *AUDIO_ENCODER_ARGS]
@@ -0,0 +1,200 @@
+import concurrent.futures
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+# x264 stops scaling well past a handful of threads per encode; beyond this
+# it is cheaper to run more encodes side by side
+MAX_VIDEO_THREADS = 6
+
+
+def split_budget(cores: int | None = None) -> dict:
+    """
+    Split a core budget between video and image jobs.
+    Images are single-threaded ffmpeg calls and get a quarter of the cores;
+    the rest goes to video encodes of up to MAX_VIDEO_THREADS threads each.
+    """
+    cores = max(1, cores or os.cpu_count() or 1)
+    image_share = max(1, cores // 4)
+    video_cores = max(1, cores - image_share)
+    video_threads = min(video_cores, MAX_VIDEO_THREADS)
+    return {
+        "cores": cores,
+        "image_share": image_share,
+        "video_threads": video_threads,
+    }
+
+
+class _Job:
+    __slots__ = ("kind", "fn", "args", "cost", "future", "queued", "started", "ended")
+
+    def __init__(self, kind, fn, args, cost):
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        self.cost = cost
+        self.future = concurrent.futures.Future()
+        self.queued = time.monotonic()
+        self.started = None
+        self.ended = None
+
+
+class BudgetScheduler:
+    """
+    Runs image and video jobs against a shared core budget.
+
+    Each video job reserves video_threads cores and should run ffmpeg with
+    that many threads; queued videos start longest first. Image jobs cost
+    one core and are capped at image_share while videos are waiting, but
+    may use every idle core once the video queue is empty.
+    """
+
+    def __init__(
+        self,
+        cores: int | None = None,
+        video_threads: int | None = None,
+        image_share: int | None = None,
+        max_queued_images: int = 256,
+    ):
+        budget = split_budget(cores)
+        self.cores = budget["cores"]
+        self.video_threads = min(video_threads or budget["video_threads"], self.cores)
+        # At cores or more, images would take every freed core while videos wait
+        self.image_share = min(
+            image_share or budget["image_share"], max(1, self.cores - 1)
+        )
+        self.max_queued_images = max_queued_images
+
+        self._cond = threading.Condition()
+        self._videos = []
+        self._images = deque()
+        self._seq = itertools.count()
+        self._free = self.cores
+        self._images_running = 0
+        self._active = 0
+        self._closed = False
+        self.jobs: list[_Job] = []
+        self.started_at = time.monotonic()
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.cores)
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def submit_video(self, fn, *args, duration: float = 0.0, cost: int | None = None):
+        """
+        Queue a video job; fn is called with threads=video_threads, or with
+        cost threads for jobs that fan out themselves (capped at the cores
+        images can't claim while videos wait)
+        """
+        if cost is not None:
+            cost = max(self.video_threads, min(cost, self.cores - self.image_share))
+        job = _Job("video", fn, args, cost or self.video_threads)
+        with self._cond:
+            heapq.heappush(self._videos, (-(duration or 0.0), next(self._seq), job))
+            self._enqueued(job)
+        return job.future
+
+    def submit_image(self, fn, *args):
+        """Queue an image job (run with threads=1); blocks while the backlog is full"""
+        job = _Job("image", fn, args, 1)
+        with self._cond:
+            while len(self._images) >= self.max_queued_images:
+                self._cond.wait()
+            self._images.append(job)
+            self._enqueued(job)
+        return job.future
+
+    def _enqueued(self, job):
+        self._active += 1
+        self.jobs.append(job)
+        self._cond.notify_all()
+
+    def _next_job(self):
+        if self._videos and self._free >= self._videos[0][2].cost:
+            return heapq.heappop(self._videos)[2]
+        if self._images and self._free >= 1:
+            if not self._videos or self._images_running < self.image_share:
+                return self._images.popleft()
+        return None
+
+    def _dispatch(self):
+        with self._cond:
+            while True:
+                job = self._next_job()
+                if job is None:
+                    if self._closed and self._active == 0:
+                        return
+                    self._cond.wait()
+                    continue
+                self._free -= job.cost
+                if job.kind == "image":
+                    self._images_running += 1
+                self._cond.notify_all()
+                self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        job.started = time.monotonic()
+        try:
+            result = job.fn(*job.args, threads=job.cost)
+        except BaseException as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            job.ended = time.monotonic()
+            with self._cond:
+                self._free += job.cost
+                self._active -= 1
+                if job.kind == "image":
+                    self._images_running -= 1
+                self._cond.notify_all()
+
+    def forget_finished(self):
+        """Drop finished jobs from the history summary() reports on"""
+        with self._cond:
+            self.jobs = [job for job in self.jobs if job.ended is None]
+
+    def close(self):
+        """Stop accepting work and wait for every queued job to finish"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def summary(self) -> dict:
+        """Makespan plus per-class job counts and wait times (seconds)"""
+        finished = [job for job in self.jobs if job.ended is not None]
+        report = {
+            "makespan": max((job.ended for job in finished), default=self.started_at)
+            - self.started_at,
+        }
+        for kind in ("image", "video"):
+            waits = [job.started - job.queued for job in finished if job.kind == kind]
+            report[kind] = {
+                "jobs": len(waits),
+                "mean_wait": sum(waits) / len(waits) if waits else 0.0,
+                "max_wait": max(waits, default=0.0),
+            }
+        return report
+
+
+def format_summary(report: dict) -> str:
+    lines = [f"Makespan: {report['makespan']:.1f}s"]
+    for kind in ("image", "video"):
+        stats = report[kind]
+        if stats["jobs"]:
+            lines.append(
+                f"{kind.capitalize()} jobs: {stats['jobs']}, "
+                f"wait mean {stats['mean_wait']:.1f}s / max {stats['max_wait']:.1f}s"
+            )
+    return "\n".join(lines)
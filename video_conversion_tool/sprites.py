@@ -0,0 +1,203 @@
+import bisect
+import concurrent.futures
+import json
+import math
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from tqdm import tqdm
+
+from probe_index import index_for_folder, keyframe_times
+
+SPRITES_FOLDER = "SPRITES"
+
+
+def pick_frame_times(duration: float, count: int) -> list[float]:
+    """count evenly spaced offsets, each in the middle of its slice"""
+    return [duration * (i + 0.5) / count for i in range(count)]
+
+
+def shown_frame_times(video_path: Path, times: list[float]) -> list[float]:
+    """
+    Timestamp of the frame an inexact seek to each offset decodes: the last
+    keyframe at or before it. Offsets with no keyframe found are kept.
+    """
+    keyframes = keyframe_times(video_path, around=times, window=1.0)
+    shown = []
+    for t in times:
+        i = bisect.bisect_right(keyframes, round(t, 3))
+        shown.append(keyframes[i - 1] if i else t)
+    return shown
+
+
+def sprite_paths(video_path: Path, sprites_folder: Path) -> dict:
+    stem = video_path.stem
+    return {
+        "sprite": sprites_folder / f"{stem}_sprite.jpg",
+        "poster": sprites_folder / f"{stem}_poster.jpg",
+        "index": sprites_folder / f"{stem}.json",
+    }
+
+
+def is_fresh(video_path: Path, sprites_folder: Path) -> bool:
+    """True if all sprite outputs exist and are newer than the video"""
+    source_mtime = video_path.stat().st_mtime
+    for path in sprite_paths(video_path, sprites_folder).values():
+        if not path.exists() or path.stat().st_mtime < source_mtime:
+            return False
+    return True
+
+
+def build_sprite(
+    video_path: Path,
+    sprites_folder: Path,
+    info: dict,
+    frames: int = 16,
+    columns: int = 4,
+    thumb_width: int = 160,
+    poster_width: int = 320,
+) -> tuple[bool, str]:
+    """
+    Write a sprite sheet, a poster and a JSON index of frame offsets for
+    one video with a single ffmpeg run. Every frame is its own input with
+    an inexact input-side seek, which lands on the keyframe before the
+    offset, so only one frame is decoded per input and the file is never
+    scanned for keyframes. The index records the keyframe each thumbnail
+    actually shows, read from packet flags afterwards.
+    """
+    duration = info.get("duration") or 0.0
+    if not duration or not info.get("width"):
+        return False, f"No duration/size for {video_path.name}"
+
+    times = pick_frame_times(duration, frames)
+    rows = math.ceil(len(times) / columns)
+    paths = sprite_paths(video_path, sprites_folder)
+
+    cmd = ["ffmpeg", "-v", "error", "-y"]
+    for t in times:
+        cmd += ["-noaccurate_seek", "-ss", f"{t:.3f}", "-i", str(video_path)]
+
+    poster_input = len(times) // 2
+    graph = []
+    for i in range(len(times)):
+        chain = f"[{i}:v]trim=end_frame=1,setpts=PTS-STARTPTS"
+        if i == poster_input:
+            graph.append(f"{chain},split[f{i}][poster]")
+            graph.append(f"[poster]scale={poster_width}:-2[posterout]")
+        else:
+            graph.append(f"{chain}[f{i}]")
+        graph.append(f"[f{i}]scale={thumb_width}:-2,setsar=1[t{i}]")
+    labels = "".join(f"[t{i}]" for i in range(len(times)))
+    graph.append(
+        f"{labels}concat=n={len(times)}:v=1:a=0,"
+        f"tile={columns}x{rows}:nb_frames={len(times)}[sheet]"
+    )
+
+    cmd += [
+        "-filter_complex",
+        ";".join(graph),
+        "-map",
+        "[sheet]",
+        "-frames:v",
+        "1",
+        "-q:v",
+        "4",
+        str(paths["sprite"]),
+        "-map",
+        "[posterout]",
+        "-frames:v",
+        "1",
+        "-q:v",
+        "3",
+        str(paths["poster"]),
+    ]
+    try:
+        subprocess.run(cmd, capture_output=True, check=True)
+    except subprocess.CalledProcessError as e:
+        return (
+            False,
+            f"Error building sprite for {video_path.name}: {e.stderr.decode()}",
+        )
+
+    # Thumbnail height as ffmpeg computes it (autorotation swaps the sides)
+    width, height = info["width"], info["height"]
+    if info.get("rotation") in (90, 270):
+        width, height = height, width
+    thumb_height = round(thumb_width * height / width / 2) * 2
+    shown = shown_frame_times(video_path, times)
+
+    index = {
+        "source": video_path.name,
+        "duration": duration,
+        "sprite": paths["sprite"].name,
+        "poster": paths["poster"].name,
+        "columns": columns,
+        "rows": rows,
+        "thumb_width": thumb_width,
+        "thumb_height": thumb_height,
+        "frames": [
+            {
+                "time": round(t, 3),
+                "x": (i % columns) * thumb_width,
+                "y": (i // columns) * thumb_height,
+            }
+            for i, t in enumerate(shown)
+        ],
+    }
+    paths["index"].write_text(json.dumps(index, indent=2))
+    return True, video_path.name
+
+
+def generate_sprites(
+    video_folder: str,
+    frames: int = 16,
+    columns: int = 4,
+    max_workers: int | None = None,
+):
+    """
+    Build sprites for every MP4 in video_folder (e.g. MP4_CONVERTED) into a
+    SPRITES folder next to it, in parallel. Clips whose sprites are newer
+    than the video are skipped.
+    """
+    video_path = Path(video_folder)
+    sprites_folder = video_path.parent / SPRITES_FOLDER
+    sprites_folder.mkdir(exist_ok=True)
+
+    videos = [
+        f
+        for f in video_path.iterdir()
+        if f.suffix.lower() == ".mp4" and not is_fresh(f, sprites_folder)
+    ]
+    if not videos:
+        print("All sprites are up to date")
+        return
+
+    infos = index_for_folder(str(video_path)).probe_many(videos)
+    max_workers = max_workers or os.cpu_count() or 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                build_sprite,
+                f,
+                sprites_folder,
+                infos.get(str(f.resolve())) or {},
+                frames,
+                columns,
+            )
+            for f in videos
+        ]
+
+        with tqdm(total=len(videos), desc="Building sprites") as pbar:
+            for future in concurrent.futures.as_completed(futures):
+                success, msg = future.result()
+                if not success:
+                    pbar.write(msg)
+                pbar.update(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(f"Usage: python {sys.argv[0]} <MP4 folder>")
+    generate_sprites(sys.argv[1])
@@ -1,6 +1,30 @@
 import os
 import subprocess
 import json
+import sys
+import tempfile
+import hashlib
+import concurrent.futures
+
+from probe_index import index_for_folder
+
+SEGMENT_CACHE_NAME = ".stitch_segments"
+STITCH_FPS = 30
+STITCH_AUDIO_RATE = 48000
+STITCH_ENCODER_ARGS = [
+    "-c:v",
+    "libx264",
+    "-crf",
+    "23",
+    "-preset",
+    "medium",
+    "-pix_fmt",
+    "yuv420p",
+    "-c:a",
+    "aac",
+    "-b:a",
+    "128k",
+]
 
 
 def get_video_resolution(file_path):
@@ -36,65 +60,35 @@ def get_all_video_resolutions(directory):
     if not os.path.exists(directory):
         return ["Directory not found"]
 
-    # Get all MP4 files
-    mp4_files = [f for f in os.listdir(directory) if f.lower().endswith(".mp4")]
+    # Probe all MP4 files in parallel (cached on disk by size/mtime)
+    infos = index_for_folder(directory).probe_folder(directory)
 
-    # Get resolution for each file
-    for file in mp4_files:
-        full_path = os.path.join(directory, file)
-        resolution = get_video_resolution(full_path)
-        resolutions.append(f"{file}: {resolution}")
+    for full_path in sorted(infos):
+        info = infos[full_path]
+        resolution = (info["width"], info["height"]) if info["width"] else None
+        resolutions.append(f"{os.path.basename(full_path)}: {resolution}")
 
     return resolutions
 
 
 def find_largest_dimensions(directory):
     """Find videos with largest width and height."""
-    max_width = 0
-    max_height = 0
-    max_width_file = ""
-    max_height_file = ""
-
-    for file in os.listdir(directory):
-        if file.lower().endswith(".mp4"):
-            full_path = os.path.join(directory, file)
-            dimensions = get_video_resolution(full_path)
-
-            if dimensions:
-                width, height = dimensions
-                if width > max_width:
-                    max_width = width
-                    max_width_file = file
-                if height > max_height:
-                    max_height = height
-                    max_height_file = file
+    index = index_for_folder(directory)
+    infos = index.probe_folder(directory)
+
+    max_width_file, max_width = index.largest(infos, "width")
+    max_height_file, max_height = index.largest(infos, "height")
 
     return {
-        "largest_width": {"file": max_width_file, "width": max_width},
-        "largest_height": {"file": max_height_file, "height": max_height},
+        "largest_width": {"file": os.path.basename(max_width_file), "width": max_width},
+        "largest_height": {
+            "file": os.path.basename(max_height_file),
+            "height": max_height,
+        },
     }
 
 
-# Directory path
-directory = "/Users/omchavan/Documents/projects/reflex_tutorial/video_conversion_tool/insta_pro-jan-2025/MP4_CONVERTED"
-
-# Get and print resolutions
-resolutions = get_all_video_resolutions(directory)
-for res in resolutions:
-    print(res)
-
-# Find and print largest dimensions
-largest = find_largest_dimensions(directory)
-print("\nLargest dimensions:")
-print(
-    f"Widest video: {largest['largest_width']['file']} ({largest['largest_width']['width']}px)"
-)
-print(
-    f"Tallest video: {largest['largest_height']['file']} ({largest['largest_height']['height']}px)"
-)
-
-
-def calculate_optimal_dimensions(max_width, max_height):
+def calculate_16_9_dimensions(max_width, max_height):
     """Calculate optimal 16:9 dimensions that fit max width and height."""
     # Calculate minimum width and height needed for 16:9 ratio
     width_from_height = (max_height * 16) // 9
@@ -107,17 +101,6 @@ def calculate_optimal_dimensions(max_width, max_height):
         return max_width, height_from_width
 
 
-# After finding largest dimensions, add:
-optimal_width, optimal_height = calculate_optimal_dimensions(
-    largest["largest_width"]["width"], largest["largest_height"]["height"]
-)
-
-print("\nOptimal 16:9 dimensions that fit all videos:")
-print(f"Width: {optimal_width}px")
-print(f"Height: {optimal_height}px")
-print(f"Ratio: {optimal_width/optimal_height:.2f}:1")
-
-
 def calculate_optimal_dimensions(max_width, max_height):
     """Find smallest standard resolution that fits the given dimensions."""
     # Standard resolutions (height in pixels)
@@ -146,54 +129,240 @@ def calculate_optimal_dimensions(max_width, max_height):
     return {"resolution": "2160p", "width": 3840, "height": 2160}
 
 
-# Update implementation
-optimal = calculate_optimal_dimensions(
-    largest["largest_width"]["width"], largest["largest_height"]["height"]
-)
-
-print("\nOptimal standard resolution that fits all videos:")
-print(f"Resolution: {optimal['resolution']}")
-print(f"Width: {optimal['width']}px")
-print(f"Height: {optimal['height']}px")
-print(f"Ratio: {optimal['width']/optimal['height']:.2f}:1")
-
-
-def create_black_frame_video(width, height, output_path):
-    """Create a black frame video of specified dimensions and 4 hours duration at 1fps."""
-    try:
-        cmd = [
-            "ffmpeg",
+def normalize_filter(width, height, fps=STITCH_FPS):
+    """Filtergraph that letterboxes a clip onto a width x height frame."""
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:color=black,"
+        f"setsar=1,fps={fps},format=yuv420p"
+    )
+
+
+def normalize_clip(file_path, output_path, width, height, info=None, threads=None):
+    """
+    Re-encode one clip to the common resolution, fps, pixel format and
+    stereo 48 kHz audio, so the normalized clips can be stream-copied
+    into one file. Clips without audio get a silent track.
+    """
+    has_audio = bool(info and info.get("audio_codec"))
+    cmd = ["ffmpeg", "-v", "error", "-i", file_path]
+    if not has_audio:
+        cmd += [
             "-f",
             "lavfi",
             "-i",
-            f"color=c=black:s={width}x{height}",
-            "-r",
-            "1",  # Set framerate to 1 fps
-            "-t",
-            "14400",  # 4 hours in seconds
-            "-c:v",
-            "libx264",
-            "-tune",
-            "stillimage",
-            "-pix_fmt",
-            "yuv420p",
-            "-y",  # Overwrite output file if exists
-            output_path,
+            f"anullsrc=channel_layout=stereo:sample_rate={STITCH_AUDIO_RATE}",
         ]
+    cmd += [
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0" if has_audio else "1:a:0",
+        "-vf",
+        normalize_filter(width, height),
+        "-af",
+        f"aresample={STITCH_AUDIO_RATE},aformat=channel_layouts=stereo",
+        *STITCH_ENCODER_ARGS,
+        "-ar",
+        str(STITCH_AUDIO_RATE),
+        "-ac",
+        "2",
+    ]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    if not has_audio:
+        cmd += ["-shortest"]
+    cmd += ["-y", output_path]
 
-        subprocess.run(cmd, check=True)
+    try:
+        subprocess.run(cmd, capture_output=True, check=True)
+        return True
+    except subprocess.CalledProcessError as e:
+        print(f"Error normalizing {os.path.basename(file_path)}: {e.stderr.decode()}")
+        return False
+
+
+def concat_segments(segment_paths, output_path):
+    """Join normalized clips with the concat demuxer, without re-encoding."""
+    with tempfile.NamedTemporaryFile(
+        "w", suffix=".txt", delete=False, dir=os.path.dirname(segment_paths[0])
+    ) as list_file:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+
+    cmd = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        list_file.name,
+        "-c",
+        "copy",
+        "-movflags",
+        "+faststart",
+        "-y",
+        output_path,
+    ]
+    try:
+        subprocess.run(cmd, capture_output=True, check=True)
         return True
     except subprocess.CalledProcessError as e:
-        print(f"Error creating black frame video: {str(e)}")
+        print(f"Error concatenating clips: {e.stderr.decode()}")
+        return False
+    finally:
+        os.unlink(list_file.name)
+
+
+def clip_key(file_path, sample_size=1 << 20):
+    """
+    Content key for a clip: its size plus a hash of the first and last MiB.
+    Stays the same when a clip is renamed or moved.
+    """
+    size = os.path.getsize(file_path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(file_path, "rb") as fh:
+        digest.update(fh.read(sample_size))
+        if size > sample_size:
+            fh.seek(max(sample_size, size - sample_size))
+            digest.update(fh.read(sample_size))
+    return digest.hexdigest()
+
+
+def segment_name(file_path, width, height):
+    """Cache file name for a clip normalized with the current settings."""
+    settings = json.dumps(
+        [width, height, STITCH_FPS, STITCH_AUDIO_RATE, STITCH_ENCODER_ARGS]
+    )
+    settings_key = hashlib.sha1(settings.encode()).hexdigest()[:12]
+    return f"{clip_key(file_path)}-{settings_key}.mp4"
+
+
+def normalize_clips(clips, width, height, segment_dir, max_workers=None):
+    """
+    Normalize clips in parallel into segment_dir, reusing segments already
+    cached for the same clip content and settings. Identical clips map to
+    one segment, which is encoded once and used for each of them. Returns
+    the segment paths in clip order (clips that fail are left out).
+    """
+    os.makedirs(segment_dir, exist_ok=True)
+    cores = os.cpu_count() or 1
+    max_workers = max_workers or max(1, cores // 2)
+    threads = max(1, cores // max_workers)
+
+    # Segment path per clip, and the first clip of each segment to encode
+    segment_of = {
+        file_path: os.path.join(segment_dir, segment_name(file_path, width, height))
+        for file_path in clips
+    }
+    sources = {}
+    for file_path, segment in segment_of.items():
+        sources.setdefault(segment, file_path)
+
+    def normalize(segment):
+        if os.path.exists(segment):
+            return True
+        file_path = sources[segment]
+        # Unique per process, so concurrent stitches never share a partial
+        partial = f"{segment}.{os.getpid()}.partial.mp4"
+        info = clips[file_path]
+        if normalize_clip(file_path, partial, width, height, info, threads=threads):
+            os.replace(partial, segment)
+            return True
+        if os.path.exists(partial):
+            os.unlink(partial)
         return False
 
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        done = dict(zip(sources, executor.map(normalize, sources)))
+    return [segment_of[f] for f in clips if done[segment_of[f]]]
+
+
+def stitch_videos(clips, output_path, dimensions, segment_dir=None, max_workers=None):
+    """
+    Stitch clips into one video at the size chosen by
+    calculate_optimal_dimensions. clips maps file path -> probe info, as
+    returned by ProbeIndex.probe_folder. Normalized segments are cached in
+    segment_dir, so adding a clip only re-encodes that clip. Returns the
+    number of clips stitched (0 on failure).
+    """
+    if segment_dir is None:
+        segment_dir = os.path.join(
+            os.path.dirname(os.path.abspath(output_path)), SEGMENT_CACHE_NAME
+        )
+    segments = normalize_clips(
+        clips,
+        dimensions["width"],
+        dimensions["height"],
+        segment_dir,
+        max_workers=max_workers,
+    )
+    if not segments:
+        print("No clips could be normalized")
+        return 0
+    if not concat_segments(segments, output_path):
+        return 0
+    return len(segments)
+
+
+def main(directory, output_path=None):
+    # Get and print resolutions
+    resolutions = get_all_video_resolutions(directory)
+    for res in resolutions:
+        print(res)
+
+    # Find and print largest dimensions
+    largest = find_largest_dimensions(directory)
+    print("\nLargest dimensions:")
+    print(
+        f"Widest video: {largest['largest_width']['file']} ({largest['largest_width']['width']}px)"
+    )
+    print(
+        f"Tallest video: {largest['largest_height']['file']} ({largest['largest_height']['height']}px)"
+    )
+
+    optimal_width, optimal_height = calculate_16_9_dimensions(
+        largest["largest_width"]["width"], largest["largest_height"]["height"]
+    )
+
+    print("\nOptimal 16:9 dimensions that fit all videos:")
+    print(f"Width: {optimal_width}px")
+    print(f"Height: {optimal_height}px")
+    print(f"Ratio: {optimal_width/optimal_height:.2f}:1")
+
+    optimal = calculate_optimal_dimensions(
+        largest["largest_width"]["width"], largest["largest_height"]["height"]
+    )
+
+    print("\nOptimal standard resolution that fits all videos:")
+    print(f"Resolution: {optimal['resolution']}")
+    print(f"Width: {optimal['width']}px")
+    print(f"Height: {optimal['height']}px")
+    print(f"Ratio: {optimal['width']/optimal['height']:.2f}:1")
+
+    # Stitch next to (not inside) the clip folder so re-runs don't pick it up
+    if output_path is None:
+        output_path = os.path.join(
+            os.path.dirname(os.path.abspath(directory)), "stitched.mp4"
+        )
+    clips = dict(sorted(index_for_folder(directory).probe_folder(directory).items()))
+    stitched = stitch_videos(clips, output_path, optimal)
+    if stitched:
+        print(f"\nStitched {stitched} of {len(clips)} clips into: {output_path}")
+        print(f"Resolution: {optimal['width']}x{optimal['height']}")
+    else:
+        print("Failed to stitch videos")
 
-# Usage:
-output_path = os.path.join(directory, "black_frame_4hours.mp4")
-success = create_black_frame_video(optimal["width"], optimal["height"], output_path)
 
-if success:
-    print(f"\nCreated black frame video at: {output_path}")
-    print(f"Resolution: {optimal['width']}x{optimal['height']}")
-else:
-    print("Failed to create black frame video")
+if __name__ == "__main__":
+    # Directory path
+    directory = (
+        sys.argv[1]
+        if len(sys.argv) > 1
+        else "/Users/omchavan/Documents/projects/reflex_tutorial/video_conversion_tool/insta_pro-jan-2025/MP4_CONVERTED"
+    )
+    main(directory)
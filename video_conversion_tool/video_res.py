@@ -22,14 +22,33 @@ List of common video file extensions.
 Can be used to filter or validate video files.
 All extensions include the leading dot.
 """
+import os
 import subprocess
+import sys
 import concurrent.futures
 from pathlib import Path
 from tqdm import tqdm
 import shutil
 
+from manifest import ConversionManifest, run_tracked
+from remux import STREAM_MAP_ARGS, plan_video_conversion
+from scheduler import split_budget
 
-def convert_single_video(file_path: Path, output_folder: Path) -> tuple[bool, str]:
+VIDEO_ENCODER_ARGS = [
+    "-c:v",
+    "libx264",
+    "-crf",
+    "23",
+    "-preset",
+    "medium",
+    "-c:a",
+    "aac",
+]
+
+
+def convert_single_video(
+    file_path: Path, output_folder: Path, threads: int | None = None
+) -> tuple[bool, str]:
     """Convert a single video to MP4 using ffmpeg or copy if already MP4"""
     try:
         output_path = output_folder / f"{file_path.stem}.mp4"
@@ -39,36 +58,48 @@ def convert_single_video(file_path: Path, output_folder: Path) -> tuple[bool, st
             shutil.move(file_path, output_path)
             return True, f"Copied MP4: {file_path.name}"
 
-        # Otherwise convert using ffmpeg
-        cmd = [
-            "ffmpeg",
-            "-i",
-            str(file_path),
-            "-c:v",
-            "libx264",
-            "-crf",
-            "23",
-            "-preset",
-            "medium",
-            "-c:a",
-            "aac",
-            "-y",
-            str(output_path),
-        ]
+        # Otherwise remux or convert using ffmpeg, depending on the codecs
+        def command(codec_args):
+            return [
+                "ffmpeg",
+                "-i",
+                str(file_path),
+                *STREAM_MAP_ARGS,
+                *codec_args,
+                *(["-threads", str(threads)] if threads else []),
+                "-y",
+                str(output_path),
+            ]
 
-        subprocess.run(cmd, capture_output=True, check=True)
+        label, codec_args = plan_video_conversion(file_path, VIDEO_ENCODER_ARGS)
+        try:
+            subprocess.run(command(codec_args), capture_output=True, check=True)
+        except subprocess.CalledProcessError:
+            if label == "Transcoded":
+                raise
+            # Streams the MP4 muxer rejects as-is; encode them instead
+            label, codec_args = plan_video_conversion(
+                file_path, VIDEO_ENCODER_ARGS, remux=False
+            )
+            subprocess.run(command(codec_args), capture_output=True, check=True)
         file_path.unlink()  # Delete original only for non-MP4 files
-        return True, f"Converted: {file_path.name}"
+        return True, f"{label}: {file_path.name}"
     except subprocess.CalledProcessError as e:
         return False, f"Error converting {file_path.name}: {e.stderr.decode()}"
     except shutil.Error as e:
         return False, f"Error copying {file_path.name}: {str(e)}"
 
 
-def convert_videos_to_mp4(input_folder: str, max_workers: int = 4):
+def convert_videos_to_mp4(
+    input_folder: str, max_workers: int | None = None, incremental: bool = True
+):
     """
     Converts all supported video files to MP4 format using ffmpeg.
-    Uses parallel processing for better performance.
+    Uses parallel processing for better performance: the cores are split
+    between max_workers encodes (default: per scheduler.split_budget), and
+    each ffmpeg is told its share so they don't oversubscribe the CPU.
+    With incremental=True, videos already converted with the same settings
+    (per the folder's conversion manifest) are skipped.
     """
     input_path = Path(input_folder)
     output_folder = input_path / "MP4_CONVERTED"
@@ -81,14 +112,34 @@ def convert_videos_to_mp4(input_folder: str, max_workers: int = 4):
         if f.suffix.lower() in VIDEO_EXTENSIONS and "MP4_CONVERTED" not in str(f)
     ]
 
+    manifest = ConversionManifest.for_folder(input_path) if incremental else None
+    if manifest is not None:
+        video_files = [
+            f for f in video_files if not manifest.should_skip(f, VIDEO_ENCODER_ARGS)
+        ]
+
     if not video_files:
         print("No videos found to convert")
+        if manifest is not None:
+            manifest.close()
         return
 
     # Convert videos in parallel with progress bar
+    cores = os.cpu_count() or 1
+    max_workers = max_workers or max(1, cores // split_budget(cores)["video_threads"])
+    threads = max(1, cores // max_workers)
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
         futures = [
-            executor.submit(convert_single_video, f, output_folder) for f in video_files
+            executor.submit(
+                run_tracked,
+                convert_single_video,
+                f,
+                output_folder / f"{f.stem}.mp4",
+                VIDEO_ENCODER_ARGS,
+                manifest,
+                threads=threads,
+            )
+            for f in video_files
         ]
 
         with tqdm(total=len(video_files), desc="Converting videos") as pbar:
@@ -100,9 +151,11 @@ def convert_videos_to_mp4(input_folder: str, max_workers: int = 4):
                     pbar.write(msg)
                 pbar.update(1)
 
+    if manifest is not None:
+        manifest.close()
+
 
 if __name__ == "__main__":
-    folder_path = (
-        "/Users/omchavan/Documents/projects/reflex_tutorial/insta_pro-jan-2025"
-    )
-    convert_videos_to_mp4(folder_path)
+    if len(sys.argv) != 2:
+        sys.exit(f"Usage: python {sys.argv[0]} <folder>")
+    convert_videos_to_mp4(sys.argv[1])
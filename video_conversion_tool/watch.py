@@ -0,0 +1,397 @@
+"""
+Watch-folder daemon: convert new uploads as they arrive.
+
+    python cli.py /path/to/folder --watch [--settle 5] [--poll]
+
+The scheduler and manifest stay open for the life of the process, and new
+files are found from filesystem events instead of re-walking the tree:
+inotify on Linux, otherwise (or with --poll, e.g. for NFS mounts whose
+remote writes raise no local events) a poll that only re-lists the
+directories whose mtime changed. A file is converted once it has stopped
+changing for the settle time, so half-copied uploads are left alone; with
+inotify it must also have been closed after writing (or moved in), so a
+writer that pauses longer than the settle time isn't caught mid-file.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from functools import partial
+from pathlib import Path
+
+from animation import ANIMATION_ENCODER_ARGS, animation_info, convert_animation
+from convert_both import (
+    OUTPUT_FOLDERS,
+    VIDEO_ENCODER_ARGS,
+    convert_single_image,
+    convert_single_video,
+    manifest_settings,
+    media_kind,
+    scan_media,
+)
+from manifest import ConversionManifest, run_tracked
+from probe_index import probe_file
+from profiles import PROFILES
+from scheduler import BudgetScheduler
+
+# Seconds a file's size and mtime must stay unchanged before converting
+SETTLE_SECONDS = 5.0
+
+# Files never reported closed (e.g. hardlinked in, which raises only
+# IN_CREATE) are converted once unchanged for this long instead
+UNCLOSED_SETTLE_SECONDS = 120.0
+
+# Seconds between directory polls when inotify isn't used
+POLL_SECONDS = 2.0
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event: wd, mask, cookie, len, then len bytes of name
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _ignored(directory: Path, name: str, root: Path) -> bool:
+    """
+    Output folders directly under root, and dotfiles such as in-progress
+    .part/rsync temps
+    """
+    return name.startswith(".") or (name in OUTPUT_FOLDERS and directory == root)
+
+
+def _walk_dirs(top: Path, root: Path):
+    """top and every directory below it, minus output and hidden folders"""
+    stack = [top]
+    while stack:
+        directory = stack.pop()
+        yield directory
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False) and not _ignored(
+                        directory, entry.name, root
+                    ):
+                        stack.append(Path(entry.path))
+        except OSError:
+            continue
+
+
+def _list_dir(
+    directory: Path, root: Path
+) -> tuple[dict[str, tuple[int, int]], set[Path]]:
+    """
+    (name -> (size, mtime_ns) of the files, subdirectories) directly in
+    directory, minus the ignored names
+    """
+    files, subdirs = {}, set()
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if _ignored(directory, entry.name, root):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.add(Path(entry.path))
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, subdirs
+
+
+class InotifyWatcher:
+    """Recursive watch built on inotify(7), one watch per directory"""
+
+    def __init__(self, root: Path):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.root = root
+        self._dirs = {}
+        for directory in _walk_dirs(root, root):
+            self._add(directory)
+
+    def _add(self, directory: Path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "fs.inotify.max_user_watches reached")
+            # Removed before the watch could be added
+            return
+        self._dirs[wd] = directory
+
+    def _add_tree(self, directory: Path) -> list[Path]:
+        """Watch a directory tree (again) and return the files already in it"""
+        found = []
+        for sub in _walk_dirs(directory, self.root):
+            self._add(sub)
+            found += [sub / name for name in _list_dir(sub, self.root)[0]]
+        return found
+
+    def changed(self, timeout: float | None) -> list[tuple[Path, bool]]:
+        """
+        (file, closed) for files created, written or moved in, waiting up
+        to timeout seconds. closed is False while a writer may still have
+        the file open, i.e. until IN_CLOSE_WRITE or IN_MOVED_TO. Files found
+        by walking (new directories, overflow) count as closed.
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        data = b""
+        while True:
+            try:
+                data += os.read(self._fd, 1 << 16)
+            except BlockingIOError:
+                break
+
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, possibly for new directories too:
+                # re-add the watches and list every file to catch up
+                paths += [(f, True) for f in self._add_tree(self.root)]
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None or not name or _ignored(directory, name, self.root):
+                continue
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    paths += [(f, True) for f in self._add_tree(directory / name)]
+            else:
+                closed = bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))
+                paths.append((directory / name, closed))
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """
+    Snapshot of every directory's mtime and file listing. Each poll stats
+    only the directories and re-lists the ones whose mtime moved, which is
+    enough to see files arrive (growth is followed by the settle check).
+    """
+
+    def __init__(self, root: Path, interval: float = POLL_SECONDS):
+        self.root = root
+        self.interval = interval
+        self._snapshot = {}
+        for directory in _walk_dirs(root, root):
+            listing = self._read(directory)
+            if listing is not None:
+                self._snapshot[directory] = listing
+
+    def _read(self, directory: Path):
+        try:
+            mtime = directory.stat().st_mtime_ns
+        except OSError:
+            return None
+        return (mtime, *_list_dir(directory, self.root))
+
+    def changed(self, timeout: float | None) -> list[tuple[Path, bool]]:
+        """(file, True) for new or changed files; only the settle time tells"""
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        paths = []
+        for directory, old in list(self._snapshot.items()):
+            new = self._read(directory)
+            if new is None:
+                del self._snapshot[directory]
+                continue
+            if new[0] == old[0]:
+                continue
+            self._snapshot[directory] = new
+            paths += [
+                (directory / name, True)
+                for name, stat in new[1].items()
+                if old[1].get(name) != stat
+            ]
+            # Directories that appeared are snapshotted, files and all
+            for added in new[2] - old[2]:
+                for sub in _walk_dirs(added, self.root):
+                    listing = self._read(sub)
+                    if listing is not None and sub not in self._snapshot:
+                        self._snapshot[sub] = listing
+                        paths += [(sub / name, True) for name in listing[1]]
+        return paths
+
+    def close(self):
+        pass
+
+
+def open_watcher(root: Path, polling: bool = False):
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), polling instead")
+    return PollingWatcher(root)
+
+
+def watch_folder(
+    input_folder: str,
+    media_type: str = "both",
+    cpu_budget: int | None = None,
+    video_threads: int | None = None,
+    image_workers: int | None = None,
+    video_encoder_args: list[str] | None = None,
+    profiles: list[str] | None = None,
+    keep_originals: bool = False,
+    settle_seconds: float = SETTLE_SECONDS,
+    polling: bool = False,
+    catch_up: bool = True,
+):
+    """
+    Convert files as they land in input_folder until interrupted (Ctrl+C
+    lets the queued and running jobs finish). With catch_up, one walk at
+    startup queues the files that arrived while the daemon was down; the
+    manifest skips the ones already converted. Events for a path restart
+    its settle timer, so a burst of writes leads to a single conversion.
+    """
+    input_path = Path(input_folder).resolve()
+    video_encoder_args = video_encoder_args or VIDEO_ENCODER_ARGS
+    img_output = input_path / "JPG_CONVERTED"
+    vid_output = input_path / "MP4_CONVERTED"
+    img_output.mkdir(exist_ok=True)
+    vid_output.mkdir(exist_ok=True)
+    for name in profiles or []:
+        (input_path / PROFILES[name]["folder"]).mkdir(exist_ok=True)
+
+    settings_by_type = manifest_settings(video_encoder_args, profiles)
+    manifest = ConversionManifest.for_folder(input_path)
+    scheduler = BudgetScheduler(
+        cores=cpu_budget, video_threads=video_threads, image_share=image_workers
+    )
+    watcher = open_watcher(input_path, polling)
+    print(f"Watching {input_path} ({type(watcher).__name__})")
+
+    def image_job(f, threads=None):
+        return run_tracked(
+            partial(convert_single_image, keep_originals=keep_originals),
+            f,
+            img_output / f"{f.stem}.jpg",
+            settings_by_type["image"],
+            manifest,
+            threads=threads,
+        )
+
+    def video_job(f, kind, threads=None):
+        # Probed here, on a scheduler thread, so the watch loop never waits
+        info = animation_info(f) if kind == "animation" else probe_file(f)
+        if kind == "animation":
+            convert = partial(
+                convert_animation, info=info, keep_originals=keep_originals
+            )
+            settings = ANIMATION_ENCODER_ARGS
+        else:
+            convert = partial(
+                convert_single_video,
+                info=info,
+                encoder_args=video_encoder_args,
+                profiles=profiles,
+                keep_originals=keep_originals,
+            )
+            settings = settings_by_type["video"]
+        return run_tracked(
+            convert,
+            f,
+            vid_output / f"{f.stem}.mp4",
+            settings,
+            manifest,
+            threads=threads,
+        )
+
+    unclosed_settle = max(settle_seconds, UNCLOSED_SETTLE_SECONDS)
+    # path -> (size, mtime_ns, when it last changed, closed) while settling
+    settling = {}
+    in_flight = set()
+    lock = threading.Lock()
+
+    def report(f, future):
+        success, msg = future.result()
+        print(time.strftime("%H:%M:%S"), msg if success else f"Error: {msg}")
+        with lock:
+            in_flight.discard(f)
+
+    def submit(f):
+        kind = media_kind(f, media_type, detect_animation=True)
+        if kind is None or manifest.should_skip(f, settings_by_type[kind]):
+            return
+        with lock:
+            in_flight.add(f)
+        if kind == "image":
+            future = scheduler.submit_image(image_job, f)
+        else:
+            # Not probed yet, so videos run in arrival order
+            future = scheduler.submit_video(video_job, f, kind)
+        future.add_done_callback(partial(report, f))
+
+    if catch_up:
+        for f, _ in scan_media(input_path, media_type):
+            settling[f] = (None, None, time.monotonic(), True)
+
+    try:
+        while True:
+            timeout = min(1.0, settle_seconds / 2) if settling else None
+            now = time.monotonic()
+            for f, closed in watcher.changed(timeout):
+                if media_kind(f, media_type) is not None:
+                    settling[f] = (None, None, now, closed)
+
+            now = time.monotonic()
+            for f, (size, mtime, changed_at, closed) in list(settling.items()):
+                try:
+                    stat = f.stat()
+                except OSError:
+                    # Moved away or deleted before it settled
+                    del settling[f]
+                    continue
+                if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                    settling[f] = (stat.st_size, stat.st_mtime_ns, now, closed)
+                elif now - changed_at >= (
+                    settle_seconds if closed else unclosed_settle
+                ):
+                    with lock:
+                        busy = f in in_flight
+                    if busy:
+                        # Rewritten while its last version converts; kept
+                        # settling until that job is done, then redone
+                        continue
+                    del settling[f]
+                    submit(f)
+            scheduler.forget_finished()
+    except KeyboardInterrupt:
+        print("Stopping; waiting for running conversions to finish")
+    finally:
+        watcher.close()
+        scheduler.close()
+        manifest.close()